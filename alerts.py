@@ -0,0 +1,239 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import schema
+
+""" Default incubation limits as (minimum, maximum) """
+TEMPERATURE_RANGE = (35.5, 38.5)
+HUMIDITY_RANGE = (40.0, 70.0)
+
+""" Default maximum rates of change, per minute """
+MAX_TEMPERATURE_RATE = 2.0
+MAX_HUMIDITY_RATE = 15.0
+
+""" Changes are measured over at least this many seconds, so sensor noise between close readings is not a trend """
+RATE_WINDOW = 60
+
+""" Seconds without a reading after which an incubator's sensor is reported stale """
+STALE_AFTER = 300
+
+""" Alert rules, one bit each in an incubator's active-alert mask """
+TEMPERATURE_OUT_OF_RANGE = 1
+HUMIDITY_OUT_OF_RANGE = 2
+TEMPERATURE_RATE = 4
+HUMIDITY_RATE = 8
+STALE_SENSOR = 16
+
+RULE_NAMES = {
+    TEMPERATURE_OUT_OF_RANGE: 'temperature_out_of_range',
+    HUMIDITY_OUT_OF_RANGE: 'humidity_out_of_range',
+    TEMPERATURE_RATE: 'temperature_rate',
+    HUMIDITY_RATE: 'humidity_rate',
+    STALE_SENSOR: 'stale_sensor',
+}
+
+
+""" AlertEngine for checking readings against incubation limits as they are written """
+class AlertEngine:
+    def __init__(self, temperature_range=TEMPERATURE_RANGE, humidity_range=HUMIDITY_RANGE,
+                 max_temperature_rate=MAX_TEMPERATURE_RATE, max_humidity_rate=MAX_HUMIDITY_RATE,
+                 rate_window=RATE_WINDOW, stale_after=STALE_AFTER, max_alerts=1000):
+        """
+        Initializes a new alert engine with no incubators seen yet.
+
+        Readings are checked a batch at a time with NumPy. Per incubator the engine keeps only
+        its last timestamp, temperature and humidity and a mask of the alerts that are active,
+        in flat arrays, so no history is re-read. An alert is raised when a rule starts being
+        broken and not again until the incubator has recovered.
+
+        Parameters:
+            temperature_range (tuple): The allowed (minimum, maximum) temperature in °C.
+            humidity_range (tuple): The allowed (minimum, maximum) humidity in %.
+            max_temperature_rate (float): The largest allowed temperature change in °C per minute.
+            max_humidity_rate (float): The largest allowed humidity change in % per minute.
+            rate_window (int): Changes are measured over at least this many seconds.
+            stale_after (int): Seconds without readings before a sensor is reported stale.
+            max_alerts (int): How many recent alerts are kept. Defaults to 1000.
+
+        Returns:
+            None
+        """
+        self.temperature_range = temperature_range
+        self.humidity_range = humidity_range
+        self.max_temperature_rate = max_temperature_rate
+        self.max_humidity_rate = max_humidity_rate
+        self.rate_window = rate_window
+        self.stale_after = stale_after
+        self.readings_checked = 0
+        self.alerts = deque(maxlen=max_alerts)
+        self._slots = {}
+        self._usernames = []
+        self._last_timestamp = np.full(64, -1, dtype=np.int64)
+        self._last_temperature = np.zeros(64)
+        self._last_humidity = np.zeros(64)
+        self._active = np.zeros(64, dtype=np.uint8)
+        self._lock = threading.Lock()
+
+    def _slot_indices(self, usernames):
+        unique, inverse = np.unique(np.asarray(usernames, dtype=object), return_inverse=True)
+        slots = np.empty(len(unique), dtype=np.int64)
+        for i, username in enumerate(unique):
+            slot = self._slots.get(username)
+            if slot is None:
+                slot = self._slots[username] = len(self._usernames)
+                self._usernames.append(username)
+            slots[i] = slot
+        if len(self._usernames) > len(self._active):
+            size = max(len(self._usernames), 2 * len(self._active))
+            grow = size - len(self._active)
+            self._last_timestamp = np.concatenate([self._last_timestamp, np.full(grow, -1, dtype=np.int64)])
+            self._last_temperature = np.concatenate([self._last_temperature, np.zeros(grow)])
+            self._last_humidity = np.concatenate([self._last_humidity, np.zeros(grow)])
+            self._active = np.concatenate([self._active, np.zeros(grow, dtype=np.uint8)])
+        return slots[inverse]
+
+    def _raise(self, username, rule, timestamp, value):
+        if rule == STALE_SENSOR:
+            message = f"No readings for {int(value)} seconds."
+        elif rule == TEMPERATURE_OUT_OF_RANGE:
+            message = f"Temperature {value:.2f} °C is outside {self.temperature_range[0]}–{self.temperature_range[1]} °C."
+        elif rule == HUMIDITY_OUT_OF_RANGE:
+            message = f"Humidity {value:.2f}% is outside {self.humidity_range[0]}–{self.humidity_range[1]}%."
+        elif rule == TEMPERATURE_RATE:
+            message = f"Temperature is changing by {value:.2f} °C per minute."
+        else:
+            message = f"Humidity is changing by {value:.2f}% per minute."
+        alert = {'username': username, 'rule': RULE_NAMES[rule], 'timestamp': int(timestamp),
+                 'time': schema.format_timestamp(timestamp), 'message': message}
+        self.alerts.append(alert)
+        return alert
+
+    def process(self, rows, now=None):
+        """
+        Checks a batch of new readings against the out-of-range and rate-of-change rules.
+
+        Readings older than an incubator's last one arrived out of order and are skipped, so
+        its state only moves forward. Readings more than `stale_after` seconds old, such as
+        imported history or a device's backlog, are backfill: they become the incubator's last
+        reading but raise no alerts, and leave it counted as silent.
+
+        Parameters:
+            rows (list): (username, timestamp, temperature, humidity) tuples, as passed to
+                `IngestionWriter` listeners.
+            now (int): The current time in epoch seconds. Defaults to the clock.
+
+        Returns:
+            list: The alerts raised by this batch, oldest first, as dicts with 'username',
+            'rule', 'timestamp', 'time' and 'message' keys.
+        """
+        if not rows:
+            return []
+        now = int(time.time()) if now is None else now
+        usernames, timestamps, temperatures, humidities = zip(*rows)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        temperatures = np.asarray(temperatures, dtype=np.float64)
+        humidities = np.asarray(humidities, dtype=np.float64)
+        with self._lock:
+            slots = self._slot_indices(usernames)
+            current = timestamps >= self._last_timestamp[slots]
+            if not current.all():
+                slots, timestamps = slots[current], timestamps[current]
+                temperatures, humidities = temperatures[current], humidities[current]
+                if not len(slots):
+                    return []
+            # Group each incubator's readings together, oldest first, so every reading can be
+            # compared with the one before it: in the batch, or from the saved state.
+            order = np.lexsort((timestamps, slots))
+            slots, timestamps = slots[order], timestamps[order]
+            temperatures, humidities = temperatures[order], humidities[order]
+            first = np.ones(len(slots), dtype=bool)
+            first[1:] = slots[1:] != slots[:-1]
+            last = np.ones(len(slots), dtype=bool)
+            last[:-1] = first[1:]
+
+            previous_timestamp = np.roll(timestamps, 1)
+            previous_temperature = np.roll(temperatures, 1)
+            previous_humidity = np.roll(humidities, 1)
+            previous_timestamp[first] = self._last_timestamp[slots[first]]
+            previous_temperature[first] = self._last_temperature[slots[first]]
+            previous_humidity[first] = self._last_humidity[slots[first]]
+
+            elapsed = np.maximum(timestamps - previous_timestamp, self.rate_window)
+            has_previous = previous_timestamp >= 0
+            temperature_rate = np.abs(temperatures - previous_temperature) * 60 / elapsed
+            humidity_rate = np.abs(humidities - previous_humidity) * 60 / elapsed
+
+            broken = np.zeros(len(slots), dtype=np.uint8)
+            broken |= ((temperatures < self.temperature_range[0]) |
+                       (temperatures > self.temperature_range[1])).astype(np.uint8) * TEMPERATURE_OUT_OF_RANGE
+            broken |= ((humidities < self.humidity_range[0]) |
+                       (humidities > self.humidity_range[1])).astype(np.uint8) * HUMIDITY_OUT_OF_RANGE
+            broken |= (has_previous & (temperature_rate > self.max_temperature_rate)).astype(np.uint8) * TEMPERATURE_RATE
+            broken |= (has_previous & (humidity_rate > self.max_humidity_rate)).astype(np.uint8) * HUMIDITY_RATE
+
+            # Backfilled readings raise nothing and leave the incubator silent, so the first live
+            # reading after them reports whatever it still breaks. A live reading clears a stale
+            # sensor alert.
+            live = timestamps >= now - self.stale_after
+            state = np.where(live, broken, np.uint8(STALE_SENSOR))
+            previous_broken = np.roll(state, 1)
+            previous_broken[first] = self._active[slots[first]]
+            started = np.where(live, broken & ~(previous_broken & ~np.uint8(STALE_SENSOR)), np.uint8(0))
+
+            raised = []
+            values = {TEMPERATURE_OUT_OF_RANGE: temperatures, HUMIDITY_OUT_OF_RANGE: humidities,
+                      TEMPERATURE_RATE: temperature_rate, HUMIDITY_RATE: humidity_rate}
+            started_rows = np.flatnonzero(started)
+            for i in started_rows[np.argsort(timestamps[started_rows], kind='stable')]:
+                for rule, value in values.items():
+                    if started[i] & rule:
+                        raised.append(self._raise(self._usernames[slots[i]], rule, timestamps[i], value[i]))
+
+            self._last_timestamp[slots[last]] = timestamps[last]
+            self._last_temperature[slots[last]] = temperatures[last]
+            self._last_humidity[slots[last]] = humidities[last]
+            self._active[slots[last]] = state[last]
+            self.readings_checked += len(slots)
+        return raised
+
+    def check_stale(self, now=None):
+        """
+        Raises a stale sensor alert for every incubator that stopped reporting.
+
+        Parameters:
+            now (int): The current time in epoch seconds. Defaults to the clock.
+
+        Returns:
+            list: The alerts raised, see `process`.
+        """
+        now = int(time.time()) if now is None else now
+        with self._lock:
+            count = len(self._usernames)
+            silent = now - self._last_timestamp[:count]
+            stale = ((self._last_timestamp[:count] >= 0) & (silent > self.stale_after) &
+                     (self._active[:count] & STALE_SENSOR == 0))
+            raised = [self._raise(self._usernames[slot], STALE_SENSOR, now, silent[slot])
+                      for slot in np.flatnonzero(stale)]
+            self._active[:count][stale] |= STALE_SENSOR
+        return raised
+
+    def recent(self, username=None, limit=20):
+        """
+        Returns the most recent alerts.
+
+        Parameters:
+            username (str): Only return this incubator's alerts. Defaults to all incubators.
+            limit (int): The maximum number of alerts. Defaults to 20.
+
+        Returns:
+            list: The alerts, newest first, see `process`.
+        """
+        with self._lock:
+            alerts = list(self.alerts)
+        alerts.reverse()
+        if username is not None:
+            alerts = [alert for alert in alerts if alert['username'] == username]
+        return alerts[:limit]
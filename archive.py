@@ -0,0 +1,245 @@
+"""
+The archive tier for old incubator readings.
+
+Readings older than a configurable age are moved out of SQLite into one Arrow IPC file
+per UTC day, e.g. `archive/readings-2024-01-01.arrow`. Arrow IPC files are read through a
+memory map, so a history query only pages in the columns and days it touches, and the
+hot `incubator_readings` table stays small. The rollup tables are left alone, so long
+ranges still draw from them.
+
+Run `python archive.py [--db users.db] [--dir archive] [--max-age-days 30]` to archive.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import schema
+
+""" Directory the dashboard reads archived readings from """
+DEFAULT_ARCHIVE_DIR = 'archive'
+
+""" Readings older than this many days are archived by default """
+DEFAULT_MAX_AGE_DAYS = 30
+
+DAY_SECONDS = 86400
+
+FILE_PREFIX = 'readings-'
+FILE_SUFFIX = '.arrow'
+
+ARCHIVE_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('username', pa.string()),
+    ('timestamp', pa.int64()),
+    ('temperature', pa.float64()),
+    ('humidity', pa.float64()),
+])
+
+OLDEST_READING_SQL = 'SELECT MIN(timestamp) FROM incubator_readings WHERE timestamp < ?'
+
+SELECT_DAY_SQL = '''SELECT id, username, timestamp, temperature, humidity FROM incubator_readings
+                    WHERE timestamp >= ? AND timestamp < ? ORDER BY id'''
+
+# Both delete only up to the highest archived id: a reading that arrives for the day after it
+# was read stays in the database until the next run archives it.
+DELETE_DAY_SQL = 'DELETE FROM incubator_readings WHERE timestamp >= ? AND timestamp < ? AND id <= ?'
+
+DELETE_DAY_BATCH_SQL = '''DELETE FROM incubator_readings WHERE id IN (
+                              SELECT id FROM incubator_readings
+                              WHERE timestamp >= ? AND timestamp < ? AND id <= ? LIMIT ?
+                          )'''
+
+
+def day_path(archive_dir, day):
+    """
+    Returns the file holding the archived readings of one day.
+
+    Parameters:
+        archive_dir (str): The archive directory.
+        day (int): The start of the UTC day in epoch seconds.
+
+    Returns:
+        str: The path of the day's Arrow IPC file.
+    """
+    return os.path.join(archive_dir, f'{FILE_PREFIX}{time.strftime("%Y-%m-%d", time.gmtime(day))}{FILE_SUFFIX}')
+
+
+def _read_file(path, columns=None):
+    with pa.memory_map(path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.select(columns) if columns else table
+
+
+def _write_day(archive_dir, day, table):
+    path = day_path(archive_dir, day)
+    if os.path.exists(path):
+        # Readings that arrived late for an archived day are merged into its file. Rows are
+        # unique by id, in case an earlier run wrote the file but could not delete the rows.
+        table = pa.concat_tables([_read_file(path), table])
+        _, first = np.unique(table['id'].to_numpy(), return_index=True)
+        table = table.take(pa.array(first))
+    tmp_path = path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, ARCHIVE_SCHEMA) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def archive_readings(conn, archive_dir=DEFAULT_ARCHIVE_DIR, max_age_days=DEFAULT_MAX_AGE_DAYS, now=None,
+                     batch_size=None, pause=0.0):
+    """
+    Moves readings older than `max_age_days` from the database into the archive.
+
+    Only whole UTC days are moved. Each day is written to its file before its rows are
+    deleted, one day per transaction or `batch_size` rows per transaction, so an
+    interrupted run loses nothing and can be repeated.
+
+    Parameters:
+        conn (sqlite3.Connection): A connection to the database, outside a transaction.
+        archive_dir (str): The archive directory. Created if missing.
+        max_age_days (float): Readings older than this many days are archived.
+        now (int): The current time in epoch seconds. Defaults to the clock.
+        batch_size (int): Delete an archived day this many rows at a time, so a writer
+            waits for one small transaction at most. Defaults to the whole day at once.
+        pause (float): Seconds to sleep between batches, leaving the database to writers.
+
+    Returns:
+        int: The number of readings archived.
+    """
+    now = int(time.time()) if now is None else now
+    cutoff = int(now - max_age_days * DAY_SECONDS) // DAY_SECONDS * DAY_SECONDS
+    oldest = conn.execute(OLDEST_READING_SQL, (cutoff,)).fetchone()[0]
+    if oldest is None:
+        return 0
+    os.makedirs(archive_dir, exist_ok=True)
+    moved = 0
+    for day in range(oldest // DAY_SECONDS * DAY_SECONDS, cutoff, DAY_SECONDS):
+        rows = conn.execute(SELECT_DAY_SQL, (day, day + DAY_SECONDS)).fetchall()
+        if not rows:
+            continue
+        table = pa.Table.from_arrays([pa.array(column, type=field.type)
+                                      for column, field in zip(zip(*rows), ARCHIVE_SCHEMA)],
+                                     schema=ARCHIVE_SCHEMA)
+        _write_day(archive_dir, day, table)
+        last_id = rows[-1][0]
+        if batch_size is None:
+            with conn:
+                conn.execute(DELETE_DAY_SQL, (day, day + DAY_SECONDS, last_id))
+        else:
+            deleted = batch_size
+            while deleted == batch_size:
+                with conn:
+                    deleted = conn.execute(DELETE_DAY_BATCH_SQL, (day, day + DAY_SECONDS, last_id, batch_size)).rowcount
+                time.sleep(pause)
+        moved += len(rows)
+    logging.info(f"Archived {moved} incubator readings older than {max_age_days} days to {archive_dir}.")
+    return moved
+
+
+""" ReadingArchive for reading archived readings back through memory maps """
+class ReadingArchive:
+    def __init__(self, archive_dir=DEFAULT_ARCHIVE_DIR):
+        """
+        Initializes a reader for an archive directory, which need not exist yet.
+
+        The list of archived days is re-read only when the directory changes, so checking
+        whether a range touches the archive costs a single `stat`.
+
+        Parameters:
+            archive_dir (str): The archive directory. Defaults to `DEFAULT_ARCHIVE_DIR`.
+
+        Returns:
+            None
+        """
+        self.archive_dir = archive_dir
+        self._days = []
+        self._listed_mtime = None
+
+    def days(self):
+        """
+        Returns the archived days.
+
+        Returns:
+            list: The start of each archived UTC day in epoch seconds, oldest first.
+        """
+        try:
+            mtime = os.stat(self.archive_dir).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if mtime != self._listed_mtime:
+            days = []
+            for name in os.listdir(self.archive_dir):
+                if name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX):
+                    days.append(schema.to_epoch(name[len(FILE_PREFIX):-len(FILE_SUFFIX)] + ' 00:00:00'))
+            self._days = sorted(days)
+            self._listed_mtime = mtime
+        return self._days
+
+    def archived_until(self):
+        """
+        Returns the end of the newest archived day.
+
+        Returns:
+            int: Epoch seconds before which readings may be archived, or None for an empty archive.
+        """
+        days = self.days()
+        return days[-1] + DAY_SECONDS if days else None
+
+    def read_range(self, start, end, columns=None, username=None):
+        """
+        Reads the archived readings with a timestamp between `start` and `end`, inclusive.
+
+        Only the files of the days in the range are opened, and only the requested columns
+        of the matching rows are converted to pandas.
+
+        Parameters:
+            start (int): The earliest timestamp in epoch seconds.
+            end (int): The latest timestamp in epoch seconds.
+            columns (list): The columns to read. Defaults to all of them.
+            username (str): Only read this user's readings. Defaults to all users.
+
+        Returns:
+            pandas.DataFrame: The matching readings, ordered by id.
+        """
+        columns = list(columns or ARCHIVE_SCHEMA.names)
+        read_columns = columns + [name for name in ('timestamp', 'username') if name not in columns]
+        tables = []
+        for day in self.days():
+            if day + DAY_SECONDS <= start or day > end:
+                continue
+            table = _read_file(day_path(self.archive_dir, day), read_columns)
+            if day < start or day + DAY_SECONDS - 1 > end:
+                timestamps = table['timestamp']
+                table = table.filter(pc.and_(pc.greater_equal(timestamps, start), pc.less_equal(timestamps, end)))
+            if username is not None:
+                table = table.filter(pc.equal(table['username'], username))
+            tables.append(table.select(columns))
+        if not tables:
+            return pd.DataFrame({name: pd.Series(dtype=ARCHIVE_SCHEMA.field(name).type.to_pandas_dtype())
+                                 for name in columns})
+        return pa.concat_tables(tables).to_pandas()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move old incubator readings into the archive.')
+    parser.add_argument('--db', default='users.db', help='the database to archive from')
+    parser.add_argument('--dir', default=DEFAULT_ARCHIVE_DIR, help='the archive directory')
+    parser.add_argument('--max-age-days', type=float, default=DEFAULT_MAX_AGE_DAYS,
+                        help='archive readings older than this many days')
+    parser.add_argument('--vacuum', action='store_true', help='shrink the database file afterwards')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    connection = sqlite3.connect(args.db)
+    schema.ensure_schema(connection)
+    count = archive_readings(connection, args.dir, args.max_age_days)
+    if args.vacuum and count:
+        connection.execute('VACUUM')
+    connection.close()
+    print(f"Archived {count} readings to {args.dir}.")
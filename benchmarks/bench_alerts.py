@@ -0,0 +1,41 @@
+"""
+Alert engine benchmark: readings per second checked in writer-sized batches.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_alerts --readings 1000000 --incubators 1000
+"""
+import argparse
+import time
+
+from alerts import AlertEngine
+from simulator import ReadingSimulator
+
+""" The rate the alert engine must keep up with """
+TARGET_RATE = 10_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--readings', type=int, default=1_000_000)
+    parser.add_argument('--incubators', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    simulator = ReadingSimulator(incubators=args.incubators, seed=0)
+    batches = [simulator.generate_batch(args.batch_size) for _ in range(args.readings // args.batch_size)]
+    # Spread the batches over time, one second per batch, so the rate rules see real gaps.
+    batches = [[(u, t + i, temp, hum) for u, t, temp, hum in batch] for i, batch in enumerate(batches)]
+
+    engine = AlertEngine()
+    start = time.perf_counter()
+    for batch in batches:
+        engine.process(batch)
+    elapsed = time.perf_counter() - start
+    rate = engine.readings_checked / elapsed
+    print(f"AlertEngine: {rate:12,.0f} readings/sec over {args.incubators:,} incubators "
+          f"({len(engine.alerts)} alerts, target {TARGET_RATE:,})")
+
+
+if __name__ == '__main__':
+    main()
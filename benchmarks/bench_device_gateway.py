@@ -0,0 +1,128 @@
+"""
+Device gateway load test: thousands of fake devices posting batches over keep-alive connections.
+
+Every device opens its own connection, then posts `--batches` batches of `--batch-size`
+readings, honouring Retry-After when the gateway is overloaded. Without --port an
+ingestion writer on a temporary database and a gateway are started in this process.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_device_gateway --devices 2000 --batches 10
+    python -m benchmarks.bench_device_gateway --port 8081 --token "$EMM_DEVICE_TOKEN"
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import tempfile
+import time
+
+from device_gateway import INGEST_PATH, DeviceGateway
+from ingestion import IngestionWriter
+
+
+async def fake_device(number, host, port, token, batches, batch_size, results, connected):
+    """
+    Connects as one device, waits until every device is connected, then posts its batches.
+
+    Returns:
+        None
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    connected.append(number)
+    while len(connected) < results['devices']:
+        await asyncio.sleep(0.05)
+    authorization = f'Authorization: Bearer {token}\r\n' if token else ''
+    try:
+        for batch in range(batches):
+            timestamp = int(time.time())
+            body = json.dumps({'username': f'device{number}', 'readings': [
+                {'timestamp': timestamp + i, 'temperature': 37.0, 'humidity': 50.0} for i in range(batch_size)
+            ]}).encode()
+            request = (f'POST {INGEST_PATH} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                       f'{authorization}Content-Length: {len(body)}\r\n\r\n').encode() + body
+            while True:
+                start = time.perf_counter()
+                writer.write(request)
+                await writer.drain()
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin-1').split('\r\n')
+                status = int(lines[0].split()[1])
+                headers = dict(line.lower().split(': ', 1) for line in lines[1:] if ': ' in line)
+                await reader.readexactly(int(headers['content-length']))
+                results['latencies'].append(time.perf_counter() - start)
+                if status != 503:
+                    break
+                results['retries'] += 1
+                await asyncio.sleep(float(headers.get('retry-after', 1)))
+            if status == 202:
+                results['acknowledged'] += 1
+            else:
+                results['failed'] += 1
+    finally:
+        writer.close()
+
+
+async def run_devices(args, port):
+    """
+    Runs every fake device at once.
+
+    Returns:
+        tuple: The results and the seconds from the first to the last batch.
+    """
+    results = {'devices': args.devices, 'latencies': [], 'acknowledged': 0, 'failed': 0, 'retries': 0}
+    connected = []
+    tasks = [fake_device(n, args.host, port, args.token, args.batches, args.batch_size, results, connected)
+             for n in range(args.devices)]
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    results['errors'] = sum(isinstance(outcome, Exception) for outcome in outcomes)
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--devices', type=int, default=2000)
+    parser.add_argument('--batches', type=int, default=10, help='batches per device')
+    parser.add_argument('--batch-size', type=int, default=10, help='readings per batch')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='an already running gateway to load')
+    parser.add_argument('--token', default=os.environ.get('EMM_DEVICE_TOKEN'))
+    parser.add_argument('--max-queue', type=int, default=10000, help='queue size of the in-process writer')
+    args = parser.parse_args()
+
+    # Every device needs a socket, and an in-process gateway a second one.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, 2 * args.devices + 256)), hard))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = gateway = None
+        port = args.port
+        if not port:
+            writer = IngestionWriter(os.path.join(tmp, 'users.db'), max_queue=args.max_queue)
+            writer.start()
+            gateway = DeviceGateway(writer, 0, args.host, token=args.token)
+            gateway.start()
+            gateway.ready.wait(5)
+            port = gateway.port
+        results, elapsed = asyncio.run(run_devices(args, port))
+        if gateway is not None:
+            gateway.close()
+            writer.stop()
+
+    latencies = sorted(results['latencies'])
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    readings = results['acknowledged'] * args.batch_size
+    print(f"{args.devices:,} devices: {results['acknowledged']:,} batches acknowledged, "
+          f"{results['failed']:,} failed, {results['retries']:,} retried, {results['errors']:,} connection errors")
+    print(f"{results['acknowledged'] / elapsed:10,.0f} batches/sec  {readings / elapsed:10,.0f} readings/sec")
+    print(f"latency p50 {quantiles[49] * 1000:.1f} ms  p99 {quantiles[98] * 1000:.1f} ms")
+    if writer is not None:
+        print(f"written: {writer.rows_written:,} readings")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+Downsampling benchmark: time to reduce a long series to the dashboard's point budget.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_downsampling --points 10000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+import downsampling
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--points', type=int, default=10_000_000)
+    parser.add_argument('--n-out', type=int, default=downsampling.DEFAULT_POINTS)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    x = np.arange(args.points, dtype=np.int64) * 5_000_000_000
+    y = 36.75 + rng.normal(0, 0.3, size=args.points)
+
+    for method in ('lttb', 'minmax'):
+        start = time.perf_counter()
+        indices = downsampling.downsample(x, y, args.n_out, method)
+        elapsed = time.perf_counter() - start
+        print(f"{method:7s} {args.points:>12,} -> {len(indices):>6,} points in {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Throughput benchmark: `data_generator.save_to_database` versus `ingestion.IngestionWriter`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ingestion --rows 20000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import data_generator
+from ingestion import IngestionWriter
+
+
+def bench_save_to_database(db_name, rows):
+    """
+    Writes `rows` readings one at a time with `save_to_database`.
+
+    Returns:
+        float: Rows written per second.
+    """
+    data = data_generator.generate_data()
+    start = time.perf_counter()
+    for _ in range(rows):
+        data_generator.save_to_database(data, 'bench_user', db_name)
+    return rows / (time.perf_counter() - start)
+
+
+def bench_ingestion_writer(db_name, rows, batch_size):
+    """
+    Writes `rows` readings through an `IngestionWriter` and waits until they are committed.
+
+    Returns:
+        float: Rows written per second.
+    """
+    data = data_generator.generate_data()
+    writer = IngestionWriter(db_name, batch_size=batch_size)
+    writer.start()
+    start = time.perf_counter()
+    for _ in range(rows):
+        writer.submit(data, 'bench_user')
+    writer.stop()
+    return rows / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=20000, help='readings written through the IngestionWriter')
+    parser.add_argument('--legacy-rows', type=int, default=2000, help='readings written through save_to_database')
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = bench_save_to_database(os.path.join(tmp, 'legacy.db'), args.legacy_rows)
+        batched = bench_ingestion_writer(os.path.join(tmp, 'batched.db'), args.rows, args.batch_size)
+
+    print(f"save_to_database: {legacy:12,.0f} rows/sec")
+    print(f"IngestionWriter:  {batched:12,.0f} rows/sec ({batched / legacy:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
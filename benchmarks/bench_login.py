@@ -0,0 +1,111 @@
+"""
+Login latency benchmark: connection-per-call lookups versus the pooled, cached UserManagement.
+
+Passwords are hashed with a token scrypt cost, so the numbers show the lookup cost; see
+bench_passwords for the hashing itself.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_login --users 1000 --logins 20000 --threads 8
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from passwords import PasswordHasher
+
+""" A token scrypt cost, so hashing does not hide the lookup cost """
+HASHER = PasswordHasher(n=16)
+
+
+def legacy_login(db_name, username, password):
+    """
+    The login path before pooling: a new connection and a fresh lookup for every call.
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        conn.execute('PRAGMA foreign_keys = ON;')
+        user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        if user:
+            return HASHER.verify(password, user[2])[0]
+        return False
+    finally:
+        conn.close()
+
+
+def seed_users(db_name, count):
+    """
+    Creates `count` users named user0..userN with password 'password'.
+    """
+    conn = sqlite3.connect(db_name)
+    conn.execute('CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                 'username TEXT UNIQUE NOT NULL, password TEXT NOT NULL)')
+    hashed_password = HASHER.hash('password')
+    rows = [(f'user{i}', hashed_password) for i in range(count)]
+    with conn:
+        conn.executemany('INSERT INTO users (username, password) VALUES (?, ?)', rows)
+    conn.close()
+
+
+def measure(login, users, logins, threads):
+    """
+    Runs `logins` logins spread over `threads` threads.
+
+    Returns:
+        tuple: The p50 and p99 latency in milliseconds.
+    """
+    latencies = []
+    lock = threading.Lock()
+    per_thread = logins // threads
+
+    def worker(offset):
+        local = []
+        for i in range(per_thread):
+            username = f'user{(offset + i * 7919) % users}'
+            start = time.perf_counter()
+            assert login(username, 'password')
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    quantiles = statistics.quantiles(latencies, n=100)
+    return quantiles[49] * 1000, quantiles[98] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--logins', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, 'users.db')
+        seed_users(db_name, args.users)
+        # main creates its tables relative to the working directory on import.
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            from main import UserManagement
+            user_manager = UserManagement(db_name, pool_size=args.threads, hasher=HASHER)
+            before = measure(lambda u, p: legacy_login(db_name, u, p), args.users, args.logins, args.threads)
+            after = measure(user_manager.login, args.users, args.logins, args.threads)
+            user_manager.close()
+        finally:
+            os.chdir(cwd)
+
+    print(f"connection per call: p50 {before[0]:.3f} ms  p99 {before[1]:.3f} ms")
+    print(f"pooled + cached:     p50 {after[0]:.3f} ms  p99 {after[1]:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
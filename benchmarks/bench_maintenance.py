@@ -0,0 +1,114 @@
+"""
+Maintenance benchmark: writer latency while expired readings are deleted, at once against in batches.
+
+Fills a database with `--days` of readings every `--interval` seconds for each of
+`--incubators` incubators, copies it, then keeps a writer committing a batch of readings
+every 100 ms, like the ingestion writer, while everything older than `--retention-days`
+is removed: once with a single DELETE and VACUUM, once with a `MaintenanceScheduler` pass.
+Writer commit latency shows how long ingestion was held up.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_maintenance --incubators 100 --days 7 --retention-days 2
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import maintenance
+import rollups
+import schema
+from maintenance import MaintenanceScheduler
+
+
+def build(db_name, incubators, days, interval, now):
+    conn = sqlite3.connect(db_name)
+    schema.ensure_schema(conn)
+    conn.execute('PRAGMA journal_mode = WAL')
+    rng = np.random.default_rng(0)
+    per_day = 86400 // interval
+    for day in range(days):
+        timestamps = now - (days - day) * 86400 + np.arange(per_day) * interval
+        rows = [(f'incubator{number}', int(timestamp), round(36.75 + rng.normal(0, 0.3), 2), 50.0)
+                for timestamp in timestamps for number in range(incubators)]
+        with conn:
+            conn.executemany(schema.INSERT_READING_SQL, rows)
+            rollups.update_rollups(conn, rows)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+
+
+def single_delete(db_name, retention_days, now):
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.execute('DELETE FROM incubator_readings WHERE timestamp < ?', (now - retention_days * 86400,))
+    conn.execute('VACUUM')
+    conn.close()
+
+
+def write_during(db_name, task, incubators):
+    latencies, done = [], threading.Event()
+
+    def writer():
+        conn = sqlite3.connect(db_name, timeout=60)
+        while not done.is_set():
+            now = int(time.time())
+            rows = [(f'incubator{number}', now, 37.0, 50.0) for number in range(incubators)]
+            start = time.perf_counter()
+            with conn:
+                conn.executemany(schema.INSERT_READING_SQL, rows)
+                rollups.update_rollups(conn, rows)
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.1)
+        conn.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    start = time.perf_counter()
+    task()
+    seconds = time.perf_counter() - start
+    done.set()
+    thread.join()
+    return seconds, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--incubators', type=int, default=100)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--interval', type=int, default=60, help='seconds between readings')
+    parser.add_argument('--retention-days', type=float, default=2.0)
+    parser.add_argument('--batch-size', type=int, default=maintenance.BATCH_SIZE)
+    args = parser.parse_args()
+
+    now = int(time.time())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, 'source.db')
+        build(source, args.incubators, args.days, args.interval, now)
+        readings = args.incubators * args.days * (86400 // args.interval)
+        print(f"{readings:,} readings, {os.path.getsize(source) / 2 ** 20:,.1f} MiB; "
+              f"removing those older than {args.retention_days} days")
+        print(f"{'':18s} {'pass s':>8s} {'MiB after':>10s} {'write p50 ms':>13s} {'write p99 ms':>13s} {'write max ms':>13s}")
+        retention = {'incubator_readings': args.retention_days}
+        for name, task in (('single DELETE', lambda db: single_delete(db, args.retention_days, now)),
+                           ('maintenance pass', lambda db: MaintenanceScheduler(
+                               db, retention, batch_size=args.batch_size).run_pass(now))):
+            db_name = os.path.join(tmp_dir, 'bench.db')
+            shutil.copy(source, db_name)
+            seconds, latencies = write_during(db_name, lambda: task(db_name), args.incubators)
+            quantiles = (statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1
+                         else latencies * 99)
+            print(f"{name:18s} {seconds:8.2f} {os.path.getsize(db_name) / 2 ** 20:10,.1f} {quantiles[49] * 1000:13.1f} "
+                  f"{quantiles[98] * 1000:13.1f} {max(latencies) * 1000:13.1f}")
+            os.remove(db_name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Password hashing benchmark: a login burst against the bounded scrypt pool, next to a cheap route.
+
+`--threads` request threads log in as fast as they can while one thread keeps calling a
+cheap stand-in for another route. Logins beyond the pool's capacity are refused with
+HasherBusy rather than queued, and retried after `retry_after` like a client would, so
+login latency stays bounded and the cheap route's latency stays low.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_passwords --threads 64 --seconds 10 --workers 2
+"""
+import argparse
+import statistics
+import threading
+import time
+
+import passwords
+from passwords import HasherBusy, PasswordHasher
+
+
+def quantiles_ms(samples):
+    quantiles = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+    return quantiles[49] * 1000, quantiles[98] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=64, help='request threads logging in')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--n', type=int, default=passwords.SCRYPT_N, help='scrypt cost')
+    parser.add_argument('--workers', type=int, default=passwords.HASH_WORKERS)
+    parser.add_argument('--max-pending', type=int, default=passwords.MAX_PENDING)
+    args = parser.parse_args()
+
+    hasher = PasswordHasher(n=args.n, workers=args.workers, max_pending=args.max_pending)
+    stored = hasher.hash('password')
+    deadline = time.monotonic() + args.seconds
+    lock = threading.Lock()
+    logins, refused, cheap = [], [0], []
+
+    def login():
+        local, local_refused = [], 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                assert hasher.verify('password', stored)[0]
+                local.append(time.perf_counter() - start)
+            except HasherBusy:
+                local_refused += 1
+                time.sleep(HasherBusy.retry_after)
+        with lock:
+            logins.extend(local)
+            refused[0] += local_refused
+
+    def cheap_route():
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            sum(range(1000))
+            cheap.append(time.perf_counter() - start)
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=login) for _ in range(args.threads)]
+    threads.append(threading.Thread(target=cheap_route))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    hasher.close()
+
+    login_p50, login_p99 = quantiles_ms(logins)
+    cheap_p50, cheap_p99 = quantiles_ms(cheap)
+    print(f"scrypt n={args.n}, {args.workers} workers, {args.max_pending} pending, {args.threads} threads")
+    print(f"logins:      {len(logins) / args.seconds:8.1f}/sec  p50 {login_p50:8.1f} ms  p99 {login_p99:8.1f} ms  "
+          f"({refused[0]:,} refused)")
+    print(f"cheap route: {len(cheap) / args.seconds:8.1f}/sec  p50 {cheap_p50:8.3f} ms  p99 {cheap_p99:8.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Ring buffer benchmark: memory and slicing of a hot window, ring buffers against pandas frames.
+
+Holds `--hours` of readings every `--interval` seconds for each of `--incubators`
+incubators, once as the pandas frames the reading store used to keep (as `pd.read_sql`
+returns them, with a username string per row) and once as `ring_buffer.ReadingRing`s
+filled a minute at a time, then times slicing the last hour and downsampling the window.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ring_buffer --incubators 1000 --hours 24
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import downsampling
+from ring_buffer import ReadingRing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--incubators', type=int, default=1000)
+    parser.add_argument('--hours', type=float, default=24.0)
+    parser.add_argument('--interval', type=int, default=5, help='seconds between readings')
+    args = parser.parse_args()
+
+    count = int(args.hours * 3600 // args.interval)
+    batch = max(1, 60 // args.interval)
+    now = int(time.time())
+    rng = np.random.default_rng(0)
+    timestamps = now - (count - 1 - np.arange(count, dtype=np.int64)) * args.interval
+    readings = args.incubators * count
+    print(f"{args.incubators:,} incubators x {count:,} readings = {readings:,} readings")
+
+    frames, rings = [], []
+    frame_seconds = ring_seconds = 0.0
+    for number in range(args.incubators):
+        username = f'incubator{number}'
+        ids = np.arange(count, dtype=np.int64) * args.incubators + number + 1
+        temperatures = np.round(36.75 + rng.normal(0, 0.3, count), 2)
+        humidities = np.round(50 + rng.normal(0, 2, count), 2)
+
+        start = time.perf_counter()
+        frames.append(pd.DataFrame({'id': ids, 'username': [str(username) for _ in range(count)],
+                                    'timestamp': timestamps, 'temperature': temperatures,
+                                    'humidity': humidities}))
+        frame_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        ring = ReadingRing(username, count)
+        for offset in range(0, count, batch):
+            ring.append(ids[offset:offset + batch], timestamps[offset:offset + batch],
+                        temperatures[offset:offset + batch], humidities[offset:offset + batch])
+        rings.append(ring)
+        ring_seconds += time.perf_counter() - start
+
+    frame_bytes = sum(int(frame.memory_usage(deep=True).sum()) for frame in frames)
+    # Counted like ReadingStore.memory(): the arrays, the ring objects and their usernames.
+    ring_bytes = sum(ring.nbytes + sys.getsizeof(ring) + sys.getsizeof(ring.username) for ring in rings)
+    print(f"{'':16s} {'MiB':>10s} {'bytes/reading':>14s} {'build s':>8s} {'last hour ms':>13s} {'downsample ms':>14s}")
+    for name, windows, total_bytes, fill_seconds in (('pandas frames', frames, frame_bytes, frame_seconds),
+                                                     ('ring buffers', [ring.window() for ring in rings],
+                                                      ring_bytes, ring_seconds)):
+        start = time.perf_counter()
+        for window in windows:
+            if isinstance(window, pd.DataFrame):
+                window[window['timestamp'] >= now - 3600]
+            else:
+                window.between(now - 3600, now)
+        slice_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for window in windows[:100]:
+            downsampling.downsample_frame(window, 'temperature')
+        downsample_ms = (time.perf_counter() - start) * 1000 / min(100, len(windows))
+        print(f"{name:16s} {total_bytes / 2 ** 20:10,.1f} {total_bytes / readings:14.1f} {fill_seconds:8.2f} "
+              f"{slice_ms:13.1f} {downsample_ms:14.2f}")
+    print("build: frames at once, rings a minute at a time; last hour: every incubator; "
+          "downsample: one incubator's window, averaged over up to 100")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+"""
+Benchmark suite: seeds a database of a given size and records the main costs as JSON.
+
+Measures `save_to_database` rows/sec, `UserManagement.login` and `get_random_user`
+latency, `update_graph` time and payload size per graph type and range, the fleet
+overview page with and without its cached summary, and the cold start of `main`. Everything runs in a temporary directory, so `users.db` is not touched.
+
+Run from the repository root, then compare two runs, e.g. before and after a commit:
+
+    python -m benchmarks.bench_suite --users 10000 --readings 10000000 --output before.json
+    python -m benchmarks.bench_suite --users 10000 --readings 10000000 --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from plotly.utils import PlotlyJSONEncoder
+
+import passwords
+import schema
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+""" Readings inserted per transaction while seeding """
+SEED_CHUNK_SIZE = 500_000
+
+COLD_START_CODE = ('import time; start = time.perf_counter(); import main; imported = time.perf_counter(); '
+                   'main.create_app(); print(imported - start, time.perf_counter() - imported)')
+
+
+def seed_users(db_name, count, password='password'):
+    """
+    Creates `count` users named user0, user1, ... sharing one password, hashed once with
+    the default scrypt cost.
+
+    Returns:
+        None
+    """
+    conn = sqlite3.connect(db_name)
+    conn.execute('CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                 'username TEXT UNIQUE NOT NULL, password TEXT NOT NULL)')
+    hashed_password = passwords.get_hasher().hash(password)
+    rows = [(f'user{i}', hashed_password) for i in range(count)]
+    with conn:
+        conn.executemany('INSERT INTO users (username, password) VALUES (?, ?)', rows)
+    conn.close()
+
+
+def seed_readings(db_name, count, users, days, now):
+    """
+    Writes `count` readings spread evenly over the last `days` days, round-robin across
+    the first `users` users, then builds the indexes and rollups with `schema.ensure_schema`.
+
+    Returns:
+        None
+    """
+    conn = sqlite3.connect(db_name)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute(schema.READINGS_TABLE_SQL)
+    rng = np.random.default_rng(0)
+    usernames = np.array([f'user{i}' for i in range(users)], dtype=object)
+    step = days * 86400 / max(count, 1)
+    for offset in range(0, count, SEED_CHUNK_SIZE):
+        n = min(SEED_CHUNK_SIZE, count - offset)
+        positions = np.arange(offset, offset + n)
+        timestamps = (now - days * 86400 + positions * step).astype(np.int64)
+        temperatures = np.round(rng.uniform(36, 37.5, n), 2)
+        humidities = np.round(rng.uniform(45, 55, n), 2)
+        with conn:
+            conn.executemany(schema.INSERT_READING_SQL,
+                             zip(usernames[positions % users], timestamps.tolist(),
+                                 temperatures.tolist(), humidities.tolist()))
+    schema.ensure_schema(conn)
+    conn.close()
+
+
+def latencies(function, calls):
+    """
+    Calls `function` `calls` times.
+
+    Returns:
+        dict: The mean, p50 and p99 latency in milliseconds.
+    """
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        function(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    quantiles = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+    return {'mean_ms': statistics.fmean(samples), 'p50_ms': quantiles[49], 'p99_ms': quantiles[98]}
+
+
+def bench_save_to_database(rows):
+    """
+    Writes `rows` readings one at a time with `data_generator.save_to_database`, into a
+    database of their own so the seeded one is left as it is.
+
+    Returns:
+        dict: Rows written per second.
+    """
+    import data_generator
+
+    data = data_generator.generate_data()
+    start = time.perf_counter()
+    for _ in range(rows):
+        data_generator.save_to_database(data, 'user0', 'save_to_database.db')
+    return {'rows_per_sec': rows / (time.perf_counter() - start)}
+
+
+def bench_cold_start(runs):
+    """
+    Starts a fresh interpreter that imports `main` and creates the app against the seeded
+    database, `runs` times.
+
+    Returns:
+        dict: The median seconds spent importing `main`, in `create_app`, and until the
+        process exited.
+    """
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    imports, creates, processes = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', COLD_START_CODE], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        processes.append(time.perf_counter() - start)
+        imported, created = output.split()[-2:]
+        imports.append(float(imported))
+        creates.append(float(created))
+    return {'import_s': statistics.median(imports), 'create_app_s': statistics.median(creates),
+            'process_s': statistics.median(processes)}
+
+
+def bench_update_graph(main, username, calls):
+    """
+    Builds each graph type for the latest readings and for the last 30 days, with the figure
+    cache cleared before every build, then once more from the cache. The reading store is
+    loaded first, so its one-off initial read is not counted.
+
+    Returns:
+        dict: Per view, the build latencies, the cached latency and the JSON payload in bytes.
+    """
+    results = {}
+    main.reading_store.load()
+    with main.app.test_request_context():
+        main.session['username'] = username
+        for graph_type in ('bar', 'line'):
+            for name, time_range in (('latest', 0), ('30d', 30 * 86400)):
+                def build(i):
+                    main.figure_cache.invalidate()
+                    return main.update_graph(graph_type, time_range)
+                result = latencies(build, calls)
+                figure, _ = main.update_graph(graph_type, time_range)
+                result['cached_ms'] = latencies(lambda i: main.update_graph(graph_type, time_range), calls)['p50_ms']
+                result['payload_bytes'] = len(json.dumps(figure, cls=PlotlyJSONEncoder))
+                results[f'{graph_type}_{name}'] = result
+    return results
+
+
+def bench_fleet(main, username, calls):
+    """
+    Renders the fleet overview page, querying every incubator afresh for each call, then
+    from the cached summary.
+
+    Returns:
+        dict: The render latencies, the cached latency, the number of incubators and the page size in bytes.
+    """
+    client = main.app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = username
+
+    def render(i):
+        main.fleet_overview._summary = None
+        return client.get('/fleet')
+
+    result = latencies(render, calls)
+    result['cached_ms'] = latencies(lambda i: client.get('/fleet'), calls)['p50_ms']
+    result['incubators'] = len(main.fleet_overview.summary()['incubators'])
+    result['page_bytes'] = len(client.get('/fleet').data)
+    return result
+
+
+def run(args):
+    """
+    Seeds a temporary database and runs every benchmark against it.
+
+    Returns:
+        dict: The results, with the configuration and environment they were measured in.
+    """
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # main opens users.db relative to the working directory.
+        os.chdir(tmp)
+        try:
+            start = time.perf_counter()
+            seed_users('users.db', args.users)
+            seed_readings('users.db', args.readings, min(args.users, args.incubators), args.days, int(time.time()))
+            seed_seconds = time.perf_counter() - start
+            print(f"Seeded {args.users:,} users and {args.readings:,} readings in {seed_seconds:.1f} s", file=sys.stderr)
+
+            results['cold_start'] = bench_cold_start(args.cold_starts)
+            results['save_to_database'] = bench_save_to_database(args.save_rows)
+
+            import data_generator
+            import main
+            main.create_app(start_workers=False)
+            results['get_random_user'] = latencies(lambda i: data_generator.get_random_user(), args.calls)
+            user_manager = main.UserManagement('users.db')
+            results['login'] = latencies(lambda i: user_manager.login(f'user{(i * 7919) % args.users}', 'password'),
+                                         args.login_calls)
+            user_manager.close()
+            results['update_graph'] = bench_update_graph(main, 'user0', args.graph_calls)
+            results['fleet'] = bench_fleet(main, 'user0', args.graph_calls)
+        finally:
+            os.chdir(cwd)
+
+    return {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': vars(args),
+        'seed_seconds': seed_seconds,
+        'results': results,
+    }
+
+
+def git_commit():
+    """
+    Returns the commit the suite runs at, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    """
+    Flattens nested results into {'login.p50_ms': 0.01, ...}.
+    """
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compare(before, after):
+    """
+    Prints every result next to the one from an earlier run, with the relative change.
+
+    Returns:
+        None
+    """
+    old, new = flatten(before['results']), flatten(after['results'])
+    print(f"{'':44s} {before.get('commit') or 'before':>12s} {after.get('commit') or 'after':>12s}   change")
+    for name, value in new.items():
+        if name in old and old[name]:
+            print(f"{name:44s} {old[name]:12.4g} {value:12.4g} {(value - old[name]) / old[name]:+8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--readings', type=int, default=1_000_000)
+    parser.add_argument('--incubators', type=int, default=100, help='users the readings are spread over')
+    parser.add_argument('--days', type=int, default=60, help='days the readings are spread over')
+    parser.add_argument('--calls', type=int, default=5000, help='calls per latency benchmark')
+    parser.add_argument('--login-calls', type=int, default=200, help='logins, each costing one scrypt hash')
+    parser.add_argument('--graph-calls', type=int, default=20, help='builds per graph view')
+    parser.add_argument('--save-rows', type=int, default=2000, help='readings written through save_to_database')
+    parser.add_argument('--cold-starts', type=int, default=5)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='an earlier results file to compare with')
+    args = parser.parse_args()
+    output, baseline = args.output, args.compare
+    del args.output, args.compare
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    if baseline:
+        with open(baseline) as f:
+            compare(json.load(f), report)
+    elif not output:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
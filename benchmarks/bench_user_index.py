@@ -0,0 +1,79 @@
+"""
+Random user selection benchmark: ORDER BY RANDOM() versus the in-memory UserIndex.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_user_index --users 1000000
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from user_index import UserIndex
+
+
+def seed_users(db_name, count):
+    """
+    Creates `count` users named user0..userN.
+    """
+    conn = sqlite3.connect(db_name)
+    conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                 'username TEXT UNIQUE NOT NULL, password TEXT NOT NULL)')
+    with conn:
+        conn.executemany('INSERT INTO users (username, password) VALUES (?, ?)',
+                         ((f'user{i}', 'hash:salt') for i in range(count)))
+    conn.close()
+
+
+def order_by_random(conn):
+    """
+    The selection used before the index.
+    """
+    return conn.execute('SELECT username FROM users ORDER BY RANDOM() LIMIT 1').fetchone()[0]
+
+
+def timed(pick, repeat):
+    """
+    Returns the median latency of `pick` in milliseconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pick()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20, help='ORDER BY RANDOM() samples')
+    parser.add_argument('--picks', type=int, default=100_000, help='UserIndex samples')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, 'users.db')
+        seed_users(db_name, args.users)
+
+        conn = sqlite3.connect(db_name)
+        legacy = timed(lambda: order_by_random(conn), args.repeat)
+        conn.close()
+
+        index = UserIndex(db_name)
+        start = time.perf_counter()
+        index.refresh()
+        build = (time.perf_counter() - start) * 1000
+        indexed = timed(index.random_user, args.picks)
+        index.close()
+
+    print(f"{args.users:,} users")
+    print(f"ORDER BY RANDOM(): {legacy:10.4f} ms per pick")
+    print(f"UserIndex:         {indexed:10.4f} ms per pick (index built in {build:.0f} ms, "
+          f"{len(index.ids) * index.ids.itemsize / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
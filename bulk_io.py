@@ -0,0 +1,333 @@
+import csv
+import io
+import json
+import logging
+import math
+import sqlite3
+
+import rollups
+import schema
+
+""" Columns of exported readings, in order """
+EXPORT_COLUMNS = ['id', 'username', 'timestamp', 'temperature', 'humidity']
+
+""" Readings inserted per transaction by `import_readings` """
+IMPORT_BATCH_SIZE = 5000
+
+""" Readings fetched per round trip by `iter_readings` """
+EXPORT_CHUNK_SIZE = 5000
+
+FORMATS = ('csv', 'ndjson')
+
+""" Range of accepted reading timestamps in epoch seconds: 1970-01-01 to 9999-12-31 """
+MIN_TIMESTAMP = 0
+MAX_TIMESTAMP = 253402300799
+
+EXPORT_READINGS_SQL = '''SELECT id, username, timestamp, temperature, humidity FROM incubator_readings
+                         {where} ORDER BY timestamp, id LIMIT ?'''
+
+# Resumes after the last exported reading: a range on the timestamp index, minus the few rows
+# already sent at that timestamp.
+AFTER_READING_SQL = 'timestamp >= ? AND NOT (timestamp = ? AND id <= ?)'
+
+
+def parse_row(username, timestamp, temperature, humidity):
+    """
+    Validates one reading and converts its fields.
+
+    Parameters:
+        username (str): The incubator's username.
+        timestamp (int or str): Epoch seconds, as a number or digits, or a UTC timestamp string.
+        temperature (float or str): The temperature in °C.
+        humidity (float or str): The humidity in %.
+
+    Returns:
+        tuple: (username, timestamp, temperature, humidity) with an epoch timestamp, or None
+        if a field is missing or invalid. NaN and infinite values are invalid: SQLite would
+        store NaN as NULL and fail the whole batch it was written in. So are booleans and
+        timestamps outside `MIN_TIMESTAMP` to `MAX_TIMESTAMP`, which could overflow SQLite's
+        integers.
+    """
+    if not username or timestamp in (None, '') or isinstance(timestamp, bool):
+        return None
+    if isinstance(timestamp, str) and timestamp.isdigit():
+        timestamp = int(timestamp)
+    try:
+        row = str(username), schema.to_epoch(timestamp), float(temperature), float(humidity)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if not (MIN_TIMESTAMP <= row[1] <= MAX_TIMESTAMP and math.isfinite(row[2]) and math.isfinite(row[3])):
+        return None
+    return row
+
+
+def parse_csv(stream, default_username=None, username=None):
+    """
+    Parses readings from a CSV upload one line at a time.
+
+    The first line must name the columns. 'timestamp', 'temperature' and 'humidity' are
+    required; 'username' is optional when `default_username` is given and ignored when
+    `username` is; other columns, such as an exported 'id', are ignored.
+
+    Parameters:
+        stream (io.RawIOBase): The uploaded bytes.
+        default_username (str): The username of rows without one.
+        username (str): The username of every row, whatever its 'username' column says.
+
+    Returns:
+        generator: A (username, timestamp, temperature, humidity) tuple per line, or None for
+        a line that could not be parsed.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+    for record in reader:
+        yield parse_row(username or record.get('username') or default_username, record.get('timestamp'),
+                        record.get('temperature'), record.get('humidity'))
+
+
+def parse_ndjson(stream, default_username=None, username=None):
+    """
+    Parses readings from a newline-delimited JSON upload one line at a time.
+
+    Each line is an object with the same keys as the CSV columns, see `parse_csv`.
+    Blank lines are skipped.
+
+    Parameters:
+        stream (io.RawIOBase): The uploaded bytes.
+        default_username (str): The username of rows without one.
+        username (str): The username of every row, whatever its 'username' key says.
+
+    Returns:
+        generator: A (username, timestamp, temperature, humidity) tuple per line, or None for
+        a line that could not be parsed.
+    """
+    for line in io.TextIOWrapper(stream, encoding='utf-8'):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        if not isinstance(record, dict):
+            yield None
+            continue
+        yield parse_row(username or record.get('username') or default_username, record.get('timestamp'),
+                        record.get('temperature'), record.get('humidity'))
+
+
+def import_readings(conn, rows, batch_size=IMPORT_BATCH_SIZE, listeners=()):
+    """
+    Inserts parsed readings in transactions of `batch_size`, updating the rollups with them.
+
+    Only one batch is held in memory at a time, so uploads of any size can be imported.
+    Rows the table refuses are counted as rejected and the rest of their batch is kept;
+    batches committed before any other error are kept too. After each commit the listeners run, as
+    they do after each batch of the ingestion writer, so imported readings are checked by
+    the alert engine and reach the dashboard like any other.
+
+    Parameters:
+        conn (sqlite3.Connection): A connection to the database, outside a transaction.
+        rows (iterable): (username, timestamp, temperature, humidity) tuples, or None for
+            rows that could not be parsed, e.g. from `parse_csv`.
+        batch_size (int): The number of readings per transaction. Defaults to `IMPORT_BATCH_SIZE`.
+        listeners (iterable): Callables run with each committed batch and the highest
+            reading id written, see `ingestion.IngestionWriter.add_listener`.
+
+    Returns:
+        tuple: The number of readings imported, the number of rows rejected, and the
+        highest reading id written (0 if none).
+    """
+    imported = rejected = last_id = 0
+    batch = []
+
+    def insert_each(batch):
+        # A failed INSERT only undoes itself, so the batch's other rows stay in the transaction.
+        kept = []
+        for row in batch:
+            try:
+                conn.execute(schema.INSERT_READING_SQL, row)
+                kept.append(row)
+            except sqlite3.IntegrityError:
+                continue
+        return kept
+
+    def write(batch):
+        try:
+            try:
+                conn.executemany(schema.INSERT_READING_SQL, batch)
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                batch = insert_each(batch)
+            batch_last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0] if batch else 0
+            rollups.update_rollups(conn, batch)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        if batch:
+            for listener in listeners:
+                try:
+                    listener(batch, batch_last_id)
+                except Exception as e:
+                    logging.error(f"Error in import listener: {e}")
+        return batch, batch_last_id
+
+    def flush(batch):
+        nonlocal imported, rejected, last_id
+        written, batch_last_id = write(batch)
+        imported += len(written)
+        rejected += len(batch) - len(written)
+        last_id = batch_last_id or last_id
+
+    for row in rows:
+        if row is None:
+            rejected += 1
+            continue
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    logging.info(f"Imported {imported} readings, rejected {rejected} rows.")
+    return imported, rejected, last_id
+
+
+def submit_readings(writer, rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Hands parsed readings to an ingestion writer in chunks of `batch_size`, and waits until
+    they are committed. Used where another process owns the writes, see `ingest_service`.
+
+    Parameters:
+        writer (ingestion.IngestionWriter or ingest_service.IngestClient): Queues the readings.
+        rows (iterable): (username, timestamp, temperature, humidity) tuples, or None for
+            rows that could not be parsed, e.g. from `parse_csv`.
+        batch_size (int): The number of readings per chunk. Defaults to `IMPORT_BATCH_SIZE`.
+
+    Returns:
+        tuple: The number of readings imported and the number of rows rejected.
+    """
+    imported = rejected = 0
+    batch = []
+    for row in rows:
+        if row is None:
+            rejected += 1
+            continue
+        batch.append(row)
+        if len(batch) >= batch_size:
+            imported += writer.submit_many(batch)
+            batch = []
+    if batch:
+        imported += writer.submit_many(batch)
+    writer.flush()
+    logging.info(f"Submitted {imported} readings, rejected {rejected} rows.")
+    return imported, rejected
+
+
+def iter_readings(conn, start=None, end=None, username=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields readings from the database in timestamp order, `chunk_size` rows at a time.
+
+    The order follows the timestamp indexes, so SQLite never sorts the result and memory
+    stays constant however many readings match. Each chunk is its own query, resuming
+    after the last reading of the one before, so no read transaction stays open while a
+    slow client downloads and WAL checkpoints are never held back.
+
+    Parameters:
+        conn (sqlite3.Connection): A connection to the database.
+        start (int): The earliest timestamp in epoch seconds. Defaults to no limit.
+        end (int): The latest timestamp in epoch seconds. Defaults to no limit.
+        username (str): Only export this user's readings. Defaults to all users.
+        chunk_size (int): The number of rows fetched at a time.
+
+    Returns:
+        generator: An (id, username, timestamp, temperature, humidity) tuple per reading.
+    """
+    clauses, params = [], []
+    if username is not None:
+        clauses.append('username = ?')
+        params.append(username)
+    if end is not None:
+        clauses.append('timestamp <= ?')
+        params.append(end)
+    first_sql = EXPORT_READINGS_SQL.format(where=f"WHERE {' AND '.join(clauses + ['timestamp >= ?'])}")
+    next_sql = EXPORT_READINGS_SQL.format(where=f"WHERE {' AND '.join(clauses + [AFTER_READING_SQL])}")
+    rows = conn.execute(first_sql, params + [-2 ** 63 if start is None else start, chunk_size]).fetchall()
+    while rows:
+        yield from rows
+        if len(rows) < chunk_size:
+            break
+        last_id, _, last_timestamp = rows[-1][:3]
+        rows = conn.execute(next_sql, params + [last_timestamp, last_timestamp, last_id, chunk_size]).fetchall()
+
+
+def iter_archived(archive, start=None, end=None, username=None):
+    """
+    Yields archived readings one day at a time, see `archive.ReadingArchive`.
+
+    Parameters:
+        archive (archive.ReadingArchive): The archive to read.
+        start (int): The earliest timestamp in epoch seconds. Defaults to no limit.
+        end (int): The latest timestamp in epoch seconds. Defaults to no limit.
+        username (str): Only export this user's readings. Defaults to all users.
+
+    Returns:
+        generator: An (id, username, timestamp, temperature, humidity) tuple per reading.
+    """
+    for day in archive.days():
+        day_end = day + 86399
+        if (start is not None and day_end < start) or (end is not None and day > end):
+            continue
+        frame = archive.read_range(day if start is None else max(day, start),
+                                   day_end if end is None else min(day_end, end), EXPORT_COLUMNS)
+        if username is not None:
+            frame = frame[frame['username'] == username]
+        frame = frame.sort_values(['timestamp', 'id'], kind='stable')
+        yield from frame.itertuples(index=False, name=None)
+
+
+def csv_chunks(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Encodes readings as CSV with a header line, a chunk of rows at a time.
+
+    Parameters:
+        rows (iterable): (id, username, timestamp, temperature, humidity) tuples.
+        chunk_size (int): The number of rows per chunk.
+
+    Returns:
+        generator: The CSV text, in chunks.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Encodes readings as newline-delimited JSON objects, a chunk of rows at a time.
+
+    Parameters:
+        rows (iterable): (id, username, timestamp, temperature, humidity) tuples.
+        chunk_size (int): The number of rows per chunk.
+
+    Returns:
+        generator: The NDJSON text, in chunks.
+    """
+    lines = []
+    for row_id, username, timestamp, temperature, humidity in rows:
+        lines.append(json.dumps({'id': int(row_id), 'username': username, 'timestamp': int(timestamp),
+                                 'temperature': float(temperature), 'humidity': float(humidity)}))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
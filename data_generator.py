@@ -1,72 +1,151 @@
 import random
-from datetime import datetime
 import sqlite3
+import threading
 import time
 
+import rollups
+import schema
+import user_index
+
 def generate_data():
     """
     Generate data including temperature, humidity, and timestamp.
     No parameters.
-    Returns a dictionary with keys 'timestamp', 'temperature', and 'humidity'.
+    Returns a dictionary with keys 'timestamp' (epoch seconds), 'temperature', and 'humidity'.
     """
     temperature = round(random.uniform(36, 37.5), 2)
     humidity = round(random.uniform(45, 55), 2)
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    timestamp = int(time.time())
     return {"timestamp": timestamp, "temperature": temperature, "humidity": humidity}
 
-def get_random_user():
+def get_random_user(db_name='users.db'):
     """
     Fetches a random user from the 'users' table in the SQLite database 'users.db'.
 
+    Users are picked from a cached index of user ids (see `user_index.UserIndex`), so the
+    cost does not grow with the number of users.
+
+    Parameters:
+        db_name (str): The database to read from. Defaults to 'users.db'.
+
     Returns:
         str: A username of a random user.
     """
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT username FROM users ORDER BY RANDOM() LIMIT 1")
-    user = cursor.fetchone()
-    conn.close()
-    return user[0] if user else None
+    return user_index.get_user_index(db_name).random_user()
 
-def save_to_database(data, username):
+def save_to_database(data, username, db_name='users.db'):
     """
-    Saves the given data to the 'incubator_readings' table in the SQLite database 'users.db'.
-    If the table does not exist, it will be created.
+    Saves the given data to the 'incubator_readings' table in the SQLite database 'users.db'
+    and folds it into the rollup tables. If the tables do not exist, they will be created,
+    and tables written by older versions are migrated (see `schema.ensure_schema`).
+
+    This opens a connection and commits once per reading. Long-running producers
+    should use `ingestion.IngestionWriter`, which batches readings instead.
 
     Parameters:
         data (dict): The data to be saved to the database. It must have keys 'timestamp', 'temperature', and 'humidity'.
         username (str): The username associated with the data.
+        db_name (str): The database to write to. Defaults to 'users.db'.
 
     Returns:
         None
     """
-    conn = sqlite3.connect('users.db')
+    conn = sqlite3.connect(db_name)
     cursor = conn.cursor()
 
-    # Check if the table exists, and create it if it doesn't
-    cursor.execute('''CREATE TABLE IF NOT EXISTS incubator_readings (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            username TEXT NOT NULL,
-                            timestamp TEXT NOT NULL,
-                            temperature REAL NOT NULL,
-                            humidity REAL NOT NULL
-                        )''')
-
-    cursor.execute("INSERT INTO incubator_readings (username, timestamp, temperature, humidity) VALUES (?, ?, ?, ?)",
-                   (username, data['timestamp'], data['temperature'], data['humidity']))
+    # Check if the tables exist and are current, and create or migrate them if not
+    schema.ensure_schema(conn)
+
+    row = (username, data['timestamp'], data['temperature'], data['humidity'])
+    cursor.execute(schema.INSERT_READING_SQL, row)
+    rollups.update_rollups(conn, [row])
     conn.commit()
     conn.close()
 
+""" DataGeneratorThread for generating data in the background """
+class DataGeneratorThread(threading.Thread):
+    def __init__(self, writer, simulator=None, interval=5.0, db_name='users.db'):
+        """
+        Initializes a new data generator thread. Call `start()` to begin generating.
+
+        Parameters:
+            writer (ingestion.IngestionWriter): Receives the generated readings.
+            simulator (simulator.ReadingSimulator): When given, readings for many virtual
+                incubators are generated at the simulator's rate instead of one reading
+                per `interval` for a random registered user.
+            interval (float): Seconds between readings without a simulator. Defaults to 5.
+            db_name (str): The database to pick random users from. Defaults to 'users.db'.
+
+        Returns:
+            None
+        """
+        super().__init__(name='DataGeneratorThread', daemon=True)
+        self.writer = writer
+        self.simulator = simulator
+        self.interval = interval
+        self.db_name = db_name
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """
+        Asks the thread to stop after its current reading or batch.
+
+        Returns:
+            None
+        """
+        self._stop_event.set()
+
+    def run(self):
+        """
+        Run method for the DataGeneratorThread class.
+
+        This method is responsible for executing the data generation process until `stop()`
+        is called. With a simulator it hands the simulator's batches to the writer; otherwise
+        it calls `generate_data` every `interval` seconds and queues the reading for a random user.
+
+        Parameters:
+            self (DataGeneratorThread): The instance of the DataGeneratorThread class.
+
+        Returns:
+            None
+        """
+        if self.simulator is not None:
+            self.simulator.run(self.writer.submit_many, self._stop_event)
+            return
+        while not self._stop_event.wait(self.interval):
+            username = get_random_user(self.db_name)
+            if username:
+                self.writer.submit(generate_data(), username)
+
 if __name__ == "__main__":
+    import argparse
+
+    from ingestion import IngestionWriter
+    from simulator import ReadingSimulator
+
+    parser = argparse.ArgumentParser(description="Generate incubator readings into users.db.")
+    parser.add_argument('--incubators', type=int, default=0,
+                        help="simulate this many virtual incubators instead of one reading every 5 seconds")
+    parser.add_argument('--rate', type=float, default=1000.0, help="aggregate simulated readings per second")
+    args = parser.parse_args()
+
+    writer = IngestionWriter()
+    writer.start()
     try:
-        while True:
-            data = generate_data()
-            username = get_random_user()
-            if username:
-                save_to_database(data, username)
-                print("Data appended to database for user", username, ":", data)
-            else:
-                print("No users found in the database.")
-            time.sleep(5)  # Wait for 5 seconds before generating the next data
+        if args.incubators:
+            simulator = ReadingSimulator(incubators=args.incubators, rate=args.rate)
+            print(f"Simulating {args.incubators} incubators at {args.rate:,.0f} readings/sec. Press Ctrl+C to stop.")
+            simulator.run(writer.submit_many, threading.Event())
+        else:
+            while True:
+                data = generate_data()
+                username = get_random_user()
+                if username:
+                    writer.submit(data, username)
+                    print("Data queued for user", username, ":", data)
+                else:
+                    print("No users found in the database.")
+                time.sleep(5)  # Wait for 5 seconds before generating the next data
     except KeyboardInterrupt:
+        writer.stop()
         print("\nData generation stopped by user. Database updated.")
@@ -0,0 +1,237 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+import metrics
+from ring_buffer import ReadingRing
+
+READINGS_SINCE_SQL = '''
+    SELECT * FROM (
+        SELECT * FROM incubator_readings WHERE id > ? ORDER BY id DESC LIMIT ?
+    ) ORDER BY id
+'''
+
+READINGS_AFTER_SQL = 'SELECT * FROM incubator_readings WHERE id > ? ORDER BY id LIMIT ?'
+
+READINGS_BETWEEN_SQL = 'SELECT {columns} FROM incubator_readings WHERE timestamp BETWEEN ? AND ? ORDER BY id'
+
+# Both are answered from the (username, timestamp) index, so they read only one user's rows.
+USER_READINGS_SQL = '''
+    SELECT * FROM (
+        SELECT * FROM incubator_readings WHERE username = ? ORDER BY timestamp DESC, id DESC LIMIT ?
+    ) ORDER BY id
+'''
+
+USER_READINGS_BETWEEN_SQL = '''SELECT {columns} FROM incubator_readings
+                               WHERE username = ? AND timestamp BETWEEN ? AND ? ORDER BY id'''
+
+
+""" ReadingStore for incrementally refreshed windows of each viewed user's readings """
+class ReadingStore:
+    def __init__(self, engine, max_rows=100000, min_interval=1.0, notifier=None, archive=None,
+                 user_rows=10000, max_users=256, forecaster=None):
+        """
+        Initializes a new reading store. Nothing is read until the first refresh.
+
+        The store remembers the highest `id` it has seen, so each refresh only reads the rows
+        inserted since the last one. Those rows are handed to the forecaster and appended to
+        the windows of the users being viewed, and are not kept otherwise, so a refresh costs
+        in proportion to the new rows and the store holds no fleet-wide copy of the readings.
+
+        A user's window holds their newest `user_rows` readings in a `ring_buffer.ReadingRing`
+        of 24 bytes per reading. It is read through the (username, timestamp) index when the
+        user is first viewed and then extended from each refresh, so viewing one incubator
+        costs in proportion to its own readings rather than the whole fleet's.
+
+        Parameters:
+            engine (sqlalchemy.engine.Engine): The engine used to query 'incubator_readings'.
+            max_rows (int): Maximum number of readings read by one refresh. The first refresh
+                reads the newest `max_rows` readings to warm up the forecaster. Defaults to 100000.
+            min_interval (float): Seconds during which `load()` reuses the last refresh.
+            notifier (notifier.ChangeNotifier): Told the highest id seen after each refresh.
+            archive (archive.ReadingArchive): Where readings moved out of the database are read
+                from. Defaults to none.
+            user_rows (int): Maximum number of readings kept per user. Defaults to 10000.
+            max_users (int): Maximum number of users whose windows are kept; the least
+                recently viewed are dropped first. Defaults to 256.
+            forecaster (forecasting.Forecaster): Updated with the new readings of each refresh.
+
+        Returns:
+            None
+        """
+        self.engine = engine
+        self.max_rows = max_rows
+        self.min_interval = min_interval
+        self.last_id = 0
+        self.refreshed_at = None
+        self.notifier = notifier
+        self.archive = archive
+        self.user_rows = user_rows
+        self.max_users = max_users
+        self.forecaster = forecaster
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _read(self, name, sql, params):
+        with metrics.SQL_QUERY_SECONDS.time((name,)):
+            frame = pd.read_sql_query(sql, self.engine, params=params)
+        metrics.SQL_QUERY_ROWS.inc(len(frame), (name,))
+        return frame
+
+    def refresh(self):
+        """
+        Reads the readings with an `id` above the last one seen, at most the newest
+        `max_rows` of them, into the users' windows and the forecaster.
+
+        Returns:
+            pandas.DataFrame: The new readings, oldest first.
+        """
+        with self._lock:
+            new_rows = self._read('readings_since', READINGS_SINCE_SQL, (self.last_id, self.max_rows))
+            if not new_rows.empty:
+                self.last_id = int(new_rows['id'].iloc[-1])
+                self._extend_users(new_rows)
+                if self.forecaster is not None:
+                    self.forecaster.update(new_rows)
+            self.refreshed_at = time.monotonic()
+        if self.notifier is not None:
+            self.notifier.publish(self.last_id)
+        return new_rows
+
+    def _extend_users(self, new_rows):
+        if not self._users:
+            return
+        if len(new_rows) >= self.max_rows:
+            # Rows older than the newest `max_rows` were skipped; read the windows again.
+            self._users.clear()
+            return
+        for username, rows in new_rows[new_rows['username'].isin(list(self._users))].groupby('username'):
+            self._users[username].append_frame(rows)
+
+    def refresh_loaded(self):
+        """
+        Refreshes the store if it has been loaded, so new readings alone never trigger the
+        initial read; that waits until something asks for readings.
+
+        Returns:
+            pandas.DataFrame: The new readings, or None if the store was never loaded.
+        """
+        if self.refreshed_at is None:
+            return None
+        return self.refresh()
+
+    def load(self):
+        """
+        Loads the store, or refreshes it if the last refresh is older than `min_interval` seconds.
+
+        Returns:
+            int: The highest reading id seen.
+        """
+        if self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.min_interval:
+            self.refresh()
+        return self.last_id
+
+    def user_window(self, username):
+        """
+        Returns the window of one user's newest readings, reading it from the database the
+        first time the user is viewed.
+
+        Parameters:
+            username (str): The user whose readings to return.
+
+        Returns:
+            ring_buffer.ReadingWindow: A zero-copy view of up to `user_rows` of the user's
+            newest readings, oldest first.
+        """
+        self.load()
+        with self._lock:
+            ring = self._users.get(username)
+            if ring is None:
+                ring = ReadingRing(username, self.user_rows)
+                ring.append_frame(self._read('user_readings', USER_READINGS_SQL, (username, self.user_rows)))
+                self._users[username] = ring
+                if len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(username)
+            return ring.window()
+
+    def memory(self):
+        """
+        Reports the memory held by the store: the users' windows, with their arrays,
+        ring objects and usernames, and the table of windows.
+
+        Returns:
+            tuple: The bytes held and the number of readings held.
+        """
+        with self._lock:
+            users = list(self._users.items())
+            nbytes = sys.getsizeof(self._users)
+        for username, ring in users:
+            nbytes += ring.nbytes + sys.getsizeof(ring) + sys.getsizeof(username)
+        return nbytes, sum(len(ring) for _, ring in users)
+
+    def between(self, start, end, columns=None, username=None):
+        """
+        Returns the readings with a timestamp between `start` and `end`, inclusive.
+
+        With a `username`, ranges inside the user's window are sliced from it. Other ranges
+        are read from the database through the timestamp indexes, and from the archive for
+        the days that were moved there.
+
+        Parameters:
+            start (int): The earliest timestamp in epoch seconds.
+            end (int): The latest timestamp in epoch seconds.
+            columns (list): The columns needed. Defaults to all of them; ranges read from
+                the database or the archive then include only these.
+            username (str): Only return this user's readings. Defaults to all users.
+
+        Returns:
+            pandas.DataFrame: The matching readings, oldest first.
+        """
+        if username is not None:
+            window = self.user_window(username)
+            if not window.empty and start >= window.timestamps.min():
+                return window.between(start, end).to_frame(columns)
+        columns_sql = ', '.join(columns) if columns else '*'
+        if username is None:
+            name, sql, params = 'readings_between', READINGS_BETWEEN_SQL.format(columns=columns_sql), ()
+        else:
+            name, sql, params = ('user_readings_between', USER_READINGS_BETWEEN_SQL.format(columns=columns_sql),
+                                 (username,))
+        archived_until = self.archive.archived_until() if self.archive is not None else None
+        if archived_until is None or start >= archived_until:
+            return self._read(name, sql, (*params, start, end))
+        archived = self.archive.read_range(start, min(end, archived_until - 1), columns, username)
+        if end < archived_until:
+            return archived
+        recent = self._read(name, sql, (*params, archived_until, end))
+        return pd.concat([archived, recent], ignore_index=True)
+
+    def since(self, after_id, limit=None, username=None):
+        """
+        Returns the readings with an `id` above `after_id`.
+
+        A user's readings come from their window, without querying the database once it is
+        loaded; readings of all users are read from the database through the primary key.
+
+        Parameters:
+            after_id (int): The highest reading id the caller has already seen.
+            limit (int): Return at most this many of the oldest matching readings.
+            username (str): Only return this user's readings, from their window. Defaults
+                to all users.
+
+        Returns:
+            pandas.DataFrame: The newer readings, oldest first.
+        """
+        if username is None:
+            return self._read('readings_after', READINGS_AFTER_SQL, (after_id, -1 if limit is None else limit))
+        with self._lock:
+            ring = self._users.get(username)
+            window = ring.window() if ring is not None else None
+        if window is None:
+            window = self.user_window(username)
+        return window.since(after_id, limit).to_frame()
@@ -0,0 +1,138 @@
+import logging
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+""" Pragmas applied once to every pooled connection """
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL;',
+    'PRAGMA synchronous = NORMAL;',
+    'PRAGMA busy_timeout = 5000;',
+    'PRAGMA foreign_keys = ON;',
+)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """
+    Raised when no pooled connection becomes free in time. It is an `sqlite3.Error`,
+    so callers that already handle database errors handle it too.
+    """
+
+
+""" ConnectionPool for sharing configured SQLite connections between threads """
+class ConnectionPool:
+    def __init__(self, db_name='users.db', size=8, timeout=5.0, cached_statements=256):
+        """
+        Initializes a new pool. Connections are opened lazily, up to `size` of them.
+
+        Each connection is opened with `check_same_thread=False` so any thread may use it,
+        but only one thread holds a given connection at a time. SQLite keeps compiled
+        statements per connection, so reusing connections also reuses prepared statements.
+
+        Parameters:
+            db_name (str): The database to connect to. Defaults to 'users.db'.
+            size (int): Maximum number of open connections. Defaults to 8.
+            timeout (float): Seconds to wait for a free connection before raising `PoolTimeout`.
+            cached_statements (int): Number of prepared statements cached per connection.
+
+        Returns:
+            None
+        """
+        self.db_name = db_name
+        self.size = size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, cached_statements=self.cached_statements)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self, timeout=None):
+        """
+        Takes a connection from the pool, opening a new one if the pool is not full.
+
+        Parameters:
+            timeout (float): Seconds to wait for a free connection. Defaults to the pool's timeout.
+
+        Returns:
+            sqlite3.Connection: A connection that must be given back with `release`.
+
+        Raises:
+            PoolTimeout: If every connection stays in use for `timeout` seconds.
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                return self._open()
+            except sqlite3.Error:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout if timeout is None else timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No free connection to {self.db_name} after {self.timeout} seconds")
+
+    def release(self, conn):
+        """
+        Gives a connection back to the pool, rolling back any transaction left open.
+
+        Parameters:
+            conn (sqlite3.Connection): A connection returned by `acquire`.
+
+        Returns:
+            None
+        """
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Context manager that acquires a connection and releases it afterwards.
+
+        Parameters:
+            timeout (float): Seconds to wait for a free connection. Defaults to the pool's timeout.
+
+        Yields:
+            sqlite3.Connection: The pooled connection.
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """
+        Closes every idle connection. Connections still in use are closed when released
+        to a pool that is no longer used.
+
+        Returns:
+            None
+        """
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logging.error(f"Error closing pooled connection: {e}")
+            with self._lock:
+                self._opened -= 1
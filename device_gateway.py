@@ -0,0 +1,318 @@
+"""
+The device gateway, where incubator devices post batches of readings over HTTP.
+
+The gateway is a small asyncio HTTP/1.1 server on its own port and thread, so thousands
+of devices can hold keep-alive connections open without a thread each. A batch is
+validated and put on the ingestion writer's queue without waiting for SQLite, and the
+device gets an acknowledgement right away:
+
+    POST /api/readings/ingest
+    Authorization: Bearer <EMM_DEVICE_TOKEN>
+    {"username": "incubator-7", "readings": [{"timestamp": 1704067200, "temperature": 37.1, "humidity": 52.0}]}
+
+    202 {"batch": 1, "accepted": 1, "rejected": []}
+
+'rejected' lists the positions of readings that failed validation. When the queue has no
+room for the batch, nothing is queued and the gateway answers 503 with a Retry-After
+header; devices should wait that many seconds and send the batch again.
+
+The gateway runs next to the ingestion writer: in the ingestion service with
+`--device-port`, or in a single-process server with EMM_DEVICE_PORT set. Set
+EMM_DEVICE_TOKEN to require that token from devices.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import threading
+
+import bulk_io
+import metrics
+
+DEFAULT_HOST = '127.0.0.1'
+
+INGEST_PATH = '/api/readings/ingest'
+
+""" Largest request body and batch accepted from a device """
+MAX_BODY_BYTES = 1024 * 1024
+MAX_BATCH_SIZE = 5000
+
+""" Seconds an overloaded gateway asks devices to wait before retrying """
+RETRY_AFTER = 1
+
+""" Seconds an idle keep-alive connection is kept open """
+IDLE_TIMEOUT = 60.0
+
+REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+           405: 'Method Not Allowed', 411: 'Length Required', 413: 'Payload Too Large',
+           431: 'Request Header Fields Too Large', 503: 'Service Unavailable'}
+
+
+class _HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def parse_batch(body):
+    """
+    Parses and validates the JSON body of an ingestion request.
+
+    Parameters:
+        body (bytes): The request body, an object with a 'readings' list and an optional
+            'username' used for readings without one.
+
+    Returns:
+        tuple: The valid (username, timestamp, temperature, humidity) tuples, and the
+        positions of the readings that were rejected.
+
+    Raises:
+        ValueError: If the body is not a valid batch.
+    """
+    try:
+        batch = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid JSON: {e}") from e
+    readings = batch.get('readings') if isinstance(batch, dict) else None
+    if not isinstance(readings, list):
+        raise ValueError("Expected an object with a 'readings' list.")
+    if len(readings) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} readings per batch.")
+    default_username = batch.get('username')
+    rows, rejected = [], []
+    for i, reading in enumerate(readings):
+        row = None
+        if isinstance(reading, dict):
+            row = bulk_io.parse_row(reading.get('username') or default_username, reading.get('timestamp'),
+                                    reading.get('temperature'), reading.get('humidity'))
+        if row is None:
+            rejected.append(i)
+        else:
+            rows.append(row)
+    return rows, rejected
+
+
+""" DeviceGateway for accepting batches of readings from incubator devices """
+class DeviceGateway(threading.Thread):
+    def __init__(self, writer, port, host=DEFAULT_HOST, token=None, retry_after=RETRY_AFTER):
+        """
+        Initializes a new gateway. Call `start()` to begin accepting connections; `port`
+        holds the bound port once `ready` is set.
+
+        Parameters:
+            writer (ingestion.IngestionWriter): The writer whose queue batches are put on.
+            port (int): The port to listen on, or 0 for any free port.
+            host (str): The address to listen on. Defaults to localhost.
+            token (str): The bearer token devices must send. Defaults to none required.
+            retry_after (int): Seconds an overloaded gateway asks devices to wait.
+
+        Returns:
+            None
+        """
+        super().__init__(name='DeviceGateway', daemon=True)
+        self.writer = writer
+        self.host = host
+        self.port = port
+        self.token = token
+        self.retry_after = retry_after
+        self.batches_acknowledged = 0
+        self.ready = threading.Event()
+        self._loop = None
+        self._server = None
+
+    def authorized(self, headers):
+        """
+        Checks a request's bearer token.
+
+        Parameters:
+            headers (dict): The request headers, with lower-case names.
+
+        Returns:
+            bool: True if no token is required or the request carries it.
+        """
+        if self.token is None:
+            return True
+        scheme, _, token = headers.get('authorization', '').partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), self.token.encode())
+
+    def ingest(self, headers, body):
+        """
+        Queues a batch of readings.
+
+        The whole batch is queued or, when the queue has no room for it, none of it.
+
+        Parameters:
+            headers (dict): The request headers, with lower-case names.
+            body (bytes): The request body, see `parse_batch`.
+
+        Returns:
+            dict: The acknowledgement, with the batch number, the number of readings
+            accepted and the positions of those rejected.
+
+        Raises:
+            _HTTPError: If the request is unauthorized or invalid, or the queue is full.
+        """
+        if not self.authorized(headers):
+            raise _HTTPError(401, "Invalid device token.", {'WWW-Authenticate': 'Bearer'})
+        try:
+            rows, rejected = parse_batch(body)
+        except ValueError as e:
+            raise _HTTPError(400, str(e))
+        metrics.DEVICE_READINGS.inc(len(rejected), ('rejected',))
+        queue = self.writer.queue
+        if rows and queue.maxsize - queue.qsize() < len(rows):
+            metrics.DEVICE_READINGS.inc(len(rows), ('deferred',))
+            raise _HTTPError(503, "Ingestion queue is full, retry later.", {'Retry-After': str(self.retry_after)})
+        accepted = self.writer.submit_many(rows, block=False)
+        metrics.DEVICE_READINGS.inc(accepted, ('accepted',))
+        self.batches_acknowledged += 1
+        ack = {'batch': self.batches_acknowledged, 'accepted': accepted, 'rejected': rejected}
+        if accepted < len(rows):
+            # Another producer filled the queue since the check; the device should send
+            # the readings after the first `accepted` again.
+            metrics.DEVICE_READINGS.inc(len(rows) - accepted, ('deferred',))
+            ack['deferred'] = len(rows) - accepted
+        return ack
+
+    async def _read_request(self, reader):
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), IDLE_TIMEOUT)
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        method, path, version = request_line.split(' ', 2)
+        headers = {}
+        for line in header_lines:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+        return method, path.split('?')[0], version, headers
+
+    async def _read_body(self, reader, headers):
+        if 'transfer-encoding' in headers:
+            raise _HTTPError(411, "Send the batch with a Content-Length.")
+        length = headers.get('content-length', '0')
+        if not length.isdigit():
+            raise _HTTPError(400, "Invalid Content-Length.")
+        if int(length) > MAX_BODY_BYTES:
+            raise _HTTPError(413, f"At most {MAX_BODY_BYTES} bytes per request.")
+        return await asyncio.wait_for(reader.readexactly(int(length)), IDLE_TIMEOUT)
+
+    def _response(self, status, payload, keep_alive, headers=None):
+        body = json.dumps(payload).encode()
+        lines = [f'HTTP/1.1 {status} {REASONS[status]}', 'Content-Type: application/json',
+                 f'Content-Length: {len(body)}', f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines.extend(f'{name}: {value}' for name, value in (headers or {}).items())
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+    async def handle_connection(self, reader, writer):
+        """
+        Answers one device's requests until it disconnects, goes idle or sends something
+        that is not HTTP.
+
+        Parameters:
+            reader (asyncio.StreamReader): The connection's incoming side.
+            writer (asyncio.StreamWriter): The connection's outgoing side.
+
+        Returns:
+            None
+        """
+        try:
+            while True:
+                try:
+                    method, path, version, headers = await self._read_request(reader)
+                except asyncio.LimitOverrunError:
+                    writer.write(self._response(431, {'error': "Request headers too large."}, False))
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+                    break
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                extra = None
+                try:
+                    if path != INGEST_PATH:
+                        raise _HTTPError(404, "Not found.")
+                    if method != 'POST':
+                        raise _HTTPError(405, "Use POST.", {'Allow': 'POST'})
+                    body = await self._read_body(reader, headers)
+                    status, payload = 202, self.ingest(headers, body)
+                except _HTTPError as e:
+                    status, payload, extra = e.status, {'error': str(e)}, e.headers
+                    if 'Retry-After' in e.headers:
+                        payload['retry_after'] = self.retry_after
+                    if status in (411, 413):
+                        # The unread body would be taken for the next request.
+                        keep_alive = False
+                metrics.DEVICE_REQUESTS.inc(labels=(str(status),))
+                writer.write(self._response(status, payload, keep_alive, extra))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        except Exception as e:
+            logging.error(f"Error serving a device: {e}")
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """
+        Listens for devices until `close()` is called.
+
+        Returns:
+            None
+        """
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                                  backlog=4096, limit=16 * 1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.ready.set()
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def run(self):
+        """
+        Run method for the DeviceGateway class.
+
+        Returns:
+            None
+        """
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            logging.error(f"Device gateway stopped: {e}")
+        finally:
+            self.ready.set()
+
+    def close(self):
+        """
+        Stops accepting connections and closes the open ones.
+
+        Returns:
+            None
+        """
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+        self.join(5)
+
+
+def start_gateway(writer, port, host=None):
+    """
+    Starts a gateway configured from the environment: EMM_DEVICE_HOST (defaults to
+    localhost) and EMM_DEVICE_TOKEN.
+
+    Parameters:
+        writer (ingestion.IngestionWriter): The writer whose queue batches are put on.
+        port (int): The port to listen on.
+        host (str): The address to listen on. Defaults to EMM_DEVICE_HOST.
+
+    Returns:
+        DeviceGateway: The started gateway.
+    """
+    gateway = DeviceGateway(writer, port, host or os.environ.get('EMM_DEVICE_HOST', DEFAULT_HOST),
+                            token=os.environ.get('EMM_DEVICE_TOKEN'))
+    gateway.start()
+    gateway.ready.wait(5)
+    logging.info(f"Device gateway listening on {gateway.host}:{gateway.port}.")
+    return gateway
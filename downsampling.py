@@ -0,0 +1,124 @@
+import numpy as np
+
+""" Default number of points kept per trace, roughly the pixel width of the dashboard graph """
+DEFAULT_POINTS = 1000
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Selects points with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are always kept. The remaining points are split into
+    `n_out - 2` equal buckets, and from each bucket the point forming the largest
+    triangle with the previously selected point and the mean of the next bucket is kept.
+    Bucket means are computed for all buckets at once with a cumulative sum, so only
+    one vectorized argmax runs per bucket.
+
+    Parameters:
+        x (numpy.ndarray): Monotonic x values, e.g. epoch timestamps.
+        y (numpy.ndarray): The y values.
+        n_out (int): The number of points to keep.
+
+    Returns:
+        numpy.ndarray: Sorted indices of the selected points.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    counts = np.diff(edges)
+    x_sums = np.add.reduceat(x[:n - 1], edges[:-1])
+    y_sums = np.add.reduceat(y[:n - 1], edges[:-1])
+    # Mean of the bucket after each bucket; the last bucket looks ahead to the final point.
+    next_x = np.append(x_sums[1:] / counts[1:], x[-1])
+    next_y = np.append(y_sums[1:] / counts[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, n_out):
+    """
+    Selects the minimum and maximum of each of `n_out // 2` equal buckets.
+
+    This keeps every peak and trough visible, which suits bar graphs. The buckets are
+    reshaped into a 2-D array so all minima and maxima are found in one pass.
+
+    Parameters:
+        y (numpy.ndarray): The y values.
+        n_out (int): The approximate number of points to keep.
+
+    Returns:
+        numpy.ndarray: Sorted, unique indices of the selected points, including the first and last.
+    """
+    n = len(y)
+    buckets = n_out // 2
+    if n_out >= n or buckets < 1:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    # Trailing buckets can be all padding when n is small; skip them.
+    valid = offsets < n
+    lows = np.nanargmin(padded[valid], axis=1) + offsets[valid]
+    highs = np.nanargmax(padded[valid], axis=1) + offsets[valid]
+    return np.unique(np.concatenate(([0, n - 1], lows, highs)))
+
+
+def downsample(x, y, n_out=DEFAULT_POINTS, method='lttb'):
+    """
+    Selects at most about `n_out` representative points of a series.
+
+    Parameters:
+        x (numpy.ndarray): Monotonic x values, e.g. epoch timestamps.
+        y (numpy.ndarray): The y values.
+        n_out (int): The number of points to keep. Defaults to `DEFAULT_POINTS`.
+        method (str): 'lttb' or 'minmax'. Defaults to 'lttb'.
+
+    Returns:
+        numpy.ndarray: Sorted indices of the selected points.
+
+    Raises:
+        ValueError: If `method` is not a known downsampling method.
+    """
+    if method == 'lttb':
+        return lttb_indices(x, y, n_out)
+    if method == 'minmax':
+        return minmax_indices(y, n_out)
+    raise ValueError(f"Unknown downsampling method: {method}")
+
+
+def downsample_frame(frame, column, n_out=DEFAULT_POINTS, method='lttb'):
+    """
+    Returns the rows of a readings frame that best represent one of its columns over time.
+
+    Parameters:
+        frame (pandas.DataFrame or ring_buffer.ReadingWindow): Readings with an epoch
+            'timestamp' column, oldest first.
+        column (str): The column to preserve the shape of, e.g. 'temperature'.
+        n_out (int): The number of rows to keep. Defaults to `DEFAULT_POINTS`.
+        method (str): 'lttb' or 'minmax'. Defaults to 'lttb'.
+
+    Returns:
+        pandas.DataFrame or ring_buffer.ReadingWindow: The selected rows, oldest first.
+    """
+    if len(frame) <= n_out:
+        return frame
+    return frame.take(downsample(np.asarray(frame['timestamp']), np.asarray(frame[column]), n_out, method))
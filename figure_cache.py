@@ -0,0 +1,107 @@
+import json
+import threading
+from collections import OrderedDict
+
+from plotly.utils import PlotlyJSONEncoder
+
+
+""" FigureCache for reusing serialized figures until newer readings arrive """
+class FigureCache:
+    def __init__(self, max_entries=256):
+        """
+        Initializes a new, empty figure cache.
+
+        Keys are (user, graph_type, time_range, reading_id) tuples, where `reading_id` is the
+        highest reading id the figure was built from. Values are stored as JSON, so a cached
+        figure can't be changed by whoever reads it, and costs a single string in memory.
+
+        Parameters:
+            max_entries (int): Maximum number of figures kept. The least recently used
+                figure is evicted first. Defaults to 256.
+
+        Returns:
+            None
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Looks up a figure and marks it as recently used.
+
+        Parameters:
+            key (tuple): The (user, graph_type, time_range, reading_id) of the figure.
+
+        Returns:
+            object: A fresh copy of the cached value, or None on a miss.
+        """
+        with self._lock:
+            serialized = self._entries.get(key)
+            if serialized is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(serialized)
+
+    def put(self, key, value):
+        """
+        Stores a figure. Figures for the same user, graph type and time range built from
+        older readings can never be requested again, so they are dropped right away.
+
+        Parameters:
+            key (tuple): The (user, graph_type, time_range, reading_id) of the figure.
+            value (object): The figure, or anything else plotly can serialize.
+
+        Returns:
+            None
+        """
+        serialized = json.dumps(value, cls=PlotlyJSONEncoder)
+        view, reading_id = key[:-1], key[-1]
+        with self._lock:
+            stale = [k for k in self._entries if k[:-1] == view and k[-1] < reading_id]
+            for k in stale:
+                del self._entries[k]
+            self.invalidations += len(stale)
+            self._entries[key] = serialized
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user=None):
+        """
+        Drops the cached figures of one user, or of every user.
+
+        Parameters:
+            user (str): The user whose figures to drop. Defaults to all users.
+
+        Returns:
+            int: The number of figures dropped.
+        """
+        with self._lock:
+            stale = [k for k in self._entries if user is None or k[0] == user]
+            for k in stale:
+                del self._entries[k]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: The 'hits', 'misses', 'evictions' and 'invalidations' so far, and the
+            number of cached 'entries'.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'entries': len(self._entries)}
+
+    def __len__(self):
+        return len(self._entries)
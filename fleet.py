@@ -0,0 +1,187 @@
+"""
+The fleet overview: the latest reading, the last hour's range and the health of every
+incubator at once.
+
+Every tile of the overview comes from one grouped query. The incubators that reported
+since the start of yesterday are found in the daily rollup; for each, the latest reading
+is one seek in the (username, timestamp) index and the last hour's minima and maxima
+are one range of at most 60 rows of the 1-minute rollup's (username, bucket) key, so the
+query reads the same few rows per incubator however long the history or fast the sensors.
+Health is then worked out for all incubators together with NumPy, and the result is
+reused for `REFRESH_SECONDS`, so however many operators have the page open the database
+sees one query per interval.
+"""
+import threading
+import time
+
+import numpy as np
+
+import alerts
+import metrics
+import schema
+
+FLEET_SQL = '''
+    WITH fleet AS (
+        SELECT DISTINCT username FROM incubator_readings_1d WHERE bucket >= :day
+    )
+    SELECT fleet.username, latest.timestamp, latest.temperature, latest.humidity, COALESCE(SUM(minute.count), 0),
+           MIN(minute.temperature_min), MAX(minute.temperature_max), MIN(minute.humidity_min), MAX(minute.humidity_max)
+    FROM fleet
+    JOIN incubator_readings AS latest ON latest.id = (
+        SELECT id FROM incubator_readings WHERE username = fleet.username ORDER BY timestamp DESC, id DESC LIMIT 1
+    )
+    LEFT JOIN incubator_readings_1m AS minute ON minute.username = fleet.username AND minute.bucket >= :hour
+    GROUP BY fleet.username
+    ORDER BY fleet.username
+'''
+
+FLEET_COLUMNS = ('username', 'timestamp', 'temperature', 'humidity', 'count',
+                 'temperature_min', 'temperature_max', 'humidity_min', 'humidity_max')
+
+""" Seconds a fleet summary is reused before it is queried again """
+REFRESH_SECONDS = 5.0
+
+""" Incubators without readings since the start of this many days before today (UTC) are left out """
+ACTIVE_DAYS = 1
+
+""" Health of an incubator, worst first """
+STALE = 'stale'
+ALERT = 'alert'
+WARNING = 'warning'
+DRIFTING = 'drifting'
+OK = 'ok'
+STATUSES = (STALE, ALERT, WARNING, DRIFTING, OK)
+
+
+def query_fleet(conn, now):
+    """
+    Reads every active incubator's latest reading and last hour's range in one query.
+
+    Parameters:
+        conn (sqlite3.Connection): A connection to the database.
+        now (int): The current time in epoch seconds.
+
+    Returns:
+        dict: One NumPy array per column of `FLEET_COLUMNS`, one entry per incubator, ordered
+        by username. Incubators without readings in the last hour have a 'count' of 0
+        and NaN minima and maxima.
+    """
+    params = {'day': (now // 86400 - ACTIVE_DAYS) * 86400, 'hour': now - 3600}
+    with metrics.SQL_QUERY_SECONDS.time(('fleet',)):
+        rows = conn.execute(FLEET_SQL, params).fetchall()
+    metrics.SQL_QUERY_ROWS.inc(len(rows), ('fleet',))
+    columns = list(zip(*rows)) if rows else [()] * len(FLEET_COLUMNS)
+    fleet = {'username': np.array(columns[0], dtype=object),
+             'timestamp': np.array(columns[1], dtype=np.int64),
+             'count': np.array(columns[4], dtype=np.int64)}
+    for name, values in zip(FLEET_COLUMNS, columns):
+        if name not in fleet:
+            fleet[name] = np.array(values, dtype=np.float64)
+    return fleet
+
+
+def health(fleet, now, drifting=(), temperature_range=alerts.TEMPERATURE_RANGE,
+           humidity_range=alerts.HUMIDITY_RANGE, stale_after=alerts.STALE_AFTER):
+    """
+    Works out the health of every incubator in a fleet summary at once.
+
+    An incubator is stale without a reading for `stale_after` seconds, in alert when its
+    latest reading is outside the limits, in warning when it left them in the last hour,
+    drifting when its forecast leaves them, and ok otherwise.
+
+    Parameters:
+        fleet (dict): The columns from `query_fleet`.
+        now (int): The current time in epoch seconds.
+        drifting (collection): The usernames forecast to leave the limits, see
+            `forecasting.Forecaster.drifting`.
+        temperature_range (tuple): The allowed (minimum, maximum) temperature in °C.
+        humidity_range (tuple): The allowed (minimum, maximum) humidity in %.
+        stale_after (int): Seconds without readings before an incubator is stale.
+
+    Returns:
+        numpy.ndarray: The status of each incubator, one of `STATUSES`.
+    """
+    def outside(values, limits):
+        return (values < limits[0]) | (values > limits[1])
+
+    stale = now - fleet['timestamp'] > stale_after
+    alert = outside(fleet['temperature'], temperature_range) | outside(fleet['humidity'], humidity_range)
+    # NaN minima and maxima, of incubators silent for the last hour, compare as inside.
+    warning = (outside(fleet['temperature_min'], temperature_range) | outside(fleet['temperature_max'], temperature_range)
+               | outside(fleet['humidity_min'], humidity_range) | outside(fleet['humidity_max'], humidity_range))
+    forecast = np.isin(fleet['username'], list(drifting)) if drifting else np.zeros(len(stale), dtype=bool)
+    return np.select([stale, alert, warning, forecast], [STALE, ALERT, WARNING, DRIFTING], OK).astype(object)
+
+
+""" FleetOverview for the cached overview of every incubator """
+class FleetOverview:
+    def __init__(self, connect, forecaster=None, refresh_seconds=REFRESH_SECONDS):
+        """
+        Initializes a new overview. Nothing is read until the first summary.
+
+        Parameters:
+            connect (callable): Returns a new DB-API connection to the database, e.g.
+                `engine.raw_connection`; it is closed after each query.
+            forecaster (forecasting.Forecaster): Marks drifting incubators. Defaults to none.
+            refresh_seconds (float): Seconds a summary is reused. Defaults to `REFRESH_SECONDS`.
+
+        Returns:
+            None
+        """
+        self.connect = connect
+        self.forecaster = forecaster
+        self.refresh_seconds = refresh_seconds
+        self._summary = None
+        self._summarized_at = None
+        self._lock = threading.Lock()
+
+    def summary(self, now=None, username=None):
+        """
+        Returns the overview of every active incubator, querying the database at most once
+        per `refresh_seconds` however many callers ask at once.
+
+        Parameters:
+            now (int): The current time in epoch seconds. Defaults to the clock.
+            username (str): Only include this user's incubator, taken from the same cached
+                summary. Defaults to every incubator.
+
+        Returns:
+            dict: 'incubators', a list of tiles ordered by username, each a dict with the
+            columns of `query_fleet` (NaN replaced by None), the formatted 'time' of the
+            latest reading and its 'status'; 'counts', the number of incubators per status;
+            and 'generated', the epoch seconds the summary was computed at.
+        """
+        summary = self._fleet_summary(now)
+        if username is None:
+            return summary
+        tiles = [tile for tile in summary['incubators'] if tile['username'] == username]
+        counts = dict.fromkeys(STATUSES, 0)
+        for tile in tiles:
+            counts[tile['status']] += 1
+        return {'incubators': tiles, 'counts': counts, 'generated': summary['generated']}
+
+    def _fleet_summary(self, now):
+        with self._lock:
+            if (self._summary is not None and
+                    time.monotonic() - self._summarized_at < self.refresh_seconds):
+                return self._summary
+            now = int(time.time()) if now is None else now
+            conn = self.connect()
+            try:
+                fleet = query_fleet(conn, now)
+            finally:
+                conn.close()
+            drifting = self.forecaster.drifting() if self.forecaster is not None else ()
+            fleet['status'] = health(fleet, now, drifting)
+            columns = {name: values.tolist() for name, values in fleet.items()}
+            tiles = [dict(zip(columns, row)) for row in zip(*columns.values())]
+            for tile in tiles:
+                tile['time'] = schema.format_timestamp(tile['timestamp'])
+                for name in ('temperature_min', 'temperature_max', 'humidity_min', 'humidity_max'):
+                    if tile[name] != tile[name]:
+                        tile[name] = None
+            statuses, counts = np.unique(fleet['status'].astype(str), return_counts=True)
+            counts = dict.fromkeys(STATUSES, 0) | dict(zip(statuses.tolist(), counts.tolist()))
+            self._summary = {'incubators': tiles, 'counts': counts, 'generated': now}
+            self._summarized_at = time.monotonic()
+            return self._summary
@@ -0,0 +1,214 @@
+"""
+Short-horizon forecasts of each incubator's temperature and humidity.
+
+Every incubator has a Holt model per measure: a smoothed level, a trend in units per
+second and the smoothed variance of its one-step forecast errors. A reading updates them
+in constant time, so models follow new readings without refitting over the history, and
+a batch updates all the incubators in it together with NumPy, one reading per incubator
+at a time.
+
+Forecasts extend the trend from the last reading for `HORIZON` seconds, with a band that
+widens with the error variance and the number of reading intervals ahead. An incubator is
+drifting when its forecast leaves the alert limits within the horizon while its level is
+still inside them, so operators can act before an alert is raised.
+"""
+import threading
+
+import numpy as np
+
+import alerts
+
+MEASURES = ('temperature', 'humidity')
+
+""" Smoothing of the level, the trend and the error variance, per reading """
+LEVEL_ALPHA = 0.3
+TREND_BETA = 0.05
+VARIANCE_GAMMA = 0.05
+
+""" Seconds ahead forecasts cover, and the points a forecast is drawn with """
+HORIZON = 600
+FORECAST_POINTS = 21
+
+""" Width of the forecast band in standard deviations, about a 95% interval """
+BAND_Z = 1.96
+
+""" Readings an incubator needs before it is forecast """
+MIN_READINGS = 10
+
+""" Readings of one incubator applied from a single batch; older ones no longer affect the model """
+WARMUP = 512
+
+
+""" Forecaster for incrementally updated Holt forecasts of every incubator """
+class Forecaster:
+    def __init__(self, alpha=LEVEL_ALPHA, beta=TREND_BETA, gamma=VARIANCE_GAMMA, horizon=HORIZON):
+        """
+        Initializes a new forecaster with no incubators seen yet. Per incubator it keeps
+        only the model state, in flat arrays.
+
+        Parameters:
+            alpha (float): Smoothing of the level, between 0 and 1. Defaults to `LEVEL_ALPHA`.
+            beta (float): Smoothing of the trend, between 0 and 1. Defaults to `TREND_BETA`.
+            gamma (float): Smoothing of the error variance and the reading interval.
+                Defaults to `VARIANCE_GAMMA`.
+            horizon (int): Seconds ahead forecasts cover. Defaults to `HORIZON`.
+
+        Returns:
+            None
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.horizon = horizon
+        self.readings_seen = 0
+        self._slots = {}
+        self._usernames = []
+        self._last_timestamp = np.full(64, -1, dtype=np.int64)
+        self._count = np.zeros(64, dtype=np.int64)
+        self._interval = np.zeros(64)
+        self._level = np.zeros((64, len(MEASURES)))
+        self._trend = np.zeros((64, len(MEASURES)))
+        self._variance = np.zeros((64, len(MEASURES)))
+        self._lock = threading.Lock()
+
+    def _slot_indices(self, usernames):
+        unique, inverse = np.unique(np.asarray(usernames, dtype=object), return_inverse=True)
+        slots = np.empty(len(unique), dtype=np.int64)
+        for i, username in enumerate(unique):
+            slot = self._slots.get(username)
+            if slot is None:
+                slot = self._slots[username] = len(self._usernames)
+                self._usernames.append(username)
+            slots[i] = slot
+        if len(self._usernames) > len(self._count):
+            size = max(len(self._usernames), 2 * len(self._count))
+            grow = size - len(self._count)
+            self._last_timestamp = np.concatenate([self._last_timestamp, np.full(grow, -1, dtype=np.int64)])
+            self._count = np.concatenate([self._count, np.zeros(grow, dtype=np.int64)])
+            self._interval = np.concatenate([self._interval, np.zeros(grow)])
+            self._level = np.concatenate([self._level, np.zeros((grow, len(MEASURES)))])
+            self._trend = np.concatenate([self._trend, np.zeros((grow, len(MEASURES)))])
+            self._variance = np.concatenate([self._variance, np.zeros((grow, len(MEASURES)))])
+        return slots[inverse]
+
+    def _step(self, slots, timestamps, values):
+        # One reading for each of `slots`, which are all different.
+        last = self._last_timestamp[slots]
+        new = last < 0
+        if new.any():
+            first = slots[new]
+            self._level[first] = values[new]
+            self._trend[first] = 0.0
+            self._variance[first] = 0.0
+            self._interval[first] = 0.0
+            self._count[first] = 1
+            self._last_timestamp[first] = timestamps[new]
+        # Readings older than the model's last one arrived late; they are skipped.
+        later = ~new & (timestamps > last)
+        if not later.any():
+            return
+        slots, timestamps, values = slots[later], timestamps[later], values[later]
+        elapsed = (timestamps - last[later]).astype(np.float64)
+        level, trend = self._level[slots], self._trend[slots]
+        predicted = level + trend * elapsed[:, None]
+        error = values - predicted
+        self._level[slots] = predicted + self.alpha * error
+        self._trend[slots] = trend + self.alpha * self.beta * error / elapsed[:, None]
+        self._variance[slots] += self.gamma * (error ** 2 - self._variance[slots])
+        interval = self._interval[slots]
+        self._interval[slots] = np.where(interval > 0, interval + self.gamma * (elapsed - interval), elapsed)
+        self._count[slots] += 1
+        self._last_timestamp[slots] = timestamps
+
+    def update(self, frame):
+        """
+        Updates the models of the incubators in a batch of new readings.
+
+        Parameters:
+            frame (pandas.DataFrame): Readings with 'username', 'timestamp', 'temperature'
+                and 'humidity' columns, e.g. the new rows of a `ReadingStore` refresh.
+
+        Returns:
+            None
+        """
+        if frame.empty:
+            return
+        timestamps = frame['timestamp'].to_numpy(dtype=np.int64)
+        values = frame[list(MEASURES)].to_numpy(dtype=np.float64)
+        with self._lock:
+            slots = self._slot_indices(frame['username'].to_numpy())
+            order = np.lexsort((timestamps, slots))
+            slots, timestamps, values = slots[order], timestamps[order], values[order]
+            # Number each incubator's readings from its newest one back, and keep the newest WARMUP.
+            positions = np.arange(len(slots))
+            last = np.ones(len(slots), dtype=bool)
+            last[:-1] = slots[1:] != slots[:-1]
+            group_end = np.minimum.accumulate(np.where(last, positions, len(slots))[::-1])[::-1]
+            from_end = group_end - positions
+            keep = from_end < WARMUP
+            slots, timestamps, values, from_end = slots[keep], timestamps[keep], values[keep], from_end[keep]
+            # Apply the oldest remaining reading of every incubator first, then the next, and so on.
+            rounds = np.argsort(-from_end, kind='stable')
+            boundaries = np.flatnonzero(np.diff(from_end[rounds])) + 1
+            for selection in np.split(rounds, boundaries):
+                self._step(slots[selection], timestamps[selection], values[selection])
+            self.readings_seen += len(slots)
+
+    def _spread(self, slot, seconds):
+        # Standard deviation of the forecasts `seconds` ahead, from Holt's h-step error variance.
+        steps = np.maximum(seconds / max(self._interval[slot], 1.0), 1.0)
+        alpha, beta = self.alpha, self.beta
+        factor = 1 + alpha ** 2 * ((steps - 1) + beta * steps * (steps - 1)
+                                   + beta ** 2 * (steps - 1) * steps * (2 * steps - 1) / 6)
+        return np.sqrt(np.outer(factor, self._variance[slot])) * (seconds > 0)[:, None]
+
+    def forecast(self, username, points=FORECAST_POINTS):
+        """
+        Forecasts one incubator from its last reading until `horizon` seconds later.
+
+        Parameters:
+            username (str): The incubator's username.
+            points (int): The number of evenly spaced times forecast. Defaults to `FORECAST_POINTS`.
+
+        Returns:
+            dict: The epoch 'timestamp's, and for each measure its forecast values and the
+            band around them, e.g. 'temperature', 'temperature_lower' and 'temperature_upper',
+            all as NumPy arrays; or None if the incubator has fewer than `MIN_READINGS` readings.
+        """
+        with self._lock:
+            slot = self._slots.get(username)
+            if slot is None or self._count[slot] < MIN_READINGS:
+                return None
+            seconds = np.linspace(0, self.horizon, points)
+            mean = self._level[slot] + self._trend[slot] * seconds[:, None]
+            spread = BAND_Z * self._spread(slot, seconds)
+            forecast = {'timestamp': self._last_timestamp[slot] + seconds.astype(np.int64)}
+        for i, measure in enumerate(MEASURES):
+            forecast[measure] = mean[:, i]
+            forecast[f'{measure}_lower'] = mean[:, i] - spread[:, i]
+            forecast[f'{measure}_upper'] = mean[:, i] + spread[:, i]
+        return forecast
+
+    def drifting(self, temperature_range=alerts.TEMPERATURE_RANGE, humidity_range=alerts.HUMIDITY_RANGE):
+        """
+        Finds the incubators forecast to leave their limits within the horizon, for all
+        incubators at once.
+
+        Parameters:
+            temperature_range (tuple): The allowed (minimum, maximum) temperature in °C.
+            humidity_range (tuple): The allowed (minimum, maximum) humidity in %.
+
+        Returns:
+            dict: The forecast (temperature, humidity) at the horizon of each drifting
+            incubator, keyed by username.
+        """
+        limits = np.array([temperature_range, humidity_range], dtype=np.float64)
+        with self._lock:
+            count = len(self._usernames)
+            level, trend = self._level[:count], self._trend[:count]
+            ahead = level + trend * self.horizon
+            inside = (level >= limits[:, 0]) & (level <= limits[:, 1])
+            leaving = inside & ((ahead < limits[:, 0]) | (ahead > limits[:, 1]))
+            drifting = leaving.any(axis=1) & (self._count[:count] >= MIN_READINGS)
+            return {self._usernames[slot]: tuple(float(value) for value in ahead[slot])
+                    for slot in np.flatnonzero(drifting)}
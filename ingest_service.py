@@ -0,0 +1,420 @@
+"""
+The ingestion service, which owns every write of incubator readings.
+
+In the multi-process deployment one ingestion process runs the `IngestionWriter`, the
+data generator, the alert engine and the maintenance scheduler (see maintenance.py), and
+web workers only read the readings. Workers hand readings to the service over a local
+socket with an `IngestClient`, and learn about new readings by long-polling it, so SQLite
+only ever sees one writer of readings. The exception is the 'users' table: workers write
+it themselves when users register or change passwords, which is rare and quick.
+
+Run the service, then start the web workers with the same address and key:
+
+    export EMM_INGEST_AUTHKEY=$(python -c 'import secrets; print(secrets.token_hex(32))')
+    export EMM_SECRET_KEY=$(python -c 'import secrets; print(secrets.token_hex(32))')
+    python ingest_service.py --address 127.0.0.1:6001
+    EMM_INGEST_ADDRESS=127.0.0.1:6001 gunicorn -w 4 'main:create_app()'
+
+Add `--device-port 8081` to also accept readings posted by incubator devices, see
+device_gateway.py.
+
+The address is 'host:port' or the path of a Unix socket. EMM_INGEST_AUTHKEY must be set
+to the same secret in both; connections with another key are refused. Requests are
+pickled, so anyone with the key can run code in the service: there is no default key,
+neither side starts without one, and the service belongs on a local address.
+
+EMM_SECRET_KEY signs login sessions, so every web worker needs the same one, and workers
+refuse to start without it.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import archive
+import device_gateway
+import maintenance
+import metrics
+import schema
+from alerts import AlertEngine
+from data_generator import DataGeneratorThread
+from ingestion import IngestionWriter
+from maintenance import MaintenanceScheduler
+from notifier import ChangeNotifier
+from simulator import ReadingSimulator
+
+DEFAULT_ADDRESS = '127.0.0.1:6001'
+
+""" The shared secret of the service and its clients; there is no default """
+AUTHKEY = os.environ.get('EMM_INGEST_AUTHKEY', '').encode() or None
+
+MIN_AUTHKEY_BYTES = 16
+
+
+def check_authkey(authkey):
+    """
+    Makes sure a key was configured and is not trivially short.
+
+    Parameters:
+        authkey (bytes): The key, or None if EMM_INGEST_AUTHKEY is not set.
+
+    Returns:
+        bytes: The key.
+
+    Raises:
+        ValueError: If the key is missing or shorter than `MIN_AUTHKEY_BYTES`.
+    """
+    if not authkey or len(authkey) < MIN_AUTHKEY_BYTES:
+        raise ValueError(f"Set EMM_INGEST_AUTHKEY to a secret of at least {MIN_AUTHKEY_BYTES} bytes, e.g. "
+                         f"python -c 'import secrets; print(secrets.token_hex(32))'")
+    return authkey
+
+""" Seconds a long poll for new readings waits before returning the current id """
+WAIT_TIMEOUT = 15.0
+
+
+def parse_address(address):
+    """
+    Parses a service address.
+
+    Parameters:
+        address (str): 'host:port', or the path of a Unix socket.
+
+    Returns:
+        tuple or str: A (host, port) tuple, or the socket path.
+    """
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+""" IngestService for accepting readings from web workers over a local socket """
+class IngestService(threading.Thread):
+    """ Requests a client may make, mapped to the name of the method that serves them """
+    METHODS = {
+        'submit': '_submit',
+        'submit_many': '_submit_many',
+        'flush': '_flush',
+        'wait_for': '_wait_for',
+        'recent_alerts': '_recent_alerts',
+        'check_stale': '_check_stale',
+    }
+
+    def __init__(self, writer, alert_engine, address=DEFAULT_ADDRESS, authkey=AUTHKEY):
+        """
+        Initializes a new service. Call `start()` to begin accepting connections.
+
+        Each client connection is served by its own thread, so a worker blocked in a long
+        poll or on a full ingestion queue does not hold up the others.
+
+        Parameters:
+            writer (ingestion.IngestionWriter): Writes the submitted readings.
+            alert_engine (alerts.AlertEngine): Checks the written readings.
+            address (str): 'host:port' or a Unix socket path to listen on.
+            authkey (bytes): The key clients must present. Defaults to EMM_INGEST_AUTHKEY.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: If no key was configured, see `check_authkey`.
+        """
+        super().__init__(name='IngestService', daemon=True)
+        self.writer = writer
+        self.alert_engine = alert_engine
+        self.notifier = ChangeNotifier()
+        self.listener = Listener(parse_address(address), authkey=check_authkey(authkey))
+        self._closed = threading.Event()
+        writer.add_listener(lambda batch, last_id: self.notifier.publish(last_id))
+        writer.add_listener(lambda batch, last_id: alert_engine.process(batch))
+
+    def _submit(self, data, username, block=True, timeout=None):
+        return self.writer.submit(data, username, block, timeout)
+
+    def _submit_many(self, rows, block=True, timeout=None):
+        return self.writer.submit_many(rows, block, timeout)
+
+    def _flush(self, timeout=None):
+        return self.writer.flush(timeout)
+
+    def _wait_for(self, after_id, timeout=WAIT_TIMEOUT):
+        return self.notifier.wait_for(after_id, min(timeout, WAIT_TIMEOUT))
+
+    def _recent_alerts(self, username=None, limit=20):
+        return self.alert_engine.recent(username, limit)
+
+    def _check_stale(self):
+        return self.alert_engine.check_stale()
+
+    def serve_client(self, conn):
+        """
+        Answers one client's requests until it disconnects.
+
+        Requests are (method, args) tuples; replies are ('ok', result) or ('error', message).
+
+        Parameters:
+            conn (multiprocessing.connection.Connection): The client connection.
+
+        Returns:
+            None
+        """
+        try:
+            while True:
+                try:
+                    method, args = conn.recv()
+                except (EOFError, OSError):
+                    break
+                handler = self.METHODS.get(method)
+                if handler is None:
+                    conn.send(('error', f"Unknown method {method!r}."))
+                    continue
+                try:
+                    conn.send(('ok', getattr(self, handler)(*args)))
+                except Exception as e:
+                    logging.error(f"Error serving {method}: {e}")
+                    conn.send(('error', str(e)))
+        finally:
+            conn.close()
+
+    def run(self):
+        """
+        Run method for the IngestService class.
+
+        Returns:
+            None
+        """
+        while True:
+            try:
+                conn = self.listener.accept()
+            except (OSError, AuthenticationError) as e:
+                if self._closed.is_set():
+                    break
+                logging.error(f"Error accepting an ingestion client: {e}")
+                continue
+            threading.Thread(target=self.serve_client, args=(conn,), name='IngestClient', daemon=True).start()
+
+    def close(self):
+        """
+        Stops accepting connections.
+
+        Returns:
+            None
+        """
+        self._closed.set()
+        self.listener.close()
+
+
+""" IngestClient for handing readings to the ingestion service from a web worker """
+class IngestClient:
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=AUTHKEY):
+        """
+        Initializes a client. Connections are opened on first use, one per thread, so a
+        long poll on one thread never delays a submit on another.
+
+        The client offers the producer side of `ingestion.IngestionWriter` (`submit`,
+        `submit_many` and `flush`), so it can stand in for a local writer.
+
+        Parameters:
+            address (str): 'host:port' or the Unix socket path of the service.
+            authkey (bytes): The key the service expects. Defaults to EMM_INGEST_AUTHKEY.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: If no key was configured, see `check_authkey`.
+        """
+        self.address = parse_address(address)
+        self.authkey = check_authkey(authkey)
+        self._local = threading.local()
+
+    def call(self, method, *args):
+        """
+        Sends one request to the service and waits for its reply. A broken connection is
+        reopened once, so a restarted service is picked up again.
+
+        Parameters:
+            method (str): The request, see `IngestService.METHODS`.
+            *args: The request's arguments.
+
+        Returns:
+            object: The reply.
+
+        Raises:
+            ConnectionError: If the service can't be reached.
+            RuntimeError: If the service could not serve the request.
+        """
+        for attempt in (1, 2):
+            conn = getattr(self._local, 'conn', None)
+            try:
+                if conn is None:
+                    conn = self._local.conn = Client(self.address, authkey=self.authkey)
+                conn.send((method, args))
+                status, result = conn.recv()
+                break
+            except AuthenticationError as e:
+                raise ConnectionError(f"Ingestion service refused the key: {e}") from e
+            except (EOFError, OSError) as e:
+                self._local.conn = None
+                if attempt == 2:
+                    raise ConnectionError(f"Ingestion service unavailable: {e}") from e
+        if status != 'ok':
+            raise RuntimeError(result)
+        return result
+
+    def submit(self, data, username, block=True, timeout=None):
+        """
+        Queues a single reading for writing, see `IngestionWriter.submit`.
+
+        Returns:
+            bool: True if the reading was queued, False if the service's queue stayed full.
+        """
+        return self.call('submit', data, username, block, timeout)
+
+    def submit_many(self, rows, block=True, timeout=None):
+        """
+        Queues several readings for writing, see `IngestionWriter.submit_many`.
+
+        Returns:
+            int: The number of readings queued.
+        """
+        return self.call('submit_many', list(rows), block, timeout)
+
+    def flush(self, timeout=None):
+        """
+        Waits until everything queued so far is committed, see `IngestionWriter.flush`.
+
+        Returns:
+            bool: True if everything was committed within `timeout`.
+        """
+        return self.call('flush', timeout)
+
+    def wait_for(self, after_id, timeout=WAIT_TIMEOUT):
+        """
+        Blocks until the service writes a reading id above `after_id`, or until `timeout`,
+        like `notifier.ChangeNotifier.wait_for`.
+
+        Returns:
+            int: The highest reading id written.
+        """
+        return self.call('wait_for', after_id, timeout)
+
+    def recent(self, username=None, limit=20):
+        """
+        Returns the service's most recent alerts, see `AlertEngine.recent`.
+
+        Returns:
+            list: The alerts, newest first.
+        """
+        return self.call('recent_alerts', username, limit)
+
+    def check_stale(self):
+        """
+        Asks the service to check for stale sensors, see `AlertEngine.check_stale`.
+
+        Returns:
+            list: The alerts raised.
+        """
+        return self.call('check_stale')
+
+
+""" ChangeForwarder for republishing the service's new reading ids in a web worker """
+class ChangeForwarder(threading.Thread):
+    def __init__(self, client, notifier):
+        """
+        Initializes a new forwarder. Call `start()` to begin forwarding.
+
+        Parameters:
+            client (IngestClient): The client to long-poll the service with.
+            notifier (notifier.ChangeNotifier): Receives every new reading id.
+
+        Returns:
+            None
+        """
+        super().__init__(name='ChangeForwarder', daemon=True)
+        self.client = client
+        self.notifier = notifier
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """
+        Asks the forwarder to stop after its current poll.
+
+        Returns:
+            None
+        """
+        self._stop_event.set()
+
+    def run(self):
+        """
+        Run method for the ChangeForwarder class.
+
+        Returns:
+            None
+        """
+        while not self._stop_event.is_set():
+            try:
+                self.notifier.publish(self.client.wait_for(self.notifier.latest_id))
+            except (ConnectionError, RuntimeError) as e:
+                logging.error(f"Error waiting for new readings: {e}")
+                self._stop_event.wait(1.0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the process that owns all writes of incubator readings.')
+    parser.add_argument('--address', default=os.environ.get('EMM_INGEST_ADDRESS', DEFAULT_ADDRESS),
+                        help="'host:port' or a Unix socket path to listen on")
+    parser.add_argument('--db', default='users.db', help='the database to write to')
+    parser.add_argument('--incubators', type=int, default=0,
+                        help='simulate this many virtual incubators instead of one reading every 5 seconds')
+    parser.add_argument('--rate', type=float, default=1000.0, help='aggregate simulated readings per second')
+    parser.add_argument('--no-generator', action='store_true', help='only write readings sent by clients')
+    parser.add_argument('--device-port', type=int, default=0,
+                        help='accept readings from incubator devices on this port, see device_gateway.py')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='serve the ingestion metrics for Prometheus on this port')
+    parser.add_argument('--maintenance-interval', type=float,
+                        default=float(os.environ.get('EMM_MAINTENANCE_INTERVAL', maintenance.INTERVAL)),
+                        help='seconds between database maintenance passes, 0 to disable, see maintenance.py')
+    parser.add_argument('--retention', default=os.environ.get('EMM_RETENTION', ''),
+                        help="table=days pairs, or 'default' for the recommended retention; "
+                             "tables not given are kept forever")
+    parser.add_argument('--archive-dir', default=os.environ.get('EMM_ARCHIVE_DIR', archive.DEFAULT_ARCHIVE_DIR),
+                        help="move readings past their retention to this archive directory, '' to delete them")
+    args = parser.parse_args()
+    try:
+        check_authkey(AUTHKEY)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO)
+    connection = sqlite3.connect(args.db)
+    schema.ensure_schema(connection)
+    connection.close()
+
+    writer = IngestionWriter(args.db)
+    service = IngestService(writer, AlertEngine(), args.address)
+    writer.start()
+    service.start()
+    if args.device_port:
+        device_gateway.start_gateway(writer, args.device_port)
+    if args.metrics_port:
+        metrics.Gauge('emm_ingest_queue_depth', 'Readings waiting in the ingestion queue.', writer.queue.qsize)
+        metrics.serve(args.metrics_port)
+    if args.maintenance_interval:
+        MaintenanceScheduler(args.db, maintenance.parse_retention(args.retention), args.archive_dir or None,
+                             args.maintenance_interval).start()
+    if not args.no_generator:
+        simulator = ReadingSimulator(incubators=args.incubators, rate=args.rate) if args.incubators else None
+        DataGeneratorThread(writer, simulator, db_name=args.db).start()
+    print(f"Ingestion service listening on {args.address}. Press Ctrl+C to stop.")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        service.close()
+        writer.stop()
+        print("\nIngestion service stopped.")
@@ -0,0 +1,260 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics
+import rollups
+import schema
+
+""" Times a batch is retried after a transient database error, such as 'database is locked' """
+WRITE_RETRIES = 4
+
+""" Seconds before the first retry; each further retry waits twice as long """
+RETRY_DELAY = 0.5
+
+
+class _FlushMarker:
+    """
+    Control item placed on the ingestion queue by `IngestionWriter.flush`.
+
+    The writer commits everything queued before the marker and then sets `done`;
+    a marker with `stop` set also ends the writer thread.
+    """
+    def __init__(self, stop=False):
+        self.done = threading.Event()
+        self.stop = stop
+
+
+""" IngestionWriter for batching incubator readings into SQLite """
+class IngestionWriter(threading.Thread):
+    def __init__(self, db_name='users.db', batch_size=500, flush_interval=1.0, max_queue=10000,
+                 retries=WRITE_RETRIES, retry_delay=RETRY_DELAY):
+        """
+        Initializes a new ingestion writer. Call `start()` to begin writing.
+
+        Readings are buffered in a bounded in-memory queue and written with `executemany`
+        in a single transaction whenever `batch_size` readings are pending or the oldest
+        pending reading has waited `flush_interval` seconds, whichever comes first.
+
+        Parameters:
+            db_name (str): The database to write to. Defaults to 'users.db'.
+            batch_size (int): Maximum number of readings committed per transaction.
+            flush_interval (float): Maximum seconds a reading waits before it is committed.
+            max_queue (int): Maximum number of readings buffered before producers block.
+            retries (int): Times a batch is retried after a transient database error, for
+                example while maintenance holds the write lock, before it is dropped.
+            retry_delay (float): Seconds before the first retry, doubled for each further one.
+
+        Returns:
+            None
+        """
+        super().__init__(name='IngestionWriter', daemon=True)
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.rows_written = 0
+        self.batches_written = 0
+        self.rows_failed = 0
+        self.listeners = []
+        self.conn = None
+
+    def add_listener(self, listener):
+        """
+        Registers a callback that runs on the writer thread after each committed batch.
+
+        Listeners should return quickly, e.g. by publishing to a `notifier.ChangeNotifier`,
+        because the writer does not drain the queue while they run.
+
+        Parameters:
+            listener (callable): Called with the committed batch and the highest reading id written.
+
+        Returns:
+            None
+        """
+        self.listeners.append(listener)
+
+    def submit(self, data, username, block=True, timeout=None):
+        """
+        Queues a single reading for writing.
+
+        When the queue is full the call blocks until there is room (backpressure), or
+        gives up after `timeout` seconds, or immediately if `block` is False.
+
+        Parameters:
+            data (dict): The reading. It must have keys 'timestamp', 'temperature', and 'humidity'.
+            username (str): The username associated with the reading.
+            block (bool): Whether to wait for room in the queue. Defaults to True.
+            timeout (float): Maximum seconds to wait when blocking. Defaults to no limit.
+
+        Returns:
+            bool: True if the reading was queued, False if the queue stayed full.
+        """
+        row = (username, data['timestamp'], data['temperature'], data['humidity'])
+        try:
+            self.queue.put(row, block, timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def submit_many(self, rows, block=True, timeout=None):
+        """
+        Queues several readings given as (username, timestamp, temperature, humidity) tuples.
+
+        Parameters:
+            rows (iterable): The readings to queue.
+            block (bool): Whether to wait for room in the queue. Defaults to True.
+            timeout (float): Maximum seconds to wait for each reading when blocking.
+
+        Returns:
+            int: The number of readings queued. Fewer than given means the queue stayed full.
+        """
+        queued = 0
+        for row in rows:
+            try:
+                self.queue.put(tuple(row), block, timeout)
+            except queue.Full:
+                break
+            queued += 1
+        return queued
+
+    def flush(self, timeout=None):
+        """
+        Blocks until every reading queued before this call has been committed.
+
+        Parameters:
+            timeout (float): Maximum seconds to wait. Defaults to no limit.
+
+        Returns:
+            bool: True if the readings were committed, False on timeout.
+        """
+        marker = _FlushMarker()
+        self.queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def stop(self, timeout=None):
+        """
+        Commits all queued readings, stops the writer and closes its connection.
+
+        Parameters:
+            timeout (float): Maximum seconds to wait for the writer to finish.
+
+        Returns:
+            None
+        """
+        self.queue.put(_FlushMarker(stop=True))
+        self.join(timeout)
+
+    def connect(self):
+        """
+        Opens the writer's long-lived connection in WAL mode and makes sure the
+        'incubator_readings' table and its rollup tables exist and are current.
+
+        Returns:
+            None
+        """
+        self.conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode = WAL;')
+        self.conn.execute('PRAGMA synchronous = NORMAL;')
+        schema.ensure_schema(self.conn)
+
+    def write_batch(self, batch):
+        """
+        Inserts a batch of readings and updates the rollup tables in a single transaction,
+        then notifies the listeners.
+
+        A transient error such as 'database is locked' is retried with a growing delay. Any
+        other error, or one that outlasts the retries, drops the batch: it is logged and
+        counted, and the writer carries on with the next batch.
+
+        Parameters:
+            batch (list): (username, timestamp, temperature, humidity) tuples.
+
+        Returns:
+            bool: True if the batch was committed, False if it was dropped.
+        """
+        start = time.perf_counter()
+        delay = self.retry_delay
+        attempt = 0
+        while True:
+            try:
+                with self.conn:
+                    self.conn.executemany(schema.INSERT_READING_SQL, batch)
+                    last_id = self.conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+                    rollups.update_rollups(self.conn, batch)
+                break
+            except sqlite3.OperationalError as e:
+                if attempt >= self.retries:
+                    return self._drop(batch, e)
+                attempt += 1
+                metrics.INGEST_WRITE_RETRIES.inc()
+                logging.warning(f"Retrying {len(batch)} readings in {delay:g} s: {e}")
+                time.sleep(delay)
+                delay *= 2
+            except Exception as e:
+                return self._drop(batch, e)
+        self.rows_written += len(batch)
+        self.batches_written += 1
+        metrics.INGEST_FLUSH_SECONDS.observe(time.perf_counter() - start)
+        metrics.INGEST_ROWS.inc(len(batch), ('written',))
+        for listener in self.listeners:
+            try:
+                listener(batch, last_id)
+            except Exception as e:
+                logging.error(f"Error in ingestion listener: {e}")
+        return True
+
+    def _drop(self, batch, error):
+        self.rows_failed += len(batch)
+        metrics.INGEST_ROWS.inc(len(batch), ('failed',))
+        logging.error(f"Error writing {len(batch)} readings, dropped: {error}")
+        return False
+
+    def run(self):
+        """
+        Run method for the IngestionWriter class.
+
+        Drains the queue into batches and commits each batch when it reaches `batch_size`,
+        when `flush_interval` has elapsed since its first reading, or when a flush or stop
+        is requested.
+
+        Returns:
+            None
+        """
+        self.connect()
+        batch = []
+        deadline = None
+        try:
+            while True:
+                wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self.queue.get(timeout=wait)
+                except queue.Empty:
+                    item = None
+
+                if isinstance(item, _FlushMarker):
+                    # The queue is FIFO, so everything submitted before the marker is in `batch`.
+                    if batch:
+                        self.write_batch(batch)
+                        batch, deadline = [], None
+                    item.done.set()
+                    if item.stop:
+                        break
+                    continue
+
+                if item is not None:
+                    if not batch:
+                        deadline = time.monotonic() + self.flush_interval
+                    batch.append(item)
+                if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                    self.write_batch(batch)
+                    batch, deadline = [], None
+        finally:
+            if batch:
+                self.write_batch(batch)
+            self.conn.close()
+            self.conn = None
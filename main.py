@@ -1,72 +1,151 @@
-import hashlib
 import logging
 import os
 import secrets
 import sqlite3
 import string
 import threading
-from datetime import datetime
-import pandas as pd
+import time
+from collections import OrderedDict
 
 import dash
 import dash_bootstrap_components as dbc
-from dash import dcc, html
-import plotly.graph_objs as go
-from dash.dependencies import Input, Output
-from flask import Flask, redirect, render_template, request, session, url_for
-from sqlalchemy import Column, Float, Integer, create_engine, DateTime
+from dash import callback, dash_table, dcc, html
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
+import pandas as pd
+from flask import Flask, Response, g, jsonify, redirect, render_template, request, session, stream_with_context, url_for
+from sqlalchemy import Column, Float, Index, Integer, String, create_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
-import data_generator
+import archive
+import bulk_io
+import device_gateway
+import downsampling
+import fleet
+import maintenance
+import metrics
+import paging
+import passwords
+import ring_buffer
+import rollups
+import schema
+import user_index
+from alerts import AlertEngine
+from data_generator import DataGeneratorThread
+from data_store import ReadingStore
+from db_pool import ConnectionPool
+from figure_cache import FigureCache
+from forecasting import Forecaster
+from ingest_service import ChangeForwarder, IngestClient
+from ingestion import IngestionWriter
+from maintenance import MaintenanceScheduler
+from notifier import ChangeNotifier, RefreshSubscriber
+from simulator import ReadingSimulator
 
 """Flask app setup"""
 app = Flask(__name__, static_url_path='/static', template_folder='templates')
-app.secret_key = os.urandom(24)  # Secret key for session management
+# Secret key for session management. Set EMM_SECRET_KEY when running several web workers,
+# so a session signed by one worker is accepted by the others.
+app.secret_key = os.environ.get('EMM_SECRET_KEY') or os.urandom(24)
 
-"""SQLAlchemy setup"""
-engine = create_engine('sqlite:///users.db', connect_args={'check_same_thread': False})
+# Setup logging
+logging.basicConfig(filename='app.log', level=logging.INFO)
+
+# Set EMM_INGEST_ADDRESS to run as one of several read-only web workers, with all readings
+# written by the ingestion service at that address, EMM_INGEST_AUTHKEY to its key and
+# EMM_SECRET_KEY to the key shared by all workers (see ingest_service.py)
+ingest_address = os.environ.get('EMM_INGEST_ADDRESS')
+
+# Set EMM_ADMIN_USERS to a comma-separated list of the users who may see every incubator on
+# the fleet overview; everyone else sees only their own
+admin_users = {name.strip() for name in os.environ.get('EMM_ADMIN_USERS', '').split(',') if name.strip()}
 
 """SQLAlchemy models"""
 Base = declarative_base()
 
-""" Define IncubatorReadings table """
+""" Define IncubatorReadings table, mirroring schema.READINGS_TABLE_SQL """
 class IncubatorReadings(Base):
     __tablename__ = 'incubator_readings'
+    __table_args__ = (
+        Index('ix_incubator_readings_username_timestamp', 'username', 'timestamp'),
+        Index('ix_incubator_readings_timestamp', 'timestamp'),
+    )
     id = Column(Integer, primary_key=True)
-    timestamp = Column(DateTime, default=datetime.now)
-    temperature = Column(Float)
-    humidity = Column(Float)
-
-# Create tables if they don't exist
-Base.metadata.create_all(engine)
-
-# Create a session
-Session = sessionmaker(bind=engine)
-db_session = Session()
-
-df = pd.read_sql_query('SELECT * FROM incubator_readings', engine)
-
-# Setup logging
-logging.basicConfig(filename='app.log', level=logging.INFO)
+    username = Column(String, nullable=False)
+    timestamp = Column(Integer, nullable=False, default=lambda: int(time.time()))
+    temperature = Column(Float, nullable=False)
+    humidity = Column(Float, nullable=False)
+
+Session = sessionmaker()
+
+# Published to by the ingestion writer after each batch, and by the reading store after each refresh
+ingest_notifier = ChangeNotifier()
+live_notifier = ChangeNotifier()
+
+# Figures built by `update_graph`, reused until newer readings arrive
+figure_cache = FigureCache()
+
+# Set up by `create_app`, so importing this module opens no database and starts no threads
+engine = None
+db_session = None
+reading_archive = None
+reading_store = None
+ingest_client = None
+alert_engine = None
+forecaster = None
+retention = None
+fleet_overview = None
+user_manager = None
+dash_app = None
+ingestion_writer = None
+_app_lock = threading.Lock()
 
 """ UserManagement class for user registration, login, and password reset """
 class UserManagement:
-    def __init__(self, db_name='users.db'):
+    CREATE_USERS_SQL = '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        );
+    '''
+    INSERT_USER_SQL = 'INSERT INTO users (username, password) VALUES (?, ?)'
+    SELECT_PASSWORD_SQL = 'SELECT password FROM users WHERE username = ?'
+    UPDATE_PASSWORD_SQL = 'UPDATE users SET password = ? WHERE username = ?'
+
+    def __init__(self, db_name='users.db', pool_size=8, cache_size=1024, cache_ttl=60.0, hasher=None):
         """
         Initializes a new instance of the class.
 
+        One instance is meant to be shared by all request threads: it owns a pool of
+        configured SQLite connections and a small cache of stored password hashes.
+        Passwords are hashed with scrypt on the hasher's bounded worker pool.
+
         Parameters:
             db_name (str): The name of the database to connect to. Defaults to 'users.db'.
+            pool_size (int): Maximum number of pooled connections. Defaults to 8.
+            cache_size (int): Maximum number of cached user lookups. Defaults to 1024.
+            cache_ttl (float): Seconds a cached lookup stays valid. Defaults to 60.
+            hasher (passwords.PasswordHasher): Hashes and verifies passwords. Defaults to
+                the process-wide hasher.
 
         Returns:
             None
         """
         self.db_name = db_name
+        self.hasher = hasher or passwords.get_hasher()
+        self.pool = ConnectionPool(db_name, size=pool_size)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._user_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
         self.create_table()
 
-    def connect(self):
+    def create_table(self):
         """
-        Connects to the SQLite database specified by `db_name`.
+        Creates a new table 'users' in the database if it doesn't already exist.
+        The table has columns 'id' as INTEGER PRIMARY KEY AUTOINCREMENT,
+        'username' as TEXT UNIQUE NOT NULL, and 'password' as TEXT NOT NULL.
 
         Parameters:
             self (object): The instance of the class.
@@ -74,17 +153,17 @@ class UserManagement:
         Returns:
             None
         """
+        # Runs whether or not the file exists: create_app writes the readings schema first,
+        # so a fresh database file already exists by the time users are set up.
         try:
-            self.conn = sqlite3.connect(self.db_name)
-            self.conn.execute('PRAGMA foreign_keys = ON;')
+            with self.pool.connection() as conn:
+                conn.execute(self.CREATE_USERS_SQL)
         except sqlite3.Error as e:
-            logging.error(f"Error connecting to database: {e}")
+            logging.error(f"Error creating table: {e}")
 
-    def create_table(self):
+    def close(self):
         """
-        Creates a new table 'users' in the database if it doesn't already exist.
-        The table has columns 'id' as INTEGER PRIMARY KEY AUTOINCREMENT,
-        'username' as TEXT UNIQUE NOT NULL, and 'password' as TEXT NOT NULL.
+        Closes the pooled connections to the database.
 
         Parameters:
             self (object): The instance of the class.
@@ -92,36 +171,47 @@ class UserManagement:
         Returns:
             None
         """
-        if not os.path.exists(self.db_name):
-            try:
-                self.connect()
-                self.conn.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        username TEXT UNIQUE NOT NULL,
-                        password TEXT NOT NULL
-                    );
-                ''')
-                logging.info("Database tables created successfully.")
-            except sqlite3.Error as e:
-                logging.error(f"Error creating table: {e}")
-            finally:
-                self.close()
+        self.pool.close()
 
-    def close(self):
+    def cached_password(self, username):
         """
-        Closes the connection to the database if it is open.
+        Returns the stored password hash of a user, from the cache when possible.
 
-        This function checks if the 'conn' attribute exists and is not None. If it is, the connection is closed.
+        Parameters:
+            username (str): The username to look up.
+
+        Returns:
+            str: The stored password, or None if the user does not exist.
+        """
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._user_cache.get(username)
+            if entry is not None and entry[1] > now:
+                self._user_cache.move_to_end(username)
+                return entry[0]
+        with metrics.SQL_QUERY_SECONDS.time(('user_password',)), self.pool.connection() as conn:
+            row = conn.execute(self.SELECT_PASSWORD_SQL, (username,)).fetchone()
+        if row is None:
+            return None
+        with self._cache_lock:
+            self._user_cache[username] = (row[0], now + self.cache_ttl)
+            self._user_cache.move_to_end(username)
+            if len(self._user_cache) > self.cache_size:
+                self._user_cache.popitem(last=False)
+        return row[0]
+
+    def invalidate_user(self, username):
+        """
+        Drops a user from the lookup cache after their password changes.
 
         Parameters:
-            self (object): The instance of the class.
+            username (str): The username to drop.
 
         Returns:
             None
         """
-        if hasattr(self, 'conn') and self.conn:
-            self.conn.close()
+        with self._cache_lock:
+            self._user_cache.pop(username, None)
 
     def register(self, username, password):
         """
@@ -133,18 +223,17 @@ class UserManagement:
 
         Returns:
             bool: True if the user is successfully registered, False otherwise.
+
+        Raises:
+            passwords.HasherBusy: If too many passwords are being hashed to take this one.
         """
         try:
-            self.connect()
-            salt = secrets.token_hex(8)  # Generate a random salt
-            hashed_password = self.hash_password(password, salt)  # Hash password with salt
-            hashed_password_with_salt = f"{hashed_password}:{salt}"  # Combine hashed password and salt
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT INTO users (username, password)
-                VALUES (?, ?)
-            ''', (username, hashed_password_with_salt))  # Pass hashed password with salt to the database
-            self.conn.commit()
+            hashed_password = self.hasher.hash(password)
+            with metrics.SQL_QUERY_SECONDS.time(('user_insert',)), self.pool.connection() as conn:
+                with conn:
+                    conn.execute(self.INSERT_USER_SQL, (username, hashed_password))
+            self.invalidate_user(username)
+            user_index.mark_stale(self.db_name)
             logging.info("Registration successful.")
             return True
         except sqlite3.IntegrityError:
@@ -153,30 +242,31 @@ class UserManagement:
         except sqlite3.Error as e:
             logging.error(f"Error registering user: {e}")
             return False
-        finally:
-            self.close()
 
     def login(self, username, password):
         """
         Logs a user into the system with the provided username and password.
 
+        A password stored as a legacy SHA-256 hash, or with another scrypt cost, is rehashed
+        with the current settings once it has been checked.
+
         Parameters:
             username (str): The username of the user.
             password (str): The password of the user.
 
         Returns:
             bool: True if the login is successful, False otherwise.
+
+        Raises:
+            passwords.HasherBusy: If too many passwords are being checked to take this one.
         """
         try:
-            self.connect()
-            cursor = self.conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-            user = cursor.fetchone()
-            if user:
-                stored_password_with_salt = user[2]
-                stored_password_hash, salt = stored_password_with_salt.split(':')
-                hashed_password = self.hash_password(password, salt)
-                if hashed_password == stored_password_hash:
+            stored_password = self.cached_password(username)
+            if stored_password:
+                matches, needs_rehash = self.hasher.verify(password, stored_password)
+                if matches:
+                    if needs_rehash:
+                        self.rehash_password(username, password)
                     logging.info("Login successful.")
                     return True
             logging.warning("Incorrect username or password. Please try again.")
@@ -184,8 +274,6 @@ class UserManagement:
         except sqlite3.Error as e:
             logging.error(f"Error logging in: {e}")
             return False
-        finally:
-            self.close()
 
     def reset_password(self, username):
         """
@@ -198,24 +286,51 @@ class UserManagement:
             bool: True if the password reset was successful, False otherwise.
         """
         try:
-            self.connect()
-            cursor = self.conn.cursor()
             new_password = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(10))
-            cursor.execute('''
-                UPDATE users SET password = ? WHERE username = ?
-            ''', (self.hash_password(new_password), username))
-            self.conn.commit()
+            hashed_password = self.hasher.hash(new_password)
+            with self.pool.connection() as conn:
+                with conn:
+                    cursor = conn.execute(self.UPDATE_PASSWORD_SQL, (hashed_password, username))
+            self.invalidate_user(username)
+            if cursor.rowcount == 0:
+                logging.warning(f"Password reset failed: no user {username}.")
+                return False
             logging.info(f"Password reset successful for user {username}. New password: {new_password}")
             return True
         except sqlite3.Error as e:
             logging.error(f"Error resetting password: {e}")
             return False
-        finally:
-            self.close()
+
+    def rehash_password(self, username, password):
+        """
+        Replaces a user's stored hash with one made with the current scrypt settings.
+
+        The login has already succeeded, so if the hasher is busy or the update fails the
+        old hash is kept and the upgrade is tried again on a later login.
+
+        Parameters:
+            username (str): The username of the user.
+            password (str): The password the user just logged in with.
+
+        Returns:
+            bool: True if the stored hash was replaced, False otherwise.
+        """
+        try:
+            hashed_password = self.hasher.hash(password)
+            with self.pool.connection() as conn:
+                with conn:
+                    conn.execute(self.UPDATE_PASSWORD_SQL, (hashed_password, username))
+        except (passwords.HasherBusy, sqlite3.Error) as e:
+            logging.warning(f"Could not rehash the password of {username}: {e}")
+            return False
+        self.invalidate_user(username)
+        logging.info(f"Rehashed the password of {username} with scrypt.")
+        return True
 
     def hash_password(self, password, salt):
         """
-        Hashes a password using the SHA256 algorithm and a given salt.
+        Hashes a password using the SHA256 algorithm and a given salt, the way passwords were
+        stored before scrypt. Only used to check those legacy 'hash:salt' entries.
 
         :param password: The password to be hashed.
         :type password: str
@@ -224,26 +339,42 @@ class UserManagement:
         :return: The hashed password.
         :rtype: str
         """
-        hashed_password = hashlib.sha256((password + salt).encode()).hexdigest()
-        return hashed_password
+        return passwords.legacy_hash(password, salt)
 
 
-""" DataGeneratorThread for generating data in the background """
-class DataGeneratorThread(threading.Thread):
-    def run(self):
-        """
-        Run method for the DataGeneratorThread class.
 
-        This method is responsible for executing the data generation process.
-        It calls the `generate_data` function from the `data_generator` module.
+""" Request timing hooks """
+@app.before_request
+def start_request_timer():
+    """
+    Notes when the request started, for `record_request_time`.
 
-        Parameters:
-            self (DataGeneratorThread): The instance of the DataGeneratorThread class.
+    Returns:
+        None
+    """
+    g.request_start = time.perf_counter()
 
-        Returns:
-            None
-        """
-        data_generator.generate_data()
+
+@app.after_request
+def record_request_time(response):
+    """
+    Records how long the request took in the per-route latency histogram.
+
+    Requests are labelled with their route pattern rather than their path, so '/dash/...'
+    asset requests and unknown paths don't create a series each.
+
+    Args:
+        response (flask.Response): The response being sent.
+
+    Returns:
+        flask.Response: The same response.
+    """
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                             (route, request.method, str(response.status_code)))
+    return response
 
 
 """ Landing page route """
@@ -288,7 +419,7 @@ def register():
 
     This function is a route handler for the '/register' endpoint, which is accessed via the POST method. It expects the request to contain a 'username' and a 'password' field. If either of these fields is missing, it returns an error message indicating that all required fields must be filled out.
 
-    If both fields are present, it creates a new instance of the UserManagement class and calls its register method with the provided username and password. If the registration is successful, it redirects the user to the login form page. If the registration fails, it returns an error message indicating that the user should try again.
+    If both fields are present, it calls the register method of the shared UserManagement instance with the provided username and password. If the registration is successful, it redirects the user to the login form page. If the registration fails, it returns an error message indicating that the user should try again.
 
     Parameters:
         None
@@ -297,13 +428,16 @@ def register():
         - If the registration is successful, it redirects the user to the login form page.
         - If the registration fails, it returns an error message indicating that the user should try again.
         - If any required fields are missing, it returns an error message indicating that all required fields must be filled out.
+        - If too many passwords are being hashed, a 503 error with a Retry-After header.
     """
     username = request.form.get('username')
     password = request.form.get('password')
     if not (username and password):
         return "Registration failed. Please fill out all required fields."
-    user_manager = UserManagement()
-    success = user_manager.register(username, password)
+    try:
+        success = user_manager.register(username, password)
+    except passwords.HasherBusy as e:
+        return "Registration is busy. Please try again in a moment.", 503, {'Retry-After': str(e.retry_after)}
     if success:
         return redirect(url_for('login_form'))
     else:
@@ -318,7 +452,7 @@ def login():
 
     This function is a route handler for the '/login' endpoint, which is accessed via the POST method. It expects the request to contain a 'username' and a 'password' field. If either of these fields is missing, it returns an error message indicating that all required fields must be filled out.
 
-    If both fields are present, it creates a new instance of the UserManagement class and calls its login method with the provided username and password. If the login is successful, it sets the 'username' in the session and redirects the user to the profile page. If the login fails, it redirects the user to the login form page.
+    If both fields are present, it calls the login method of the shared UserManagement instance with the provided username and password. If the login is successful, it sets the 'username' in the session and redirects the user to the profile page. If the login fails, it redirects the user to the login form page.
 
     Parameters:
         None
@@ -327,13 +461,16 @@ def login():
         - If the login is successful, it redirects the user to the profile page.
         - If the login fails, it redirects the user to the login form page.
         - If any required fields are missing, it returns an error message indicating that all required fields must be filled out.
+        - If too many passwords are being checked, a 503 error with a Retry-After header.
     """
     username = request.form.get('username')
     password = request.form.get('password')
     if not (username and password):
         return "Login failed. Please provide username and password."
-    user_manager = UserManagement()
-    success = user_manager.login(username, password)
+    try:
+        success = user_manager.login(username, password)
+    except passwords.HasherBusy as e:
+        return "Login is busy. Please try again in a moment.", 503, {'Retry-After': str(e.retry_after)}
     if success:
         session['username'] = username
         return redirect(url_for('profile'))
@@ -347,22 +484,236 @@ def profile():
     """
     Route decorator for the profile page of the web application.
 
-    This function is a route handler for the '/profile' endpoint. It checks if the 'username' is present in the session. If it is, it retrieves the username from the session and renders the 'profile.html' template with the username as a parameter. If the 'username' is not present in the session, it redirects the user to the login form page.
+    This function is a route handler for the '/profile' endpoint. It checks if the 'username' is present in the session. If it is, it retrieves the username from the session and renders the 'profile.html' template with the username and the user's recent incubator alerts. If the 'username' is not present in the session, it redirects the user to the login form page.
 
     Parameters:
         None
 
     Returns:
-        - If the 'username' is present in the session, it renders the 'profile.html' template with the username as a parameter.
+        - If the 'username' is present in the session, it renders the 'profile.html' template with the username and alerts as parameters.
         - If the 'username' is not present in the session, it redirects the user to the login form page.
     """
     if 'username' in session:
         username = session['username']
-        return render_template('profile.html', username=username)
+        alert_engine.check_stale()
+        alerts = alert_engine.recent(username)
+        return render_template('profile.html', username=username, alerts=alerts)
     else:
         return redirect(url_for('login_form'))
 
 
+""" Live readings stream route """
+@app.route('/api/readings/stream')
+def stream_readings():
+    """
+    Streams new readings to the client as Server-Sent Events.
+
+    This function is a route handler for the '/api/readings/stream' endpoint. Each event carries the logged-in user's readings added since the previous one as a JSON list, and its id is the highest reading id sent, so a reconnecting client resumes through the 'Last-Event-ID' header. Readings come from the shared reading store, which one server-side subscriber refreshes per ingested batch, so an idle stream only waits on a condition variable and sends a keep-alive comment every 15 seconds.
+
+    Parameters:
+        None
+
+    Returns:
+        - If the 'username' is present in the session, a 'text/event-stream' response.
+        - If the 'username' is not present in the session, a 401 error.
+    """
+    if 'username' not in session:
+        return jsonify(error="Login required."), 401
+    username = session['username']
+    after_id = request.headers.get('Last-Event-ID', request.args.get('after'))
+    if after_id and after_id.isdigit():
+        after_id = int(after_id)
+    else:
+        # Start after the newest reading, loading the store if no dashboard has yet.
+        after_id = reading_store.load()
+
+    def events(after_id):
+        while True:
+            latest_id = live_notifier.wait_for(after_id, timeout=15)
+            if latest_id <= after_id:
+                yield ': keep-alive\n\n'
+                continue
+            rows = reading_store.since(after_id, limit=1000, username=username)
+            if rows.empty:
+                after_id = latest_id
+                continue
+            after_id = int(rows['id'].iloc[-1])
+            yield f"id: {after_id}\ndata: {rows.to_json(orient='records')}\n\n"
+
+    return Response(stream_with_context(events(after_id)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+""" Bulk readings import route """
+@app.route('/api/readings/import', methods=['POST'])
+def import_readings():
+    """
+    Imports readings from an uploaded CSV or NDJSON file.
+
+    This function is a route handler for the '/api/readings/import' endpoint. The file is sent either as the raw request body or as the 'file' field of a multipart form, and its format is taken from the 'format' argument, the file name or the content type. It is parsed line by line and inserted in transactions of `bulk_io.IMPORT_BATCH_SIZE` readings, so uploads of any size are imported with constant memory, and each committed batch is checked by the alert engine like readings from the ingestion writer. Every row is imported for the logged-in user, whatever username the file gives it, and rows that cannot be parsed or stored are counted as rejected.
+
+    Parameters:
+        None
+
+    Returns:
+        - If the 'username' is present in the session, a JSON summary with the 'imported' and 'rejected' counts.
+        - If the format is not recognised, a 400 error.
+        - If the 'username' is not present in the session, a 401 error.
+    """
+    if 'username' not in session:
+        return jsonify(error="Login required."), 401
+    upload = request.files.get('file')
+    stream = upload.stream if upload is not None else request.stream
+    name = upload.filename if upload is not None else ''
+    content_type = upload.mimetype if upload is not None else request.mimetype
+    file_format = request.args.get('format')
+    if file_format is None:
+        if name.endswith(('.ndjson', '.jsonl')) or 'json' in content_type:
+            file_format = 'ndjson'
+        elif name.endswith('.csv') or 'csv' in content_type:
+            file_format = 'csv'
+    if file_format not in bulk_io.FORMATS:
+        return jsonify(error=f"Unsupported format, use one of {', '.join(bulk_io.FORMATS)}."), 400
+
+    parse = bulk_io.parse_csv if file_format == 'csv' else bulk_io.parse_ndjson
+    # Users import only their own readings, whatever usernames the file holds.
+    rows = parse(stream, username=session['username'])
+    if ingest_client is not None:
+        # Read-only web workers hand the readings to the ingestion service.
+        try:
+            imported, rejected = bulk_io.submit_readings(ingest_client, rows)
+        except (ConnectionError, RuntimeError) as e:
+            logging.error(f"Error importing readings: {e}")
+            return jsonify(error="Import failed."), 503
+        return jsonify(imported=imported, rejected=rejected)
+    # Imported batches are checked for alerts and published like the ingestion writer's; imported
+    # history only moves the alert engine's state forward and raises nothing, see AlertEngine.process.
+    listeners = (lambda batch, last_id: alert_engine.process(batch),
+                 lambda batch, last_id: ingest_notifier.publish(last_id))
+    conn = engine.raw_connection()
+    try:
+        imported, rejected, _ = bulk_io.import_readings(conn, rows, listeners=listeners)
+    except sqlite3.Error as e:
+        logging.error(f"Error importing readings: {e}")
+        return jsonify(error="Import failed."), 500
+    finally:
+        conn.close()
+    return jsonify(imported=imported, rejected=rejected)
+
+
+""" Streaming readings export route """
+@app.route('/api/readings/export')
+def export_readings():
+    """
+    Streams readings as CSV or NDJSON.
+
+    This function is a route handler for the '/api/readings/export' endpoint. Only the logged-in user's readings are exported. The optional 'start' and 'end' arguments limit the time range (epoch seconds or UTC timestamps), and 'format' picks 'csv' (the default) or 'ndjson'. Archived days are read first, a day at a time, then the database in chunks of `bulk_io.EXPORT_CHUNK_SIZE` rows, so exports of any size stream with constant memory.
+
+    Parameters:
+        None
+
+    Returns:
+        - If the 'username' is present in the session, a streamed 'text/csv' or 'application/x-ndjson' attachment.
+        - If an argument is invalid, a 400 error.
+        - If the 'username' is not present in the session, a 401 error.
+    """
+    if 'username' not in session:
+        return jsonify(error="Login required."), 401
+    file_format = request.args.get('format', 'csv')
+    if file_format not in bulk_io.FORMATS:
+        return jsonify(error=f"Unsupported format, use one of {', '.join(bulk_io.FORMATS)}."), 400
+    try:
+        start, end = (request.args.get(name) for name in ('start', 'end'))
+        start = schema.to_epoch(int(start) if start.isdigit() else start) if start else None
+        end = schema.to_epoch(int(end) if end.isdigit() else end) if end else None
+    except ValueError:
+        return jsonify(error="Invalid start or end."), 400
+    username = session['username']
+
+    def rows():
+        archived_until = reading_archive.archived_until() if reading_archive is not None else None
+        if archived_until is not None and (start is None or start < archived_until):
+            yield from bulk_io.iter_archived(reading_archive, start, end, username)
+        conn = engine.raw_connection()
+        try:
+            yield from bulk_io.iter_readings(conn, start, end, username)
+        finally:
+            conn.close()
+
+    encode = bulk_io.csv_chunks if file_format == 'csv' else bulk_io.ndjson_chunks
+    mimetype = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(encode(rows())), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=readings.{file_format}'})
+
+
+""" Fleet overview routes """
+def fleet_scope():
+    """
+    Returns whose incubators the logged-in user may see on the fleet overview.
+
+    Returns:
+        str: The user's own username, or None for the users in EMM_ADMIN_USERS, who see every incubator.
+    """
+    username = session['username']
+    return None if username in admin_users else username
+
+
+@app.route('/fleet')
+def fleet_page():
+    """
+    Route decorator for the fleet overview page of the web application.
+
+    This function is a route handler for the '/fleet' endpoint. It renders the 'fleet.html' template with one tile per incubator that reported since yesterday, of every user for the admins listed in EMM_ADMIN_USERS and of the logged-in user's own incubator otherwise: its latest reading, the last hour's minimum and maximum temperature and humidity, and its health, stale, alert, warning, drifting or ok. The tiles come from `fleet.FleetOverview`, which computes all of them in one grouped query and reuses the result for `fleet.REFRESH_SECONDS`, and the page reloads itself at that interval.
+
+    Parameters:
+        None
+
+    Returns:
+        - If the 'username' is present in the session, it renders the 'fleet.html' template with the fleet summary.
+        - If the 'username' is not present in the session, it redirects the user to the login form page.
+    """
+    if 'username' not in session:
+        return redirect(url_for('login_form'))
+    return render_template('fleet.html', fleet=fleet_overview.summary(username=fleet_scope()),
+                           refresh_seconds=int(fleet.REFRESH_SECONDS))
+
+
+@app.route('/api/fleet')
+def fleet_summary():
+    """
+    Returns the fleet overview as JSON.
+
+    This function is a route handler for the '/api/fleet' endpoint. It returns the same summary as the fleet page, scoped the same way to the logged-in user unless they are an admin: the 'incubators' tiles, the 'counts' of incubators per health status and the epoch seconds the summary was 'generated' at.
+
+    Parameters:
+        None
+
+    Returns:
+        - If the 'username' is present in the session, the summary as JSON.
+        - If the 'username' is not present in the session, a 401 error.
+    """
+    if 'username' not in session:
+        return jsonify(error="Login required."), 401
+    return jsonify(fleet_overview.summary(username=fleet_scope()))
+
+
+""" Metrics route """
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Serves the application's metrics for Prometheus.
+
+    This function is a route handler for the '/metrics' endpoint. It renders request latencies per route, Dash callback timings, database query durations and row counts, and the ingestion queue depth and flush latency, in the Prometheus text format. Each process reports its own metrics.
+
+    Parameters:
+        None
+
+    Returns:
+        A 'text/plain' response in the Prometheus exposition format.
+    """
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.route('/logout', methods=['POST'])
 def logout():
     """
@@ -377,38 +728,253 @@ def logout():
     session.pop('username', None)
     return redirect(url_for('landing'))
 
-""" Dash app initialization """
-dash_app = dash.Dash(__name__, server=app, external_stylesheets=[dbc.themes.BOOTSTRAP])
-
 """ Dash layout and callbacks """
-dash_app.layout = dbc.Container([
-    html.Div([
-        dcc.Dropdown(
-            id='graph-type-dropdown',
-            options=[
-                {'label': 'Bar Graph', 'value': 'bar'},
-                {'label': 'Line Graph', 'value': 'line'},
-                {'label': 'Table Graph', 'value': 'table'}
-            ],
-            value='bar'
-        ),
-        dcc.Graph(id='incubator-graph')
+def dashboard_layout():
+    """
+    Builds the layout of the dashboard.
+
+    Returns:
+        dash_bootstrap_components.Container: The graph and table views and their controls.
+    """
+    return dbc.Container([
+        html.Div([
+            dcc.Dropdown(
+                id='graph-type-dropdown',
+                options=[
+                    {'label': 'Bar Graph', 'value': 'bar'},
+                    {'label': 'Line Graph', 'value': 'line'},
+                    {'label': 'Table Graph', 'value': 'table'}
+                ],
+                value='bar'
+            ),
+            dcc.Dropdown(
+                id='time-range-dropdown',
+                options=[
+                    {'label': 'Latest Readings', 'value': 0},
+                    {'label': 'Last Hour', 'value': 3600},
+                    {'label': 'Last 24 Hours', 'value': 86400},
+                    {'label': 'Last 7 Days', 'value': 7 * 86400},
+                    {'label': 'Last 30 Days', 'value': 30 * 86400},
+                    {'label': 'Last Year', 'value': 365 * 86400}
+                ],
+                value=0,
+                clearable=False
+            ),
+            html.Div(id='graph-container', children=[dcc.Graph(id='incubator-graph')]),
+            dcc.Interval(id='live-interval', interval=2000),
+            dcc.Store(id='figure-reading-id'),
+            dcc.Store(id='extended-reading-id'),
+            html.Div(id='table-container', style={'display': 'none'}, children=[
+                dash_table.DataTable(
+                    id='readings-table',
+                    columns=[{'name': name, 'id': column} for column, name in zip(
+                        paging.TABLE_COLUMNS, ['ID', 'User', 'Timestamp (UTC)', 'Temperature (°C)', 'Humidity'])],
+                    page_current=0,
+                    page_size=25,
+                    page_action='custom',
+                    sort_action='custom',
+                    sort_mode='single',
+                    sort_by=[],
+                    filter_action='custom',
+                    filter_query=''
+                )
+            ])
+        ])
     ])
-])
 
-@dash_app.callback(
-    Output('incubator-graph', 'figure'),
+
+@callback(
+    [Output('graph-container', 'style'),
+     Output('table-container', 'style')],
     [Input('graph-type-dropdown', 'value')]
 )
-def update_graph(graph_type):
+def toggle_view(graph_type):
+    """
+    Callback function for showing either the graph or the paged readings table.
+
+    Args:
+        graph_type (str): The selected graph type. 'table' shows the table, anything else the graph.
+
+    Returns:
+        tuple: The styles of the graph container and the table container.
+    """
+    hidden = {'display': 'none'}
+    if graph_type == 'table':
+        return hidden, {}
+    return {}, hidden
+
+
+@callback(
+    [Output('readings-table', 'data'),
+     Output('readings-table', 'page_count')],
+    [Input('readings-table', 'page_current'),
+     Input('readings-table', 'page_size'),
+     Input('readings-table', 'sort_by'),
+     Input('readings-table', 'filter_query'),
+     Input('graph-type-dropdown', 'value')]
+)
+@metrics.timed(metrics.DASH_CALLBACK_SECONDS, ('update_table',))
+def update_table(page_current, page_size, sort_by, filter_query, graph_type):
+    """
+    Callback function for loading the visible page of the readings table.
+
+    Sorting, filtering and paging are done in SQL so only one page is sent to the browser,
+    however many readings are stored; paging on in time order seeks through the index from
+    the previous page, see `paging.fetch_page`. Only the logged-in user's readings are listed.
+
+    Args:
+        page_current (int): The zero-based page number.
+        page_size (int): The number of readings per page.
+        sort_by (list): The table's sort_by, e.g. [{'column_id': 'temperature', 'direction': 'asc'}].
+        filter_query (str): The table's filter_query, e.g. '{temperature} > 37'.
+        graph_type (str): The selected graph type. Nothing is loaded unless it is 'table'.
+
+    Returns:
+        tuple: The rows of the page as a list of dicts, and the total number of pages.
+    """
+    username = session.get('username')
+    if graph_type != 'table' or username is None:
+        raise PreventUpdate
+    conn = engine.raw_connection()
+    try:
+        return paging.fetch_page(conn, page_current or 0, page_size, sort_by, filter_query, username)
+    finally:
+        conn.close()
+
+def zoom_range(relayout_data):
+    """
+    Extracts the x-axis range the user zoomed to from a graph's relayoutData.
+
+    Args:
+        relayout_data (dict): The relayoutData of the graph, or None before any interaction.
+
+    Returns:
+        tuple: The (start, end) timestamps as strings, or None when the graph is not zoomed.
+    """
+    if not relayout_data:
+        return None
+    start = relayout_data.get('xaxis.range[0]')
+    end = relayout_data.get('xaxis.range[1]')
+    if start is None and relayout_data.get('xaxis.range'):
+        start, end = relayout_data['xaxis.range']
+    if start is None or end is None:
+        return None
+    return str(start), str(end)
+
+
+def readings_between(start, end, username):
+    """
+    Loads one user's readings of a time range at the coarsest resolution that still fills the graph.
+
+    Long ranges are read from the 1-minute, 1-hour or 1-day rollup tables, which hold one
+    row per bucket, skipping any rollup the maintenance scheduler has already pruned at the
+    start of the range; short ranges fall back to the raw readings, in the database or the archive.
+    Both are keyed by username, so only the user's own rows are read.
+
+    Args:
+        start (str or int): The start of the range, as a timestamp string or epoch seconds.
+        end (str or int): The end of the range, as a timestamp string or epoch seconds.
+        username (str): The user whose readings to load.
+
+    Returns:
+        pandas.DataFrame: Readings or rollup buckets with epoch 'timestamp', 'temperature' and 'humidity' columns.
+    """
+    start, end = schema.to_epoch(start), schema.to_epoch(end)
+    conn = engine.raw_connection()
+    try:
+        frame = rollups.query_range(conn, start, end, username, retention=retention)
+    finally:
+        conn.close()
+    if frame is None:
+        frame = reading_store.between(start, end, columns=['timestamp', 'temperature', 'humidity'], username=username)
+    return frame
+
+
+def downsampled_trace(df, column, name, trace_type, method):
+    """
+    Builds a graph trace for one column, reduced to about `downsampling.DEFAULT_POINTS` points.
+
+    Args:
+        df (pandas.DataFrame or ring_buffer.ReadingWindow): The readings to plot.
+        column (str): The column to plot against 'timestamp'.
+        name (str): The name of the data series.
+        trace_type (str): The type of the data series.
+        method (str): The downsampling method, 'lttb' or 'minmax'.
+
+    Returns:
+        dict: The trace with 'x', 'y', 'name' and 'type' keys.
+    """
+    sampled = downsampling.downsample_frame(df, column, method=method)
+    return {'x': pd.to_datetime(sampled['timestamp'], unit='s'), 'y': ring_buffer.widen(sampled[column]),
+            'name': name, 'type': trace_type}
+
+
+def forecast_traces(username):
+    """
+    Builds the forecast traces of the line graph: for temperature and humidity, the lower
+    and upper edges of the forecast band, filled between, and the forecast itself.
+
+    Args:
+        username (str): The incubator to forecast.
+
+    Returns:
+        list: Six traces, with empty 'x' and 'y' while the incubator has too few readings
+        to be forecast.
+    """
+    forecast = forecaster.forecast(username)
+    x = pd.to_datetime(forecast['timestamp'], unit='s') if forecast is not None else []
+    traces = []
+    for measure, name in (('temperature', 'Temperature (°C)'), ('humidity', 'Humidity')):
+        lower, upper, mean = ((forecast[f'{measure}_lower'], forecast[f'{measure}_upper'], forecast[measure])
+                              if forecast is not None else ([], [], []))
+        traces.extend([
+            {'x': x, 'y': lower, 'name': f'{name} forecast range', 'type': 'scatter', 'mode': 'lines',
+             'line': {'width': 0}, 'showlegend': False, 'hoverinfo': 'skip'},
+            {'x': x, 'y': upper, 'name': f'{name} forecast range', 'type': 'scatter', 'mode': 'lines',
+             'line': {'width': 0}, 'fill': 'tonexty', 'showlegend': False},
+            {'x': x, 'y': mean, 'name': f'{name} forecast', 'type': 'scatter', 'mode': 'lines',
+             'line': {'dash': 'dash'}},
+        ])
+    return traces
+
+
+@callback(
+    [Output('incubator-graph', 'figure'),
+     Output('figure-reading-id', 'data')],
+    [Input('graph-type-dropdown', 'value'),
+     Input('time-range-dropdown', 'value'),
+     Input('incubator-graph', 'relayoutData')]
+)
+@metrics.timed(metrics.DASH_CALLBACK_SECONDS, ('update_graph',))
+def update_graph(graph_type, time_range=0, relayout_data=None):
     """
     Callback function for updating the graph based on the selected graph type.
 
+    Only the logged-in user's readings are shown: the latest readings are a zero-copy view of
+    their window in the reading store, and ranges from the rollups and readings indexed by username, so
+    the cost of a graph follows the user's own data rather than the whole fleet's.
+
+    Bar and line series are downsampled to roughly the width of the graph before they are
+    sent to the browser: min/max buckets for bars and LTTB for lines. When the user zooms,
+    the zoomed range is reloaded and downsampled again, so detail appears as the range narrows.
+    Long ranges are read from the coarsest rollup table that still fills the graph. A line
+    graph of the latest readings also shows where the incubator is heading: a dashed
+    forecast with its band over the next ten minutes, see forecasting.py.
+
+    Figures are cached per user, graph type and range together with the highest reading id
+    they were built from, so switching back to a view shows it again without rebuilding it
+    until new readings arrive.
+
     Args:
-        graph_type (str): The type of graph to display. Possible values are 'bar', 'line', and 'table'.
+        graph_type (str): The type of graph to display. Possible values are 'bar' and 'line';
+            'table' is rendered by `update_table` instead.
+        time_range (int): How many seconds back from now to show, or 0 for the latest readings.
+        relayout_data (dict): The relayoutData of the graph, used to follow the zoomed range.
 
     Returns:
-        dict: A dictionary containing the data and layout for the graph.
+        tuple: The figure, and the highest reading id it shows when it follows the latest
+        readings live (None for fixed ranges and the table). The figure is a dictionary
+        containing the data and layout for the graph.
             - 'data' (list): A list of dictionaries representing the data for the graph.
                 - Each dictionary has the following keys:
                     - 'x' (list): The x-axis values.
@@ -421,42 +987,245 @@ def update_graph(graph_type):
                     - 'title' (str): The title of the x-axis.
                 - 'yaxis' (dict): A dictionary representing the y-axis configuration.
                     - 'title' (str): The title of the y-axis.
+                - 'uirevision' (str): Keeps the user's zoom while the graph type and range are unchanged.
     """
+    username = session.get('username')
+    if graph_type not in ('bar', 'line') or username is None:
+        # The table is served page by page by `update_table`.
+        return {'data': [], 'layout': {'title': 'Incubator Readings'}}, None
+
+    window = zoom_range(relayout_data)
+    latest = reading_store.user_window(username)
+    cache_key = (username, graph_type, window or time_range, latest.last_id)
+    cached = figure_cache.get(cache_key)
+    if cached is not None:
+        figure, live_id = cached
+        return figure, live_id
+
+    if window is None and time_range:
+        now = int(time.time())
+        window = (now - time_range, now)
+    df = readings_between(*window, username) if window else latest
     if graph_type == 'bar':
         data = [
-            {'x': df['timestamp'], 'y': df['temperature'], 'name': 'Temperature (°C)', 'type': 'bar'},
-            {'x': df['timestamp'], 'y': df['humidity'], 'name': 'Humidity', 'type': 'bar'}
-        ]
-    elif graph_type == 'line':
-        data = [
-            {'x': df['timestamp'], 'y': df['temperature'], 'name': 'Temperature (°C)', 'type': 'line'},
-            {'x': df['timestamp'], 'y': df['humidity'], 'name': 'Humidity', 'type': 'line'}
+            downsampled_trace(df, 'temperature', 'Temperature (°C)', 'bar', 'minmax'),
+            downsampled_trace(df, 'humidity', 'Humidity', 'bar', 'minmax')
         ]
-    elif graph_type == 'table':
+    else:
         data = [
-            go.Table(
-                header=dict(values=['Timestamp', 'Temperature (°C)', 'Humidity']),
-                cells=dict(values=[df['timestamp'], df['temperature'], df['humidity']])
-            )
+            downsampled_trace(df, 'temperature', 'Temperature (°C)', 'line', 'lttb'),
+            downsampled_trace(df, 'humidity', 'Humidity', 'line', 'lttb')
         ]
-    else:
-        data = []
+        if window is None:
+            data.extend(forecast_traces(username))
 
     layout = {
         'title': 'Incubator Readings',
-        'xaxis': {'title': 'Timestamp'},
-        'yaxis': {'title': 'Value'}
+        'xaxis': {'title': 'Timestamp (UTC)'},
+        'yaxis': {'title': 'Value'},
+        'uirevision': f'{graph_type}-{time_range}'
+    }
+
+    live_id = None if window or latest.empty else latest.last_id
+    figure = {'data': data, 'layout': layout}
+    figure_cache.put(cache_key, [figure, live_id])
+    return figure, live_id
+
+
+@callback(
+    [Output('incubator-graph', 'extendData'),
+     Output('extended-reading-id', 'data')],
+    [Input('live-interval', 'n_intervals')],
+    [State('figure-reading-id', 'data'),
+     State('extended-reading-id', 'data'),
+     State('graph-type-dropdown', 'value')]
+)
+@metrics.timed(metrics.DASH_CALLBACK_SECONDS, ('extend_graph',))
+def extend_graph(n_intervals, figure_id, extended_id, graph_type=None):
+    """
+    Callback function for appending new readings to a graph that follows the latest readings.
+
+    Only the readings newer than those already in the browser are sent. When nothing new was
+    published the callback stops after comparing two ids, without touching the database.
+    On a line graph the forecast traces are replaced by the forecast from the new readings.
+
+    Args:
+        n_intervals (int): The number of times the live interval has fired.
+        figure_id (int): The highest reading id in the figure built by `update_graph`, or None
+            if the figure shows a fixed range.
+        extended_id (int): The highest reading id sent by earlier calls of this callback.
+        graph_type (str): The selected graph type.
+
+    Returns:
+        tuple: The extendData for the temperature and humidity traces, capped at
+        `downsampling.DEFAULT_POINTS` points each, and the highest reading id sent.
+    """
+    username = session.get('username')
+    if figure_id is None or username is None:
+        raise PreventUpdate
+    seen_id = max(figure_id, extended_id or 0)
+    if live_notifier.latest_id <= seen_id:
+        raise PreventUpdate
+    rows = reading_store.since(seen_id, limit=downsampling.DEFAULT_POINTS, username=username)
+    if rows.empty:
+        raise PreventUpdate
+    timestamps = pd.to_datetime(rows['timestamp'], unit='s')
+    extension = {
+        'x': [timestamps, timestamps],
+        'y': [rows['temperature'], rows['humidity']]
     }
+    max_points = downsampling.DEFAULT_POINTS
+    forecast = forecast_traces(username) if graph_type == 'line' else []
+    if forecast and len(forecast[0]['x']):
+        # Appending a whole forecast while keeping only its length replaces the old one.
+        extension['x'].extend(trace['x'] for trace in forecast)
+        extension['y'].extend(trace['y'] for trace in forecast)
+        limits = [max_points] * 2 + [len(forecast[0]['x'])] * len(forecast)
+        max_points = {'x': limits, 'y': limits}
+    indices = list(range(len(extension['x'])))
+    return (extension, indices, max_points), int(rows['id'].iloc[-1])
+
+
+""" Background workers """
+def start_background_workers(db_name='users.db'):
+    """
+    Starts the threads that write and follow incubator readings.
 
-    return {'data': data, 'layout': layout}
+    A standalone server starts the ingestion writer, the data generator, the maintenance
+    scheduler and, with EMM_DEVICE_PORT set, the device gateway; a read-only web worker
+    instead long-polls the ingestion service for new readings. Either way a single
+    subscriber refreshes the shared reading store after each ingested batch, once the
+    dashboard has loaded it.
 
+    Args:
+        db_name (str): The database the ingestion writer and data generator write to.
 
+    Returns:
+        list: The started threads.
+    """
+    global ingestion_writer
+    if ingest_client is not None:
+        # The ingestion service writes every reading and generates data; learn about new
+        # readings by long-polling it.
+        ingestion_writer = ingest_client
+        threads = [ChangeForwarder(ingest_client, ingest_notifier)]
+    else:
+        ingestion_writer = IngestionWriter(db_name)
+        ingestion_writer.add_listener(lambda batch, last_id: ingest_notifier.publish(last_id))
+        ingestion_writer.add_listener(lambda batch, last_id: alert_engine.process(batch))
+        metrics.Gauge('emm_ingest_queue_depth', 'Readings waiting in the ingestion queue.',
+                      ingestion_writer.queue.qsize)
+        # Set EMM_SIMULATOR_RATE (readings per second) to load-test with simulated incubators
+        simulator_rate = float(os.environ.get('EMM_SIMULATOR_RATE', 0))
+        simulator = None
+        if simulator_rate:
+            simulator = ReadingSimulator(incubators=int(os.environ.get('EMM_SIMULATOR_INCUBATORS', 100)),
+                                         rate=simulator_rate)
+        threads = [ingestion_writer, DataGeneratorThread(ingestion_writer, simulator, db_name=db_name)]
+        # Vacuums, analyzes and checkpoints the database every EMM_MAINTENANCE_INTERVAL seconds (0 disables
+        # it). Rows are only pruned from the tables EMM_RETENTION gives days for, e.g. 'default' for the
+        # recommended retention; expired readings go to the archive unless EMM_ARCHIVE_DIR is empty. The
+        # scheduler logs its settings when it starts, see maintenance.py
+        maintenance_interval = float(os.environ.get('EMM_MAINTENANCE_INTERVAL', maintenance.INTERVAL))
+        if maintenance_interval:
+            archive_dir = reading_archive.archive_dir if reading_archive is not None else None
+            threads.append(MaintenanceScheduler(db_name, retention, archive_dir, maintenance_interval))
+    threads.append(RefreshSubscriber(ingest_notifier, reading_store.refresh_loaded))
+    for thread in threads:
+        thread.start()
+    # Set EMM_DEVICE_PORT to accept readings from incubator devices, see device_gateway.py.
+    # Web workers leave this to the ingestion service.
+    device_port = os.environ.get('EMM_DEVICE_PORT')
+    if device_port and ingest_client is None:
+        threads.append(device_gateway.start_gateway(ingestion_writer, int(device_port)))
+    return threads
+
+
+""" Application factory """
+def create_app(db_name='users.db', start_workers=True):
+    """
+    Sets up the database, the dashboard and the background workers, and returns the app.
+
+    Importing this module only defines the routes and callbacks; nothing is opened, read
+    or started until this is called, so tests and tools that import it pay no startup cost.
+    Readings are not read here either: the reading store is first refreshed on the first
+    dashboard request, so startup takes the same time however many readings are stored.
+    Later calls return the same app.
+
+    Args:
+        db_name (str): The database to serve. Defaults to 'users.db'.
+        start_workers (bool): Whether to start the background workers, see
+            `start_background_workers`. Defaults to True.
+
+    Returns:
+        flask.Flask: The app, e.g. for `gunicorn 'main:create_app()'`.
+
+    Raises:
+        ValueError: If EMM_INGEST_ADDRESS is set without EMM_SECRET_KEY, since each web worker
+            would then sign sessions with its own random key and logins would not carry over.
+    """
+    global engine, db_session, reading_archive, reading_store, ingest_client, alert_engine, forecaster, user_manager
+    global retention, fleet_overview, dash_app
+    with _app_lock:
+        if dash_app is not None:
+            return app
+        if ingest_address and not os.environ.get('EMM_SECRET_KEY'):
+            raise ValueError("EMM_SECRET_KEY must be set to the same secret in every web worker.")
+
+        # SQLAlchemy setup
+        if ingest_address:
+            engine = create_engine(f'sqlite:///file:{db_name}?mode=ro&uri=true', connect_args={'check_same_thread': False})
+        else:
+            engine = create_engine(f'sqlite:///{db_name}', connect_args={'check_same_thread': False})
+            # Create the readings and rollup tables if they don't exist, and migrate older databases.
+            # The schema module is authoritative, so the model above is not used to create tables.
+            # Read-only web workers leave this to the ingestion service.
+            schema_conn = engine.raw_connection()
+            try:
+                schema.ensure_schema(schema_conn)
+            finally:
+                schema_conn.close()
+        Session.configure(bind=engine)
+        db_session = Session()
+
+        # Readings shown by the dashboard, shared by all Dash callbacks and refreshed incrementally
+        # Readings older than the hot table are read from the archive directory, see archive.py;
+        # set EMM_ARCHIVE_DIR to '' to delete expired readings instead of archiving them
+        archive_dir = os.environ.get('EMM_ARCHIVE_DIR', archive.DEFAULT_ARCHIVE_DIR)
+        reading_archive = archive.ReadingArchive(archive_dir) if archive_dir else None
+        # Every process forecasts from the readings its store refreshes, so web workers need no service call
+        forecaster = Forecaster()
+        reading_store = ReadingStore(engine, notifier=live_notifier, archive=reading_archive, forecaster=forecaster)
+        # Days each table is kept for, set by EMM_RETENTION and forever by default; graphs avoid
+        # rollups pruned for their range
+        retention = maintenance.parse_retention(os.environ.get('EMM_RETENTION', ''))
+
+        # One grouped query for every incubator's tile, reused for a few seconds, see fleet.py
+        fleet_overview = fleet.FleetOverview(engine.raw_connection, forecaster)
+
+        # Checks every written batch against the incubation limits. Web workers ask the ingestion
+        # service, which runs the alert engine next to the writer.
+        if ingest_address:
+            ingest_client = IngestClient(ingest_address)
+            alert_engine = ingest_client
+        else:
+            alert_engine = AlertEngine()
+
+        # Shared by all request threads so connections and cached lookups are reused. Accounts are
+        # the one exception to read-only web workers: registering and changing passwords write
+        # the small 'users' table directly, and SQLite's busy timeout serializes them with the
+        # ingestion service's writes.
+        user_manager = UserManagement(db_name)
+
+        if start_workers:
+            start_background_workers(db_name)
+
+        # Dash app initialization; the callbacks above are registered with every Dash app
+        dash_app = dash.Dash(__name__, server=app, external_stylesheets=[dbc.themes.BOOTSTRAP])
+        dash_app.layout = dashboard_layout()
+    return app
 
-""" Data generator thread """
-data_thread = DataGeneratorThread()
-data_thread.start()
 
 if __name__ == '__main__':
     # Run the Flask app
-    app.run(host='0.0.0.0', debug=True, port=5000)
-
+    create_app().run(host='0.0.0.0', debug=True, port=5000)
@@ -0,0 +1,380 @@
+"""
+Background maintenance of the database: retention, WAL checkpoints, incremental VACUUM
+and ANALYZE.
+
+Readings and their rollups are only ever inserted, so without maintenance the database,
+which also holds the `users` table, grows without bound. A maintenance pass
+
+1. deletes the rows older than each table's retention, `batch_size` rows per transaction
+   with a pause between transactions, so the ingestion writer never waits for more than
+   one small batch. With an archive directory, raw readings are moved to the archive
+   (see archive.py) instead. Retention is opt-in: without settings, see `parse_retention`,
+   nothing is deleted. The `users` table is never pruned;
+2. returns free pages to the file system with incremental VACUUM, `VACUUM_CHUNK` pages
+   per transaction;
+3. runs ANALYZE over a bounded sample, so the query planner keeps choosing the right
+   indexes as the tables grow and shrink;
+4. checkpoints the WAL without waiting for readers or writers, and truncates it when
+   everything was checkpointed and no one is using it.
+
+Each pass logs how long it took and how many pages it reclaimed. `MaintenanceScheduler`
+runs a pass every `interval` seconds in the process that writes readings.
+
+Each scheduler logs its retention when it starts. Run
+`python maintenance.py [--db users.db] [--retention default,incubator_readings=7,...] [--vacuum]`
+to run one pass by hand.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import archive
+import metrics
+import schema
+
+""" Recommended days each table keeps its rows, None for forever; applied only when asked for """
+RETENTION_DAYS = {
+    'incubator_readings': archive.DEFAULT_MAX_AGE_DAYS,
+    'incubator_readings_1m': 90,
+    'incubator_readings_1h': 730,
+    'incubator_readings_1d': None,
+}
+
+""" The time column retention is applied to, per table """
+TIME_COLUMNS = {'incubator_readings': 'timestamp'} | {
+    f'incubator_readings_{suffix}': 'bucket' for suffix, _ in schema.ROLLUP_RESOLUTIONS}
+
+DELETE_BATCH_SQL = '''DELETE FROM {table} WHERE rowid IN (
+                          SELECT rowid FROM {table} WHERE {column} < ? LIMIT ?
+                      )'''
+
+""" Seconds between maintenance passes, and before the first one """
+INTERVAL = 3600
+FIRST_PASS_DELAY = 60
+
+""" Rows deleted per transaction, and seconds left to writers between transactions """
+BATCH_SIZE = 2000
+PAUSE_SECONDS = 0.05
+
+""" Free pages returned to the file system per transaction """
+VACUUM_CHUNK = 1024
+
+""" Rows ANALYZE reads per index, so it stays quick however large the tables get """
+ANALYSIS_LIMIT = 1000
+
+""" Databases up to this size are converted to incremental auto-vacuum with a full VACUUM on their own """
+CONVERT_MAX_BYTES = 64 * 2 ** 20
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def parse_retention(text):
+    """
+    Reads retention settings such as 'default,incubator_readings=7,incubator_readings_1h=none'.
+
+    Retention is opt-in: tables not mentioned keep their rows forever. 'default' applies
+    the recommended `RETENTION_DAYS` to every table, and pairs after it override them.
+
+    Parameters:
+        text (str): Comma-separated table=days pairs, where 'none' keeps a table's rows
+            forever, or 'default'.
+
+    Returns:
+        dict: The retention in days of every table.
+
+    Raises:
+        ValueError: If a table has no retention setting or its days are not a number.
+    """
+    retention = dict.fromkeys(RETENTION_DAYS)
+    for pair in filter(None, (part.strip() for part in text.split(','))):
+        if pair.lower() == 'default':
+            retention.update(RETENTION_DAYS)
+            continue
+        table, _, days = (part.strip() for part in pair.partition('='))
+        if table not in RETENTION_DAYS:
+            raise ValueError(f"Unknown table for retention: {table!r}")
+        retention[table] = None if days.lower() == 'none' else float(days)
+    return retention
+
+
+def describe_retention(retention):
+    """
+    Describes retention settings for the log, e.g. 'incubator_readings 30 days, incubator_readings_1d forever'.
+
+    Parameters:
+        retention (dict): Days each table keeps its rows, None for forever.
+
+    Returns:
+        str: One entry per table.
+    """
+    return ', '.join(f"{table} {'forever' if days is None else f'{days:g} days'}" for table, days in retention.items())
+
+
+def _pragma(conn, name):
+    return conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+
+def delete_expired(conn, table, cutoff, batch_size=BATCH_SIZE, pause=PAUSE_SECONDS, stop_event=None):
+    """
+    Deletes the rows of a table older than `cutoff`, `batch_size` rows per transaction.
+
+    Each batch is found through the table's time index and committed on its own, and the
+    pause between batches lets the ingestion writer take the write lock.
+
+    Parameters:
+        conn (sqlite3.Connection): A connection to the database, outside a transaction.
+        table (str): One of the tables in `TIME_COLUMNS`.
+        cutoff (int): Rows with an earlier timestamp or bucket, in epoch seconds, are deleted.
+        batch_size (int): Rows deleted per transaction. Defaults to `BATCH_SIZE`.
+        pause (float): Seconds to sleep between batches. Defaults to `PAUSE_SECONDS`.
+        stop_event (threading.Event): Stop after the current batch once set.
+
+    Returns:
+        int: The number of rows deleted.
+    """
+    sql = DELETE_BATCH_SQL.format(table=table, column=TIME_COLUMNS[table])
+    deleted = 0
+    while stop_event is None or not stop_event.is_set():
+        with conn:
+            count = conn.execute(sql, (cutoff, batch_size)).rowcount
+        deleted += count
+        if count < batch_size:
+            break
+        time.sleep(pause)
+    metrics.MAINTENANCE_ROWS_DELETED.inc(deleted, (table,))
+    return deleted
+
+
+def ensure_incremental_vacuum(conn, max_bytes=CONVERT_MAX_BYTES):
+    """
+    Makes sure the database uses incremental auto-vacuum, converting it with a full VACUUM
+    if it is no larger than `max_bytes`.
+
+    A full VACUUM rewrites the whole file and holds the write lock while it does, so larger
+    databases are left to be converted by hand with `python maintenance.py --vacuum`.
+    Until then their free pages are reused by new rows, but the file does not shrink.
+
+    Parameters:
+        conn (sqlite3.Connection): A connection to the database, outside a transaction.
+        max_bytes (float): The largest database converted. Defaults to `CONVERT_MAX_BYTES`.
+
+    Returns:
+        bool: True if the database uses incremental auto-vacuum.
+    """
+    if _pragma(conn, 'auto_vacuum') == AUTO_VACUUM_INCREMENTAL:
+        return True
+    size = _pragma(conn, 'page_count') * _pragma(conn, 'page_size')
+    if size > max_bytes:
+        return False
+    start = time.perf_counter()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    logging.info(f"Converted the database ({size / 2 ** 20:.1f} MiB) to incremental auto-vacuum "
+                 f"in {time.perf_counter() - start:.2f} s.")
+    return True
+
+
+def incremental_vacuum(conn, chunk=VACUUM_CHUNK, pause=PAUSE_SECONDS, stop_event=None):
+    """
+    Returns the database's free pages to the file system, `chunk` pages per transaction.
+
+    Parameters:
+        conn (sqlite3.Connection): A connection to a database in incremental auto-vacuum
+            mode, outside a transaction.
+        chunk (int): Pages freed per transaction. Defaults to `VACUUM_CHUNK`.
+        pause (float): Seconds to sleep between transactions. Defaults to `PAUSE_SECONDS`.
+        stop_event (threading.Event): Stop after the current chunk once set.
+
+    Returns:
+        int: The number of pages the file shrank by.
+    """
+    before = _pragma(conn, 'page_count')
+    free = _pragma(conn, 'freelist_count')
+    while free and (stop_event is None or not stop_event.is_set()):
+        # `execute` steps the pragma once, which frees a single page; a script runs it to the end.
+        conn.executescript(f'PRAGMA incremental_vacuum({min(free, chunk)})')
+        remaining = _pragma(conn, 'freelist_count')
+        if remaining == 0 or remaining >= free:
+            break
+        free = remaining
+        time.sleep(pause)
+    reclaimed = before - _pragma(conn, 'page_count')
+    metrics.MAINTENANCE_PAGES_RECLAIMED.inc(reclaimed)
+    return reclaimed
+
+
+def analyze(conn, limit=ANALYSIS_LIMIT):
+    """
+    Refreshes the statistics the query planner chooses indexes with.
+
+    Parameters:
+        conn (sqlite3.Connection): A connection to the database, outside a transaction.
+        limit (int): Rows read per index. Defaults to `ANALYSIS_LIMIT`.
+
+    Returns:
+        None
+    """
+    conn.execute(f'PRAGMA analysis_limit = {int(limit)}')
+    conn.execute('ANALYZE')
+
+
+def checkpoint(conn):
+    """
+    Copies the WAL into the database without waiting for readers or writers, then truncates
+    the WAL file if every frame was copied and the WAL is not in use.
+
+    Parameters:
+        conn (sqlite3.Connection): A connection to the database, outside a transaction.
+
+    Returns:
+        tuple: (busy, frames in the WAL, frames checkpointed) of the passive checkpoint, as
+        returned by `PRAGMA wal_checkpoint`; the frames are -1 outside WAL mode.
+    """
+    busy, frames, checkpointed = conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+    if busy == 0 and 0 < frames == checkpointed:
+        # TRUNCATE waits for readers and writers through the busy handler; without a busy
+        # timeout it gives up at once rather than hold up the ingestion writer.
+        timeout = _pragma(conn, 'busy_timeout')
+        conn.execute('PRAGMA busy_timeout = 0')
+        try:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        finally:
+            conn.execute(f'PRAGMA busy_timeout = {timeout}')
+    return busy, frames, checkpointed
+
+
+""" MaintenanceScheduler for periodic maintenance of the database """
+class MaintenanceScheduler(threading.Thread):
+    def __init__(self, db_name='users.db', retention=None, archive_dir=None, interval=INTERVAL,
+                 batch_size=BATCH_SIZE, pause=PAUSE_SECONDS):
+        """
+        Initializes a new scheduler. Call `start()` to run a pass every `interval` seconds,
+        the first one `FIRST_PASS_DELAY` seconds after starting, or `run_pass()` to run one now.
+
+        Parameters:
+            db_name (str): The database to maintain. Defaults to 'users.db'.
+            retention (dict): Days each table keeps its rows, None for forever. Defaults
+                to keeping every table's rows, see `parse_retention`.
+            archive_dir (str): Move raw readings past their retention to this archive
+                directory rather than delete them. Defaults to deleting them.
+            interval (float): Seconds between passes. Defaults to `INTERVAL`.
+            batch_size (int): Rows deleted per transaction. Defaults to `BATCH_SIZE`.
+            pause (float): Seconds left to writers between transactions. Defaults to `PAUSE_SECONDS`.
+
+        Returns:
+            None
+        """
+        super().__init__(name='MaintenanceScheduler', daemon=True)
+        self.db_name = db_name
+        self.retention = dict.fromkeys(RETENTION_DAYS) if retention is None else retention
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.passes = 0
+        self._warned_vacuum = False
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """
+        Asks the scheduler to stop after the current batch.
+
+        Returns:
+            None
+        """
+        self._stop_event.set()
+
+    def run_pass(self, now=None):
+        """
+        Runs one maintenance pass and logs its duration and the pages it reclaimed.
+
+        Parameters:
+            now (int): The current time in epoch seconds, which retention counts back from.
+                Defaults to the clock.
+
+        Returns:
+            dict: 'seconds' taken; rows 'deleted' per table; readings 'archived'; the
+            'pages_reclaimed' from the file; the 'page_count' and 'free_pages' left; and the
+            'checkpoint' result, see `checkpoint`.
+        """
+        now = int(time.time()) if now is None else now
+        start = time.perf_counter()
+        report = {'deleted': {}, 'archived': 0, 'pages_reclaimed': 0}
+        conn = sqlite3.connect(self.db_name)
+        try:
+            for table, days in self.retention.items():
+                if days is None or self._stop_event.is_set():
+                    continue
+                if table == 'incubator_readings' and self.archive_dir:
+                    report['archived'] = archive.archive_readings(conn, self.archive_dir, days, now,
+                                                                  self.batch_size, self.pause)
+                else:
+                    report['deleted'][table] = delete_expired(conn, table, int(now - days * archive.DAY_SECONDS),
+                                                              self.batch_size, self.pause, self._stop_event)
+            if ensure_incremental_vacuum(conn):
+                report['pages_reclaimed'] = incremental_vacuum(conn, pause=self.pause, stop_event=self._stop_event)
+            elif not self._warned_vacuum:
+                self._warned_vacuum = True
+                logging.warning(f"{self.db_name} does not use incremental auto-vacuum, so it will not shrink. "
+                                f"Run `python maintenance.py --db {self.db_name} --vacuum` while nothing "
+                                f"writes to it to convert it.")
+            analyze(conn)
+            report['checkpoint'] = checkpoint(conn)
+            report['page_count'] = _pragma(conn, 'page_count')
+            report['free_pages'] = _pragma(conn, 'freelist_count')
+            page_size = _pragma(conn, 'page_size')
+        finally:
+            conn.close()
+        report['seconds'] = time.perf_counter() - start
+        self.passes += 1
+        metrics.MAINTENANCE_SECONDS.observe(report['seconds'])
+        deleted = ', '.join(f'{table} {count}' for table, count in report['deleted'].items())
+        logging.info(f"Maintenance pass took {report['seconds']:.2f} s: deleted {sum(report['deleted'].values())} rows "
+                     f"({deleted or 'no retention'}), archived {report['archived']} readings, "
+                     f"reclaimed {report['pages_reclaimed']} pages "
+                     f"({report['pages_reclaimed'] * page_size / 2 ** 20:.1f} MiB); "
+                     f"{report['free_pages']} of {report['page_count']} pages free.")
+        return report
+
+    def run(self):
+        """
+        Run method for the MaintenanceScheduler class.
+
+        Returns:
+            None
+        """
+        expired = f'archived to {self.archive_dir}' if self.archive_dir else 'deleted'
+        logging.info(f"Maintaining {self.db_name} every {self.interval:g} s; keeping "
+                     f"{describe_retention(self.retention)}; expired readings are {expired}.")
+        self._stop_event.wait(min(FIRST_PASS_DELAY, self.interval))
+        while not self._stop_event.is_set():
+            try:
+                self.run_pass()
+            except (sqlite3.Error, OSError) as e:
+                logging.error(f"Error maintaining {self.db_name}: {e}")
+            self._stop_event.wait(self.interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run one maintenance pass over the database.')
+    parser.add_argument('--db', default='users.db', help='the database to maintain')
+    parser.add_argument('--retention', default=os.environ.get('EMM_RETENTION', ''),
+                        help="table=days pairs, or 'default' for the recommended retention; "
+                             "tables not given are kept forever")
+    parser.add_argument('--archive-dir', default='',
+                        help='move raw readings past their retention to this archive directory instead of deleting them')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='first convert the database to incremental auto-vacuum with a full VACUUM, however large')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    connection = sqlite3.connect(args.db)
+    schema.ensure_schema(connection)
+    if args.vacuum:
+        ensure_incremental_vacuum(connection, max_bytes=float('inf'))
+    connection.close()
+    result = MaintenanceScheduler(args.db, parse_retention(args.retention), args.archive_dir or None).run_pass()
+    print(f"Maintained {args.db} in {result['seconds']:.2f} s, reclaiming {result['pages_reclaimed']} pages.")
@@ -0,0 +1,353 @@
+"""
+In-process metrics, exposed in the Prometheus text format on `/metrics`.
+
+Metrics are module-level objects that hot paths update directly: recording a value is a
+bisect and a few additions under an uncontended lock, well under a few microseconds. Each
+process keeps its own values, so with several web workers every worker reports its own.
+"""
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+""" Latency buckets in seconds, from 100 µs to 10 s """
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _label_text(labelnames, labels, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+""" Registry for the metrics rendered on /metrics """
+class Registry:
+    def __init__(self):
+        """
+        Initializes an empty registry.
+
+        Returns:
+            None
+        """
+        self.metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Adds a metric to the registry.
+
+        Parameters:
+            metric (Counter, Gauge or Histogram): The metric.
+
+        Returns:
+            Counter, Gauge or Histogram: The metric, so it can be registered as it is created.
+        """
+        with self._lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Renders every registered metric.
+
+        Returns:
+            str: The metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+""" The registry rendered on /metrics """
+REGISTRY = Registry()
+
+
+""" Counter for totals that only go up """
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        """
+        Initializes a counter and registers it.
+
+        Parameters:
+            name (str): The metric name.
+            documentation (str): The help text.
+            labelnames (tuple): The names of the labels every value is recorded with.
+            registry (Registry): Where to register. Defaults to `REGISTRY`; None to skip.
+
+        Returns:
+            None
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def inc(self, value=1, labels=()):
+        """
+        Adds to the counter.
+
+        Parameters:
+            value (float): The amount to add. Defaults to 1.
+            labels (tuple): The label values, in the order of `labelnames`.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def value(self, labels=()):
+        """
+        Returns the current total for some label values.
+        """
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_label_text(self.labelnames, labels)} {_number(value)}' for labels, value in values]
+
+
+""" Gauge for values that go up and down, read from a function when rendered """
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function=None, registry=REGISTRY):
+        """
+        Initializes a gauge and registers it.
+
+        Parameters:
+            name (str): The metric name.
+            documentation (str): The help text.
+            function (callable): Returns the value when metrics are rendered. Without one,
+                the value is whatever was last passed to `set`.
+            registry (Registry): Where to register. Defaults to `REGISTRY`; None to skip.
+
+        Returns:
+            None
+        """
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self._value = 0
+        if registry is not None:
+            registry.register(self)
+
+    def set(self, value):
+        """
+        Sets the gauge's value.
+        """
+        self._value = value
+
+    def samples(self):
+        value = self._value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                return []
+        return [f'{self.name} {_number(value)}']
+
+
+""" Histogram for distributions such as latencies """
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        """
+        Initializes a histogram and registers it.
+
+        Parameters:
+            name (str): The metric name.
+            documentation (str): The help text.
+            labelnames (tuple): The names of the labels every value is recorded with.
+            buckets (tuple): The upper bounds of the buckets, ascending. Defaults to
+                `DEFAULT_BUCKETS`.
+            registry (Registry): Where to register. Defaults to `REGISTRY`; None to skip.
+
+        Returns:
+            None
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def observe(self, value, labels=()):
+        """
+        Records one value.
+
+        Parameters:
+            value (float): The value, e.g. a duration in seconds.
+            labels (tuple): The label values, in the order of `labelnames`.
+
+        Returns:
+            None
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, labels=()):
+        """
+        Returns a context manager that records how long its block takes.
+
+        Parameters:
+            labels (tuple): The label values, in the order of `labelnames`.
+
+        Returns:
+            Timer: The context manager.
+        """
+        return Timer(self, labels)
+
+    def count(self, labels=()):
+        """
+        Returns how many values were recorded for some label values.
+        """
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = []
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_label_text(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_label_text(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_label_text(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+""" Timer for recording the duration of a block in a histogram """
+class Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels=()):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, self.labels)
+        return False
+
+
+def timed(histogram, labels=()):
+    """
+    Decorates a function to record the duration of every call, including calls that raise.
+
+    Parameters:
+        histogram (Histogram): Where to record the durations.
+        labels (tuple): The label values, in the order of the histogram's `labelnames`.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, labels)
+        return wrapper
+    return decorator
+
+
+def serve(port, host='127.0.0.1', registry=REGISTRY):
+    """
+    Serves `/metrics` from a background thread, for processes without a web server such as
+    the ingestion service.
+
+    Parameters:
+        port (int): The port to listen on.
+        host (str): The address to listen on. Defaults to localhost.
+        registry (Registry): The metrics to serve. Defaults to `REGISTRY`.
+
+    Returns:
+        http.server.ThreadingHTTPServer: The server; call `shutdown()` to stop it.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='MetricsServer', daemon=True).start()
+    return server
+
+
+""" Metrics recorded across the application """
+HTTP_REQUEST_SECONDS = Histogram('emm_http_request_duration_seconds', 'Time to handle an HTTP request.',
+                                 ('route', 'method', 'status'))
+DASH_CALLBACK_SECONDS = Histogram('emm_dash_callback_duration_seconds', 'Time to run a Dash callback.',
+                                  ('callback',))
+SQL_QUERY_SECONDS = Histogram('emm_sql_query_duration_seconds', 'Time to run a database query.', ('query',))
+SQL_QUERY_ROWS = Counter('emm_sql_query_rows_total', 'Rows read or written by database queries.', ('query',))
+INGEST_FLUSH_SECONDS = Histogram('emm_ingest_flush_duration_seconds',
+                                 'Time to commit one batch of readings, rollups included.')
+INGEST_ROWS = Counter('emm_ingest_rows_total', 'Readings handled by the ingestion writer.', ('result',))
+INGEST_WRITE_RETRIES = Counter('emm_ingest_write_retries_total',
+                               'Batch writes retried after a transient database error.')
+DEVICE_REQUESTS = Counter('emm_device_requests_total', 'Device ingestion requests, by response status.', ('status',))
+DEVICE_READINGS = Counter('emm_device_readings_total', 'Readings posted by devices.', ('result',))
+PASSWORD_HASH_SECONDS = Histogram('emm_password_hash_duration_seconds', 'Time to compute one scrypt password hash.')
+PASSWORD_HASHES_REFUSED = Counter('emm_password_hashes_refused_total',
+                                  'Password hashes refused because the hashing pool was full.')
+MAINTENANCE_SECONDS = Histogram('emm_maintenance_duration_seconds', 'Time to run one database maintenance pass.',
+                                buckets=(0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+MAINTENANCE_ROWS_DELETED = Counter('emm_maintenance_rows_deleted_total',
+                                   'Rows removed from the database by retention, by table.', ('table',))
+MAINTENANCE_PAGES_RECLAIMED = Counter('emm_maintenance_pages_reclaimed_total',
+                                      'Database pages returned to the file system by incremental vacuum.')
@@ -0,0 +1,98 @@
+import logging
+import threading
+
+
+""" ChangeNotifier for fanning out "new readings up to id X" events """
+class ChangeNotifier:
+    def __init__(self):
+        """
+        Initializes a new notifier with no readings published yet.
+
+        Waiters block on a condition variable, so idle subscribers cost no CPU no matter
+        how many there are.
+
+        Returns:
+            None
+        """
+        self.latest_id = 0
+        self._condition = threading.Condition()
+
+    def publish(self, latest_id):
+        """
+        Announces that readings up to `latest_id` are available and wakes every waiter.
+        Older ids than the last one published are ignored.
+
+        Parameters:
+            latest_id (int): The highest reading id now available.
+
+        Returns:
+            None
+        """
+        with self._condition:
+            if latest_id > self.latest_id:
+                self.latest_id = latest_id
+                self._condition.notify_all()
+
+    def wait_for(self, after_id, timeout=None):
+        """
+        Blocks until a reading id above `after_id` is published, or until `timeout`.
+
+        Parameters:
+            after_id (int): The highest reading id the caller has already seen.
+            timeout (float): Maximum seconds to wait. Defaults to no limit.
+
+        Returns:
+            int: The latest published id, which equals or is below `after_id` on timeout.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.latest_id > after_id, timeout)
+            return self.latest_id
+
+
+""" RefreshSubscriber for running one callback per batch of published changes """
+class RefreshSubscriber(threading.Thread):
+    def __init__(self, notifier, callback):
+        """
+        Initializes a new subscriber. Call `start()` to begin listening.
+
+        However many readings are published while the callback runs, it runs once more
+        afterwards, so a single subscriber can keep a shared cache current for every viewer.
+
+        Parameters:
+            notifier (ChangeNotifier): The notifier to listen to.
+            callback (callable): Called with no arguments after new ids are published.
+
+        Returns:
+            None
+        """
+        super().__init__(name='RefreshSubscriber', daemon=True)
+        self.notifier = notifier
+        self.callback = callback
+        self.seen_id = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """
+        Asks the subscriber to stop. It exits within a second.
+
+        Returns:
+            None
+        """
+        self._stop_event.set()
+
+    def run(self):
+        """
+        Run method for the RefreshSubscriber class.
+
+        Returns:
+            None
+        """
+        while not self._stop_event.is_set():
+            latest_id = self.notifier.wait_for(self.seen_id, timeout=1.0)
+            if latest_id <= self.seen_id:
+                continue
+            self.seen_id = latest_id
+            try:
+                self.callback()
+            except Exception as e:
+                logging.error(f"Error refreshing after reading {latest_id}: {e}")
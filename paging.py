@@ -0,0 +1,293 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+import schema
+
+""" Columns of 'incubator_readings' that the table view can show, sort and filter on """
+TABLE_COLUMNS = ['id', 'username', 'timestamp', 'temperature', 'humidity']
+
+""" Seconds a table's page count is reused before its readings are counted again """
+COUNT_TTL = 30.0
+
+""" Maximum number of tables, per user, filter and sort, whose counts and page positions are kept """
+MAX_TABLES = 1024
+
+FILTER_OPERATORS = {
+    'eq': '=', '=': '=',
+    'ne': '!=', '!=': '!=',
+    'lt': '<', '<': '<',
+    'le': '<=', '<=': '<=',
+    'gt': '>', '>': '>',
+    'ge': '>=', '>=': '>=',
+    'contains': 'LIKE',
+    'datestartswith': 'LIKE',
+}
+
+# Timestamps are stored as epoch seconds but filtered by text as they are displayed.
+TIMESTAMP_TEXT_SQL = "strftime('%Y-%m-%d %H:%M:%S', timestamp, 'unixepoch')"
+
+FILTER_CLAUSE = re.compile(
+    r'^\{(?P<column>\w+)\}\s+[si]?(?P<operator>eq|ne|lt|le|gt|ge|contains|datestartswith|=|!=|<=|>=|<|>)\s+(?P<value>.+)$'
+)
+
+
+def parse_filter_query(filter_query):
+    """
+    Translates a Dash DataTable filter_query into a parameterized SQL WHERE clause.
+
+    Clauses joined with '&&' such as `{temperature} > 36 && {username} contains mary`
+    are supported. Comparisons on `timestamp` take a displayed timestamp and use the index;
+    text matches on it compare against the displayed form. Clauses on unknown columns, with
+    unsupported operators or with unreadable timestamps are ignored.
+
+    Parameters:
+        filter_query (str): The filter_query of the DataTable, possibly empty.
+
+    Returns:
+        tuple: The WHERE clause (an empty string when nothing filters) and its parameters.
+    """
+    conditions = []
+    params = []
+    for clause in (filter_query or '').split(' && '):
+        match = FILTER_CLAUSE.match(clause.strip())
+        if not match or match.group('column') not in TABLE_COLUMNS:
+            continue
+        operator = match.group('operator')
+        value = match.group('value').strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'`':
+            value = value[1:-1]
+        column = match.group('column')
+        if operator == 'contains':
+            value = f'%{value}%'
+        elif operator == 'datestartswith':
+            value = f'{value}%'
+        if column == 'timestamp':
+            if FILTER_OPERATORS[operator] == 'LIKE':
+                column = TIMESTAMP_TEXT_SQL
+            else:
+                try:
+                    value = schema.to_epoch(value)
+                except ValueError:
+                    continue
+        conditions.append(f"{column} {FILTER_OPERATORS[operator]} ?")
+        params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return where, params
+
+
+def sort_terms(sort_by):
+    """
+    Translates a Dash DataTable sort_by into (column, direction) pairs.
+
+    Ties are broken on `id` so pages are stable. Without a sort the newest readings come
+    first. When sorting by timestamp, ties follow its direction, so the order is that of the
+    (username, timestamp) index and pages can be read by key, see `fetch_page`.
+
+    Parameters:
+        sort_by (list): The sort_by of the DataTable, e.g. [{'column_id': 'temperature', 'direction': 'asc'}].
+
+    Returns:
+        list: The (column, 'ASC' or 'DESC') pairs, ending with 'id'.
+    """
+    terms = []
+    id_direction = None
+    for sort in sort_by or []:
+        column = sort.get('column_id')
+        direction = 'ASC' if sort.get('direction') == 'asc' else 'DESC'
+        if column == 'id':
+            id_direction = direction
+        elif column in TABLE_COLUMNS:
+            terms.append((column, direction))
+    if not terms and id_direction is None:
+        terms.append(('timestamp', 'DESC'))
+    if id_direction is None:
+        id_direction = terms[-1][1] if terms[-1][0] == 'timestamp' else 'DESC'
+    terms.append(('id', id_direction))
+    return terms
+
+
+def order_by_clause(sort_by):
+    """
+    Translates a Dash DataTable sort_by into an SQL ORDER BY clause, see `sort_terms`.
+
+    Parameters:
+        sort_by (list): The sort_by of the DataTable.
+
+    Returns:
+        str: The ORDER BY clause.
+    """
+    return f"ORDER BY {', '.join(f'{column} {direction}' for column, direction in sort_terms(sort_by))}"
+
+
+def count_rows(conn, where='', params=()):
+    """
+    Counts the readings matching a WHERE clause.
+
+    Without a filter the count is estimated from the `id` range, which is answered from the
+    primary key alone. Deleted readings leave gaps in the range, so the estimate can be high.
+
+    Parameters:
+        conn (sqlite3.Connection): A DB-API connection to the database.
+        where (str): A WHERE clause from `parse_filter_query`.
+        params (list): The parameters of the WHERE clause.
+
+    Returns:
+        int: The number of matching readings.
+    """
+    if not where:
+        row = conn.execute('SELECT MAX(id) - MIN(id) + 1 FROM incubator_readings').fetchone()
+    else:
+        row = conn.execute(f'SELECT COUNT(*) FROM incubator_readings {where}', params).fetchone()
+    return row[0] or 0
+
+
+""" PageCache for the page counts and page positions of recently viewed tables """
+class PageCache:
+    def __init__(self, count_ttl=COUNT_TTL, max_tables=MAX_TABLES):
+        """
+        Initializes an empty cache.
+
+        A table is one user's readings with one filter and sort. For each, the cache keeps
+        its count for `count_ttl` seconds and, per page read, the key of the row the next
+        page starts after, so paging on seeks through the index instead of skipping rows.
+
+        Parameters:
+            count_ttl (float): Seconds a count is reused. Defaults to `COUNT_TTL`.
+            max_tables (int): Maximum number of tables kept; the least recently used are
+                dropped first. Defaults to `MAX_TABLES`.
+
+        Returns:
+            None
+        """
+        self.count_ttl = count_ttl
+        self.max_tables = max_tables
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _table(self, key):
+        table = self._tables.get(key)
+        if table is None:
+            table = self._tables[key] = {'count': None, 'counted_at': 0.0, 'positions': {}}
+            if len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)
+        else:
+            self._tables.move_to_end(key)
+        return table
+
+    def count(self, key, count):
+        """
+        Returns a table's count, counting again once the last count is `count_ttl` seconds old.
+
+        Parameters:
+            key (tuple): Identifies the table.
+            count (callable): Counts the table's readings.
+
+        Returns:
+            int: The number of readings.
+        """
+        with self._lock:
+            table = self._table(key)
+            if table['count'] is not None and time.monotonic() - table['counted_at'] < self.count_ttl:
+                return table['count']
+        value = count()
+        with self._lock:
+            table = self._table(key)
+            table['count'], table['counted_at'] = value, time.monotonic()
+        return value
+
+    def nearest_page(self, key, page):
+        """
+        Finds the closest page at or before `page` whose start is known.
+
+        Parameters:
+            key (tuple): Identifies the table.
+            page (int): The zero-based page number.
+
+        Returns:
+            tuple: The page number and the (timestamp, id) key its first row follows, or
+            (0, None) when no later page is known.
+        """
+        with self._lock:
+            positions = self._table(key)['positions']
+            known = [number for number in positions if number <= page]
+            if not known:
+                return 0, None
+            return max(known), positions[max(known)]
+
+    def remember(self, key, page, after):
+        """
+        Records the key of the row a page starts after.
+
+        Parameters:
+            key (tuple): Identifies the table.
+            page (int): The zero-based page number.
+            after (tuple): The (timestamp, id) of the last row of the page before it.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._table(key)['positions'][page] = after
+
+
+""" The page cache shared by all table views of the process """
+PAGE_CACHE = PageCache()
+
+
+def fetch_page(conn, page_current=0, page_size=25, sort_by=None, filter_query='', username=None, cache=None):
+    """
+    Reads one page of readings with sorting, filtering and paging done in SQL.
+
+    Pages in the default newest-first order, or sorted by timestamp, are read by key along
+    the (username, timestamp) index: from the end of the page before when it was read,
+    so paging on costs the same on every page. Jumps past pages not yet read, and sorts by
+    other columns, skip rows with OFFSET. Page counts are reused for `cache.count_ttl` seconds.
+
+    Parameters:
+        conn (sqlite3.Connection): A DB-API connection to the database.
+        page_current (int): The zero-based page number. Defaults to 0.
+        page_size (int): The number of readings per page. Defaults to 25.
+        sort_by (list): The sort_by of the DataTable. Defaults to newest first.
+        filter_query (str): The filter_query of the DataTable. Defaults to no filter.
+        username (str): Only list this user's readings, through the username index.
+            Defaults to all users.
+        cache (PageCache): Where counts and page positions are kept. Defaults to `PAGE_CACHE`.
+
+    Returns:
+        tuple: The page as a list of dicts keyed by column, with displayable timestamps,
+        and the total number of pages.
+    """
+    cache = PAGE_CACHE if cache is None else cache
+    where, params = parse_filter_query(filter_query)
+    if username is not None:
+        where = f'{where} AND username = ?' if where else 'WHERE username = ?'
+        params.append(username)
+    terms = sort_terms(sort_by)
+    table = (where, tuple(params), tuple(terms))
+    page_where, page_params, offset = where, list(params), page_current * page_size
+    by_key = [column for column, _ in terms] == ['timestamp', 'id'] and terms[0][1] == terms[1][1]
+    if by_key:
+        known_page, after = cache.nearest_page(table, page_current)
+        if after is not None:
+            condition = f"(timestamp, id) {'<' if terms[0][1] == 'DESC' else '>'} (?, ?)"
+            page_where = f'{where} AND {condition}' if where else f'WHERE {condition}'
+            page_params.extend(after)
+            offset = (page_current - known_page) * page_size
+    with metrics.SQL_QUERY_SECONDS.time(('readings_page',)):
+        cursor = conn.execute(
+            f"SELECT {', '.join(TABLE_COLUMNS)} FROM incubator_readings {page_where} "
+            f"{order_by_clause(sort_by)} LIMIT ? OFFSET ?",
+            [*page_params, page_size, offset]
+        )
+        rows = [dict(zip(TABLE_COLUMNS, row)) for row in cursor.fetchall()]
+    metrics.SQL_QUERY_ROWS.inc(len(rows), ('readings_page',))
+    if by_key and len(rows) == page_size:
+        cache.remember(table, page_current + 1, (rows[-1]['timestamp'], rows[-1]['id']))
+    for row in rows:
+        row['timestamp'] = schema.format_timestamp(row['timestamp'])
+    with metrics.SQL_QUERY_SECONDS.time(('readings_count',)):
+        count = cache.count((where, tuple(params)), lambda: count_rows(conn, where, params))
+    return rows, max(1, -(-count // page_size))
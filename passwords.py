@@ -0,0 +1,184 @@
+"""
+Password hashing with scrypt, run on a small bounded pool of worker threads.
+
+A scrypt hash costs tens of milliseconds of CPU and 16 MiB of memory by design. Hashing
+on the request threads would let a burst of logins take every core, so hashes run on
+`HASH_WORKERS` threads (`hashlib.scrypt` releases the GIL) and at most `MAX_PENDING`
+may be running or queued. Beyond that `HasherBusy` is raised at once and the login is
+answered with a retry hint, so other routes keep their share of the CPU.
+
+Passwords are stored as 'scrypt$n$r$p$salt$hash'. Passwords stored by older versions as
+a SHA-256 'hash:salt' still verify, and are rehashed with scrypt on the next login, as
+are hashes made with a different cost. Tune the cost with EMM_SCRYPT_N (a power of two)
+and the pool with EMM_HASH_WORKERS.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import metrics
+
+PREFIX = 'scrypt'
+
+""" Default scrypt cost parameters; 2**14, 8, 1 takes about 16 MiB and 50-100 ms per hash """
+SCRYPT_N = int(os.environ.get('EMM_SCRYPT_N', 2 ** 14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+""" Hashes run at once, and hashes running or queued before new ones are refused """
+HASH_WORKERS = int(os.environ.get('EMM_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+MAX_PENDING = 64
+
+""" Seconds a caller waits for its hash before giving up """
+HASH_TIMEOUT = 10.0
+
+
+class HasherBusy(Exception):
+    """
+    Raised when the hashing pool is full or a hash took longer than the timeout.
+    Callers should ask the client to retry after `retry_after` seconds.
+    """
+    retry_after = 1
+
+
+def legacy_hash(password, salt):
+    """
+    Hashes a password the way older versions did: one SHA-256 of password + salt.
+
+    Parameters:
+        password (str): The password.
+        salt (str): The salt.
+
+    Returns:
+        str: The hex digest.
+    """
+    return hashlib.sha256((password + salt).encode()).hexdigest()
+
+
+def _scrypt(password, salt, n, r, p):
+    start = time.perf_counter()
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                            maxmem=256 * n * r + 1024 * 1024, dklen=HASH_BYTES)
+    metrics.PASSWORD_HASH_SECONDS.observe(time.perf_counter() - start)
+    return digest
+
+
+""" PasswordHasher for hashing and verifying passwords on a bounded worker pool """
+class PasswordHasher:
+    def __init__(self, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, workers=HASH_WORKERS, max_pending=MAX_PENDING,
+                 timeout=HASH_TIMEOUT):
+        """
+        Initializes a new hasher with its own worker pool.
+
+        Parameters:
+            n (int): The scrypt CPU/memory cost, a power of two. Defaults to `SCRYPT_N`.
+            r (int): The scrypt block size. Defaults to `SCRYPT_R`.
+            p (int): The scrypt parallelism. Defaults to `SCRYPT_P`.
+            workers (int): Hashes run at once. Defaults to `HASH_WORKERS`.
+            max_pending (int): Hashes running or queued before new ones are refused.
+            timeout (float): Seconds a caller waits for its hash.
+
+        Returns:
+            None
+        """
+        self.n = n
+        self.r = r
+        self.p = p
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='PasswordHasher')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _run(self, password, salt, n, r, p):
+        if not self._slots.acquire(blocking=False):
+            metrics.PASSWORD_HASHES_REFUSED.inc()
+            raise HasherBusy("Too many passwords are being checked.")
+        try:
+            future = self._executor.submit(_scrypt, password, salt, n, r, p)
+        except RuntimeError:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            metrics.PASSWORD_HASHES_REFUSED.inc()
+            raise HasherBusy("Checking the password took too long.") from None
+
+    def hash(self, password):
+        """
+        Hashes a password with a new random salt.
+
+        Parameters:
+            password (str): The password.
+
+        Returns:
+            str: The encoded hash, 'scrypt$n$r$p$salt$hash'.
+
+        Raises:
+            HasherBusy: If the pool is full.
+        """
+        salt = secrets.token_bytes(SALT_BYTES)
+        digest = self._run(password, salt, self.n, self.r, self.p)
+        return f'{PREFIX}${self.n}${self.r}${self.p}${salt.hex()}${digest.hex()}'
+
+    def verify(self, password, stored):
+        """
+        Checks a password against a stored hash, scrypt or legacy SHA-256.
+
+        Parameters:
+            password (str): The password to check.
+            stored (str): The stored hash.
+
+        Returns:
+            tuple: Whether the password matches, and whether the stored hash should be
+            replaced by `hash(password)` because it is legacy or uses another cost.
+
+        Raises:
+            HasherBusy: If the pool is full.
+        """
+        if stored.startswith(PREFIX + '$'):
+            try:
+                _, n, r, p, salt, digest = stored.split('$')
+                n, r, p, salt, digest = int(n), int(r), int(p), bytes.fromhex(salt), bytes.fromhex(digest)
+            except ValueError:
+                return False, False
+            matches = hmac.compare_digest(self._run(password, salt, n, r, p), digest)
+            return matches, matches and (n, r, p) != (self.n, self.r, self.p)
+        digest, _, salt = stored.partition(':')
+        matches = hmac.compare_digest(legacy_hash(password, salt), digest)
+        return matches, matches
+
+    def close(self):
+        """
+        Shuts the worker pool down once queued hashes are done.
+
+        Returns:
+            None
+        """
+        self._executor.shutdown(wait=False)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """
+    Returns the process-wide hasher, creating it on first use.
+
+    Returns:
+        PasswordHasher: The shared hasher.
+    """
+    global _hasher
+    with _hasher_lock:
+        if _hasher is None:
+            _hasher = PasswordHasher()
+        return _hasher
@@ -0,0 +1,290 @@
+"""
+Compact in-memory windows of one incubator's recent readings, in preallocated NumPy arrays.
+
+A reading is held as four columns: int64 id, int64 epoch timestamp and float32
+temperature and humidity, 24 bytes in all, where a pandas frame read from the database
+also keeps a float64 for each value and a Python string for the username of every row.
+
+Readings are appended after the newest one and never overwritten in place: when the
+arrays are full, the newest `capacity` readings are copied into fresh arrays. A
+`ReadingWindow` handed out is therefore a zero-copy view that never changes under its
+reader, however many readings are appended later.
+"""
+import numpy as np
+import pandas as pd
+
+""" The columns of a window, in the order of the readings table """
+COLUMNS = ('id', 'timestamp', 'temperature', 'humidity')
+
+DTYPES = {'id': np.int64, 'timestamp': np.int64, 'temperature': np.float32, 'humidity': np.float32}
+
+""" Decimals float32 values are rounded to when widened, so 36.8 is not sent as 36.79999923706055 """
+DECIMALS = 3
+
+""" Readings a new ring allocates room for before it grows towards its capacity """
+MIN_SIZE = 64
+
+
+def widen(values):
+    """
+    Converts float32 readings to float64 for pandas, JSON and plotting.
+
+    Parameters:
+        values (numpy.ndarray): The values.
+
+    Returns:
+        numpy.ndarray: The values as float64, rounded to `DECIMALS` if they were float32.
+    """
+    if values.dtype == np.float32:
+        return np.round(values.astype(np.float64), DECIMALS)
+    return values
+
+
+""" ReadingWindow for a read-only view of consecutive readings of one incubator """
+class ReadingWindow:
+    __slots__ = ('username', 'ids', 'timestamps', 'temperatures', 'humidities', 'is_sorted')
+
+    def __init__(self, username, ids, timestamps, temperatures, humidities, is_sorted=True):
+        """
+        Initializes a window over column arrays, without copying them.
+
+        Parameters:
+            username (str): The incubator's username.
+            ids (numpy.ndarray): The reading ids, ascending.
+            timestamps (numpy.ndarray): The epoch timestamps.
+            temperatures (numpy.ndarray): The temperatures.
+            humidities (numpy.ndarray): The humidities.
+            is_sorted (bool): Whether the timestamps are ascending, so ranges can be found
+                by binary search.
+
+        Returns:
+            None
+        """
+        self.username = username
+        self.ids = ids
+        self.timestamps = timestamps
+        self.temperatures = temperatures
+        self.humidities = humidities
+        self.is_sorted = is_sorted
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, column):
+        """
+        Returns one column, by its name in the readings table.
+        """
+        return {'id': self.ids, 'timestamp': self.timestamps, 'temperature': self.temperatures,
+                'humidity': self.humidities}[column]
+
+    @property
+    def empty(self):
+        return len(self.ids) == 0
+
+    @property
+    def last_id(self):
+        """
+        The highest reading id in the window, or 0 if it is empty.
+        """
+        return int(self.ids[-1]) if len(self.ids) else 0
+
+    @property
+    def nbytes(self):
+        """
+        The bytes of the readings in the window.
+        """
+        return self.ids.nbytes + self.timestamps.nbytes + self.temperatures.nbytes + self.humidities.nbytes
+
+    def _slice(self, selection):
+        return ReadingWindow(self.username, self.ids[selection], self.timestamps[selection],
+                             self.temperatures[selection], self.humidities[selection], self.is_sorted)
+
+    def since(self, after_id, limit=None):
+        """
+        Returns the readings with an id above `after_id`, as a view.
+
+        Parameters:
+            after_id (int): The highest reading id the caller has already seen.
+            limit (int): Return at most this many of the oldest matching readings.
+
+        Returns:
+            ReadingWindow: The newer readings.
+        """
+        start = int(np.searchsorted(self.ids, after_id, side='right'))
+        return self._slice(slice(start, None if limit is None else start + limit))
+
+    def between(self, start, end):
+        """
+        Returns the readings with a timestamp between `start` and `end`, inclusive.
+
+        While the timestamps are ascending this is a binary search and a view; readings
+        that arrived out of order make it a filtered copy.
+
+        Parameters:
+            start (int): The earliest timestamp in epoch seconds.
+            end (int): The latest timestamp in epoch seconds.
+
+        Returns:
+            ReadingWindow: The matching readings.
+        """
+        if self.is_sorted:
+            lo = int(np.searchsorted(self.timestamps, start, side='left'))
+            hi = int(np.searchsorted(self.timestamps, end, side='right'))
+            return self._slice(slice(lo, hi))
+        return self._slice((self.timestamps >= start) & (self.timestamps <= end))
+
+    def take(self, indices):
+        """
+        Returns the readings at some positions, e.g. those chosen by `downsampling.downsample`.
+
+        Parameters:
+            indices (numpy.ndarray): Ascending positions in the window.
+
+        Returns:
+            ReadingWindow: A copy holding the selected readings.
+        """
+        return self._slice(indices)
+
+    def to_frame(self, columns=None):
+        """
+        Copies the window into a pandas frame, with the username and float64 values.
+
+        Parameters:
+            columns (list): The columns to include. Defaults to all of them, with 'username'.
+
+        Returns:
+            pandas.DataFrame: The readings, oldest first.
+        """
+        if columns is None:
+            columns = ['id', 'username', 'timestamp', 'temperature', 'humidity']
+        data = {}
+        for column in columns:
+            if column == 'username':
+                data[column] = pd.Series([self.username] * len(self), dtype=object)
+            else:
+                data[column] = widen(self[column])
+        return pd.DataFrame(data, columns=columns)
+
+
+""" ReadingRing for a bounded window of one incubator's newest readings """
+class ReadingRing:
+    def __init__(self, username, capacity, headroom=None):
+        """
+        Initializes an empty ring. Its arrays grow as readings arrive until they hold
+        `capacity` readings plus `headroom`, and stay that size from then on.
+
+        Appends write past the newest reading until the headroom is used up, then the newest
+        `capacity` readings are copied into new arrays, so each reading is copied about
+        `capacity / headroom` times in all and views handed out are never written to.
+
+        Parameters:
+            username (str): The incubator's username.
+            capacity (int): The number of newest readings kept.
+            headroom (int): Extra readings allocated beyond the capacity. Defaults to a
+                quarter of the capacity.
+
+        Returns:
+            None
+        """
+        self.username = username
+        self.capacity = capacity
+        self.headroom = max(1, capacity // 4 if headroom is None else headroom)
+        self._columns = self._allocate(min(MIN_SIZE, capacity + self.headroom))
+        self._start = 0
+        self._end = 0
+        self._sorted = True
+
+    @staticmethod
+    def _allocate(size):
+        return {column: np.empty(size, dtype=DTYPES[column]) for column in COLUMNS}
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def last_id(self):
+        """
+        The highest reading id in the ring, or 0 if it is empty.
+        """
+        return int(self._columns['id'][self._end - 1]) if self._end > self._start else 0
+
+    @property
+    def nbytes(self):
+        """
+        The bytes allocated for the ring's arrays, headroom included.
+        """
+        return sum(array.nbytes for array in self._columns.values())
+
+    @property
+    def bytes_per_reading(self):
+        """
+        The bytes allocated per reading held, or per reading of capacity while the ring is empty.
+        """
+        return self.nbytes / (len(self) or self.capacity)
+
+    def append(self, ids, timestamps, temperatures, humidities):
+        """
+        Appends readings newer than those in the ring, dropping the oldest beyond the capacity.
+
+        Parameters:
+            ids (numpy.ndarray): The reading ids, ascending and above `last_id`.
+            timestamps (numpy.ndarray): The epoch timestamps.
+            temperatures (numpy.ndarray): The temperatures.
+            humidities (numpy.ndarray): The humidities.
+
+        Returns:
+            None
+        """
+        new = {'id': np.asarray(ids), 'timestamp': np.asarray(timestamps),
+               'temperature': np.asarray(temperatures), 'humidity': np.asarray(humidities)}
+        count = len(new['id'])
+        if count == 0:
+            return
+        if count > self.capacity:
+            new = {column: values[-self.capacity:] for column, values in new.items()}
+            count = self.capacity
+        kept = min(len(self), self.capacity - count)
+        if self._end + count > len(self._columns['id']):
+            size = min(self.capacity + self.headroom, max(MIN_SIZE, 2 * (kept + count)))
+            columns = self._allocate(size)
+            for column, array in columns.items():
+                array[:kept] = self._columns[column][self._end - kept:self._end]
+            self._columns, self._start, self._end = columns, 0, kept
+            self._sorted = bool(np.all(np.diff(columns['timestamp'][:kept]) >= 0))
+        elif len(self) > kept:
+            self._start = self._end - kept
+        timestamps = new['timestamp']
+        if self._sorted and (np.any(np.diff(timestamps) < 0)
+                             or (self._end > self._start and timestamps[0] < self._columns['timestamp'][self._end - 1])):
+            self._sorted = False
+        for column, array in self._columns.items():
+            array[self._end:self._end + count] = new[column]
+        self._end += count
+
+    def append_frame(self, frame):
+        """
+        Appends the rows of a readings frame, skipping those not newer than `last_id`.
+
+        Parameters:
+            frame (pandas.DataFrame): Readings with 'id', 'timestamp', 'temperature' and
+                'humidity' columns, ordered by id.
+
+        Returns:
+            None
+        """
+        if len(self) and not frame.empty:
+            frame = frame[frame['id'] > self.last_id]
+        self.append(frame['id'].values, frame['timestamp'].values, frame['temperature'].values,
+                    frame['humidity'].values)
+
+    def window(self):
+        """
+        Returns the readings in the ring as a zero-copy view.
+
+        Returns:
+            ReadingWindow: The readings, oldest first.
+        """
+        selection = slice(self._start, self._end)
+        columns = self._columns
+        return ReadingWindow(self.username, columns['id'][selection], columns['timestamp'][selection],
+                             columns['temperature'][selection], columns['humidity'][selection], self._sorted)
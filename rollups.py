@@ -0,0 +1,135 @@
+import time
+
+import pandas as pd
+
+import metrics
+import schema
+
+""" Rollup resolutions as (table suffix, bucket seconds), coarsest first """
+RESOLUTIONS = schema.ROLLUP_RESOLUTIONS
+
+""" Minimum number of buckets a rollup must give for a range before it is used """
+MIN_POINTS = 500
+
+UPSERT_ROLLUP_SQL = '''INSERT INTO incubator_readings_{suffix}
+                            (username, bucket, count, temperature_min, temperature_max, temperature_sum,
+                             humidity_min, humidity_max, humidity_sum)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (username, bucket) DO UPDATE SET
+                            count = count + excluded.count,
+                            temperature_min = MIN(temperature_min, excluded.temperature_min),
+                            temperature_max = MAX(temperature_max, excluded.temperature_max),
+                            temperature_sum = temperature_sum + excluded.temperature_sum,
+                            humidity_min = MIN(humidity_min, excluded.humidity_min),
+                            humidity_max = MAX(humidity_max, excluded.humidity_max),
+                            humidity_sum = humidity_sum + excluded.humidity_sum'''
+
+QUERY_ROLLUP_SQL = '''SELECT bucket, SUM(count),
+                             MIN(temperature_min), MAX(temperature_max), SUM(temperature_sum) / SUM(count),
+                             MIN(humidity_min), MAX(humidity_max), SUM(humidity_sum) / SUM(count)
+                      FROM incubator_readings_{suffix}
+                      WHERE bucket BETWEEN ? AND ? {user_filter}
+                      GROUP BY bucket ORDER BY bucket'''
+
+ROLLUP_COLUMNS = ['bucket', 'count', 'temperature_min', 'temperature_max', 'temperature',
+                  'humidity_min', 'humidity_max', 'humidity']
+
+
+def update_rollups(conn, rows):
+    """
+    Folds newly inserted readings into every rollup table.
+
+    Readings are first aggregated per user and bucket in memory, so each rollup row is
+    upserted once per batch. Call this in the same transaction as the insert.
+
+    Parameters:
+        conn (sqlite3.Connection): A connection to the database.
+        rows (list): (username, timestamp, temperature, humidity) tuples.
+
+    Returns:
+        None
+    """
+    for suffix, seconds in RESOLUTIONS:
+        buckets = {}
+        for username, timestamp, temperature, humidity in rows:
+            key = (username, schema.to_epoch(timestamp) // seconds * seconds)
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = [1, temperature, temperature, temperature, humidity, humidity, humidity]
+            else:
+                agg[0] += 1
+                agg[1] = min(agg[1], temperature)
+                agg[2] = max(agg[2], temperature)
+                agg[3] += temperature
+                agg[4] = min(agg[4], humidity)
+                agg[5] = max(agg[5], humidity)
+                agg[6] += humidity
+        conn.executemany(UPSERT_ROLLUP_SQL.format(suffix=suffix),
+                         [(*key, *agg) for key, agg in buckets.items()])
+
+
+def choose_resolution(start, end, min_points=MIN_POINTS, retention=None, now=None):
+    """
+    Picks the coarsest rollup that still gives at least `min_points` buckets for a range.
+
+    A rollup whose retention no longer reaches back to `start` has been pruned there, so
+    the next coarser rollup that still holds the range is picked instead, even though it
+    gives fewer buckets.
+
+    Parameters:
+        start (int): The start of the range in epoch seconds.
+        end (int): The end of the range in epoch seconds.
+        min_points (int): The minimum number of buckets. Defaults to `MIN_POINTS`.
+        retention (dict): Days each table keeps its rows, None for forever, as in
+            `maintenance.RETENTION_DAYS`. Defaults to keeping every rollup forever.
+        now (float): The current time in epoch seconds. Defaults to the current time.
+
+    Returns:
+        tuple: The (table suffix, bucket seconds) of the rollup, or None if raw readings are needed.
+    """
+    retention = retention or {}
+    now = time.time() if now is None else now
+    coarser = None
+    for suffix, seconds in RESOLUTIONS:
+        days = retention.get(f'incubator_readings_{suffix}')
+        retained = days is None or start >= now - days * 86400
+        if (end - start) / seconds >= min_points:
+            return (suffix, seconds) if retained else coarser
+        if retained:
+            coarser = suffix, seconds
+    return None
+
+
+def query_range(conn, start, end, username=None, min_points=MIN_POINTS, retention=None):
+    """
+    Reads a time range from the coarsest rollup with enough resolution.
+
+    Parameters:
+        conn (sqlite3.Connection): A connection to the database.
+        start (str or int): The start of the range, see `schema.to_epoch`.
+        end (str or int): The end of the range, see `schema.to_epoch`.
+        username (str): Only include this user's readings. Defaults to all users.
+        min_points (int): The minimum number of buckets. Defaults to `MIN_POINTS`.
+        retention (dict): Days each table keeps its rows, see `choose_resolution`.
+
+    Returns:
+        pandas.DataFrame: One row per bucket with its start as the epoch 'timestamp', the mean 'temperature'
+            and 'humidity', their minima and maxima, and the reading 'count'; or None when the
+            range is too short for any rollup and raw readings should be read instead.
+    """
+    start, end = schema.to_epoch(start), schema.to_epoch(end)
+    resolution = choose_resolution(start, end, min_points, retention)
+    if resolution is None:
+        return None
+    suffix, seconds = resolution
+    params = [start // seconds * seconds, end]
+    user_filter = ''
+    if username is not None:
+        user_filter = 'AND username = ?'
+        params.append(username)
+    with metrics.SQL_QUERY_SECONDS.time((f'rollup_{suffix}',)):
+        rows = conn.execute(QUERY_ROLLUP_SQL.format(suffix=suffix, user_filter=user_filter), params).fetchall()
+    metrics.SQL_QUERY_ROWS.inc(len(rows), (f'rollup_{suffix}',))
+    frame = pd.DataFrame(rows, columns=ROLLUP_COLUMNS)
+    frame.insert(0, 'timestamp', frame['bucket'])
+    return frame
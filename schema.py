@@ -0,0 +1,182 @@
+"""
+The authoritative schema of the incubator readings tables, and its migrations.
+
+Readings are stored with integer epoch-second timestamps (UTC). Per-user and time-window
+queries are served by the (username, timestamp) and (timestamp) indexes. Call
+`ensure_schema` on a connection before reading or writing readings; it creates missing
+tables and converts databases written by older versions in place.
+
+Run `python schema.py [users.db]` to migrate a database file explicitly.
+"""
+import calendar
+import logging
+import sqlite3
+import sys
+import time
+from functools import lru_cache
+
+import pandas as pd
+
+""" Version stored in PRAGMA user_version once a database has this schema """
+SCHEMA_VERSION = 1
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+READINGS_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS incubator_readings (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            username TEXT NOT NULL,
+                            timestamp INTEGER NOT NULL,
+                            temperature REAL NOT NULL,
+                            humidity REAL NOT NULL
+                        )'''
+
+READINGS_INDEXES_SQL = (
+    'CREATE INDEX IF NOT EXISTS ix_incubator_readings_username_timestamp ON incubator_readings (username, timestamp)',
+    'CREATE INDEX IF NOT EXISTS ix_incubator_readings_timestamp ON incubator_readings (timestamp)',
+)
+
+INSERT_READING_SQL = "INSERT INTO incubator_readings (username, timestamp, temperature, humidity) VALUES (?, ?, ?, ?)"
+
+""" Rollup resolutions as (table suffix, bucket seconds), coarsest first """
+ROLLUP_RESOLUTIONS = [('1d', 86400), ('1h', 3600), ('1m', 60)]
+
+ROLLUP_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS incubator_readings_{suffix} (
+                            username TEXT NOT NULL,
+                            bucket INTEGER NOT NULL,
+                            count INTEGER NOT NULL,
+                            temperature_min REAL NOT NULL,
+                            temperature_max REAL NOT NULL,
+                            temperature_sum REAL NOT NULL,
+                            humidity_min REAL NOT NULL,
+                            humidity_max REAL NOT NULL,
+                            humidity_sum REAL NOT NULL,
+                            PRIMARY KEY (username, bucket)
+                        )'''
+
+ROLLUP_BUCKET_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS ix_incubator_readings_{suffix}_bucket ON incubator_readings_{suffix} (bucket)'
+
+REBUILD_ROLLUP_SQL = '''INSERT INTO incubator_readings_{suffix}
+                            SELECT username, timestamp / {seconds} * {seconds},
+                                   COUNT(*), MIN(temperature), MAX(temperature), SUM(temperature),
+                                   MIN(humidity), MAX(humidity), SUM(humidity)
+                            FROM incubator_readings GROUP BY 1, 2'''
+
+# Version 0 stored timestamps as local 'YYYY-MM-DD HH:MM:SS' text; the 'utc' modifier converts local time to UTC.
+MIGRATE_READINGS_SQL = '''INSERT INTO incubator_readings (id, username, timestamp, temperature, humidity)
+                            SELECT id, {username}, epoch, temperature, humidity FROM (
+                                SELECT *, CASE WHEN typeof(timestamp) IN ('integer', 'real')
+                                               THEN CAST(timestamp AS INTEGER)
+                                               ELSE CAST(strftime('%s', timestamp, 'utc') AS INTEGER) END AS epoch
+                                FROM incubator_readings_legacy
+                            )
+                            WHERE epoch IS NOT NULL AND temperature IS NOT NULL AND humidity IS NOT NULL'''
+
+
+@lru_cache(maxsize=4096)
+def _minute_epoch(minute):
+    return calendar.timegm(time.strptime(minute, '%Y-%m-%d %H:%M'))
+
+
+def to_epoch(timestamp):
+    """
+    Converts a timestamp to epoch seconds. Strings without a zone are read as UTC, which is
+    how the dashboard displays timestamps.
+
+    Parameters:
+        timestamp (str or int): Epoch seconds, a 'YYYY-MM-DD HH:MM:SS' string, or a shorter
+            or longer ISO string such as one from a graph's relayoutData.
+
+    Returns:
+        int: The epoch seconds.
+    """
+    if isinstance(timestamp, (int, float)):
+        return int(timestamp)
+    if len(timestamp) == 19 and timestamp[10] in ' T':
+        # The common case: parse the minute once and add the seconds.
+        try:
+            return _minute_epoch(f'{timestamp[:10]} {timestamp[11:16]}') + int(timestamp[17:19])
+        except ValueError:
+            pass
+    return int(pd.Timestamp(timestamp).timestamp())
+
+
+def format_timestamp(seconds):
+    """
+    Formats epoch seconds for display.
+
+    Parameters:
+        seconds (int): The epoch seconds.
+
+    Returns:
+        str: The 'YYYY-MM-DD HH:MM:SS' timestamp in UTC.
+    """
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds))
+
+
+def _table_columns(conn, table):
+    return {row[1]: row[2].upper() for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _migrate_readings(conn, columns):
+    username = 'username' if 'username' in columns else "''"
+    conn.execute('ALTER TABLE incubator_readings RENAME TO incubator_readings_legacy')
+    conn.execute(READINGS_TABLE_SQL)
+    moved = conn.execute(MIGRATE_READINGS_SQL.format(username=username)).rowcount
+    conn.execute('DROP TABLE incubator_readings_legacy')
+    # Rollups of the old text timestamps were bucketed differently; rebuild them.
+    for suffix, _ in ROLLUP_RESOLUTIONS:
+        conn.execute(f'DROP TABLE IF EXISTS incubator_readings_{suffix}')
+    logging.info(f"Migrated {moved} incubator readings to schema version {SCHEMA_VERSION}.")
+
+
+def ensure_schema(conn):
+    """
+    Creates or migrates the readings and rollup tables and their indexes.
+
+    Databases already at `SCHEMA_VERSION` return after a single PRAGMA. Otherwise the work
+    runs in one immediate transaction, so concurrent processes migrate a file only once.
+    A new, empty file is switched to incremental auto-vacuum first.
+    A readings table from an older version (text timestamps, or the dashboard's old model
+    without a username) is rebuilt in place with epoch timestamps, and the rollup tables
+    are filled from the readings when they are created.
+
+    Parameters:
+        conn (sqlite3.Connection): A connection to the database, outside a transaction.
+
+    Returns:
+        None
+    """
+    if conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION:
+        return
+    if conn.execute('PRAGMA page_count').fetchone()[0] == 0:
+        # Only an empty file can pick its auto-vacuum mode without a full VACUUM; incremental
+        # lets maintenance.py return freed pages to the file system a few at a time.
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            columns = _table_columns(conn, 'incubator_readings')
+            if columns and (columns.get('timestamp') != 'INTEGER' or 'username' not in columns):
+                _migrate_readings(conn, columns)
+            conn.execute(READINGS_TABLE_SQL)
+            for index_sql in READINGS_INDEXES_SQL:
+                conn.execute(index_sql)
+            for suffix, seconds in ROLLUP_RESOLUTIONS:
+                created = not _table_columns(conn, f'incubator_readings_{suffix}')
+                conn.execute(ROLLUP_TABLE_SQL.format(suffix=suffix))
+                conn.execute(ROLLUP_BUCKET_INDEX_SQL.format(suffix=suffix))
+                if created:
+                    conn.execute(REBUILD_ROLLUP_SQL.format(suffix=suffix, seconds=seconds))
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+if __name__ == '__main__':
+    db_name = sys.argv[1] if len(sys.argv) > 1 else 'users.db'
+    connection = sqlite3.connect(db_name)
+    ensure_schema(connection)
+    connection.close()
+    print(f"{db_name} is at schema version {SCHEMA_VERSION}.")
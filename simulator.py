@@ -0,0 +1,83 @@
+import time
+
+import numpy as np
+
+
+""" ReadingSimulator for generating readings from many virtual incubators """
+class ReadingSimulator:
+    def __init__(self, incubators=100, rate=1000.0, usernames=None, tick=0.1, seed=None):
+        """
+        Initializes a new simulator.
+
+        Readings are generated in vectorized NumPy batches with the same ranges as
+        `data_generator.generate_data`. Virtual incubators report in turn, so each one
+        produces `rate / incubators` readings per second.
+
+        Parameters:
+            incubators (int): The number of virtual incubators. Defaults to 100.
+            rate (float): Aggregate readings per second across all incubators. Defaults to 1000.
+            usernames (list): Owners to assign the incubators to, round-robin. Defaults to one
+                synthetic owner per incubator, named 'incubator-0001' and so on.
+            tick (float): Seconds between batches when running. Defaults to 0.1.
+            seed (int): Seed for the random generator, for repeatable runs.
+
+        Returns:
+            None
+        """
+        if not usernames:
+            usernames = [f'incubator-{i + 1:04d}' for i in range(incubators)]
+        self.owners = np.array([usernames[i % len(usernames)] for i in range(incubators)], dtype=object)
+        self.incubators = incubators
+        self.rate = rate
+        self.tick = tick
+        self.generated = 0
+        self._next_incubator = 0
+        self._rng = np.random.default_rng(seed)
+
+    def generate_batch(self, size):
+        """
+        Generates the next `size` readings, all stamped with the current epoch second.
+
+        Parameters:
+            size (int): The number of readings.
+
+        Returns:
+            list: (username, timestamp, temperature, humidity) tuples.
+        """
+        owners = self.owners[(self._next_incubator + np.arange(size)) % self.incubators]
+        self._next_incubator = (self._next_incubator + size) % self.incubators
+        temperatures = self._rng.uniform(36, 37.5, size).round(2)
+        humidities = self._rng.uniform(45, 55, size).round(2)
+        timestamp = int(time.time())
+        self.generated += size
+        return list(zip(owners.tolist(), [timestamp] * size, temperatures.tolist(), humidities.tolist()))
+
+    def run(self, sink, stop_event):
+        """
+        Generates readings at `rate` per second until `stop_event` is set.
+
+        Every `tick` seconds one batch is handed to `sink`. If `sink` blocks, for example
+        because an ingestion queue is full, the simulator falls behind instead of bursting
+        to catch up, so the achieved rate shows what the sink can absorb.
+
+        Parameters:
+            sink (callable): Receives each batch, e.g. `IngestionWriter.submit_many`.
+            stop_event (threading.Event): Set to stop the simulator.
+
+        Returns:
+            None
+        """
+        pending = 0.0
+        next_tick = time.monotonic()
+        while not stop_event.is_set():
+            pending += self.rate * self.tick
+            size = int(pending)
+            pending -= size
+            if size:
+                sink(self.generate_batch(size))
+            next_tick += self.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                stop_event.wait(delay)
+            else:
+                next_tick = time.monotonic()
@@ -0,0 +1,96 @@
+import unittest
+
+from alerts import AlertEngine
+
+
+class TestAlertEngine(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up an engine with the default limits.
+        """
+        self.engine = AlertEngine()
+        self.start = 1704067200
+
+    def process(self, rows):
+        # Checked as they arrive, with the newest reading of the batch taken as the current time.
+        return self.engine.process(rows, now=max(row[1] for row in rows))
+
+    def test_normal_readings_raise_nothing(self):
+        """
+        Test that readings in the generate_data ranges raise no alerts.
+        """
+        rows = [('mary', self.start + 5 * i, 36 + (i % 4) / 2, 45 + (i % 3) * 5) for i in range(100)]
+        self.assertEqual(self.process(rows), [])
+        self.assertEqual(self.engine.readings_checked, 100)
+
+    def test_out_of_range_alerts_once_until_recovered(self):
+        """
+        Test that a limit is reported when first broken, and again only after recovering.
+        """
+        self.process([('mary', self.start, 37.0, 50.0)])
+        alerts = self.process([('mary', self.start + 3600, 39.0, 50.0),
+                                      ('mary', self.start + 7200, 39.0, 50.0),
+                                      ('james', self.start + 7200, 37.0, 80.0)])
+        self.assertEqual([(a['username'], a['rule']) for a in alerts],
+                         [('mary', 'temperature_out_of_range'), ('james', 'humidity_out_of_range')])
+        self.assertEqual(self.process([('mary', self.start + 10800, 39.0, 50.0)]), [])
+        self.process([('mary', self.start + 14400, 37.0, 50.0)])
+        alerts = self.process([('mary', self.start + 18000, 39.0, 50.0)])
+        self.assertEqual([a['rule'] for a in alerts], ['temperature_out_of_range'])
+
+    def test_rate_of_change(self):
+        """
+        Test that fast changes are reported across batches and within one batch.
+        """
+        self.process([('mary', self.start, 36.0, 50.0)])
+        alerts = self.process([('mary', self.start + 30, 38.5, 50.0)])
+        self.assertEqual([a['rule'] for a in alerts], ['temperature_rate'])
+        self.assertIn('2.50 °C per minute', alerts[0]['message'])
+        alerts = self.process([('james', self.start, 37.0, 50.0), ('james', self.start + 60, 37.0, 66.0)])
+        self.assertEqual([a['rule'] for a in alerts], ['humidity_rate'])
+
+    def test_stale_sensor(self):
+        """
+        Test that a silent incubator is reported once and cleared by its next reading.
+        """
+        self.process([('mary', self.start, 37.0, 50.0), ('james', self.start + 200, 37.0, 50.0)])
+        alerts = self.engine.check_stale(now=self.start + 400)
+        self.assertEqual([(a['username'], a['rule']) for a in alerts], [('mary', 'stale_sensor')])
+        self.assertEqual(self.engine.check_stale(now=self.start + 450), [])
+        self.process([('mary', self.start + 460, 37.0, 50.0)])
+        self.assertEqual(len(self.engine.check_stale(now=self.start + 800)), 2)
+
+    def test_backfilled_readings_raise_nothing(self):
+        """
+        Test that old readings neither roll an incubator's state back nor raise alerts.
+        """
+        now = self.start + 365 * 86400
+        self.engine.process([('mary', now, 37.0, 50.0)], now=now)
+        history = [(username, self.start + 5 * i, 30.0, 50.0) for i in range(10) for username in ('mary', 'james')]
+        self.assertEqual(self.engine.process(history, now=now + 5), [])
+        self.assertEqual(self.engine.check_stale(now=now + 10), [])
+        alerts = self.engine.process([('mary', now + 15, 30.0, 50.0), ('james', now + 15, 30.0, 50.0)], now=now + 15)
+        self.assertEqual([(a['username'], a['rule']) for a in alerts],
+                         [('mary', 'temperature_out_of_range'), ('mary', 'temperature_rate'),
+                          ('james', 'temperature_out_of_range')])
+
+    def test_recent(self):
+        """
+        Test that recent alerts are listed newest first and can be filtered by user.
+        """
+        self.process([('mary', self.start, 30.0, 50.0), ('james', self.start + 1, 30.0, 50.0)])
+        self.assertEqual([a['username'] for a in self.engine.recent()], ['james', 'mary'])
+        self.assertEqual([a['time'] for a in self.engine.recent('james')], ['2024-01-01 00:00:01'])
+
+    def test_many_incubators(self):
+        """
+        Test that state grows past the initial capacity.
+        """
+        rows = [(f'incubator-{i:04d}', self.start, 37.0, 50.0) for i in range(200)]
+        self.process(rows)
+        rows = [(f'incubator-{i:04d}', self.start + 60, 37.0 if i % 2 else 40.0, 50.0) for i in range(200)]
+        self.assertEqual(len(self.process(rows)), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
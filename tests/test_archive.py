@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import archive
+import schema
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a readings table spanning three days and an empty archive directory.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.archive_dir = os.path.join(self.tmp_dir.name, 'archive')
+        self.conn = sqlite3.connect(':memory:')
+        schema.ensure_schema(self.conn)
+        self.day = 1704067200  # 2024-01-01 00:00:00 UTC
+        rows = [('mary', self.day + i * 21600, 36 + i / 10, 50.0) for i in range(12)]
+        with self.conn:
+            self.conn.executemany(schema.INSERT_READING_SQL, rows)
+        self.now = self.day + 3 * 86400
+
+    def tearDown(self):
+        """
+        Close the database and remove the archive.
+        """
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def test_archive_moves_whole_old_days(self):
+        """
+        Test that readings of days older than the age are moved into one file per day.
+        """
+        moved = archive.archive_readings(self.conn, self.archive_dir, max_age_days=1.5, now=self.now)
+        self.assertEqual(moved, 4)
+        self.assertEqual(os.listdir(self.archive_dir), ['readings-2024-01-01.arrow'])
+        self.assertEqual(self.conn.execute('SELECT MIN(id) FROM incubator_readings').fetchone(), (5,))
+        self.assertEqual(archive.archive_readings(self.conn, self.archive_dir, max_age_days=1.5, now=self.now), 0)
+
+    def test_archived_days_are_deleted_in_batches(self):
+        """
+        Test that an archived day is deleted in batches when a batch size is given.
+        """
+        moved = archive.archive_readings(self.conn, self.archive_dir, max_age_days=0.5, now=self.now, batch_size=3)
+        self.assertEqual(moved, 8)
+        self.assertEqual(len(archive.ReadingArchive(self.archive_dir).days()), 2)
+        self.assertEqual(self.conn.execute('SELECT MIN(id) FROM incubator_readings').fetchone(), (9,))
+
+    def test_read_range(self):
+        """
+        Test that ranges are read across days with only the requested columns.
+        """
+        archive.archive_readings(self.conn, self.archive_dir, max_age_days=1, now=self.now)
+        reader = archive.ReadingArchive(self.archive_dir)
+        self.assertEqual(reader.archived_until(), self.day + 2 * 86400)
+        frame = reader.read_range(self.day + 21600, self.day + 86400 + 21600, columns=['id', 'temperature'])
+        self.assertEqual(list(frame.columns), ['id', 'temperature'])
+        self.assertEqual(list(frame['id']), [2, 3, 4, 5, 6])
+        self.assertTrue(reader.read_range(0, 1).empty)
+        self.assertTrue(reader.read_range(self.day, self.day + 86400, username='james').empty)
+        self.assertEqual(len(reader.read_range(self.day, self.day + 86400, ['id'], username='mary')), 5)
+
+    def test_late_readings_are_merged(self):
+        """
+        Test that readings arriving for an archived day are merged into its file once.
+        """
+        archive.archive_readings(self.conn, self.archive_dir, max_age_days=2, now=self.now)
+        with self.conn:
+            self.conn.execute(schema.INSERT_READING_SQL, ('james', self.day + 60, 37.0, 51.0))
+        self.assertEqual(archive.archive_readings(self.conn, self.archive_dir, max_age_days=2, now=self.now), 1)
+        frame = archive.ReadingArchive(self.archive_dir).read_range(self.day, self.day + 86399)
+        self.assertEqual(list(frame['id']), [1, 2, 3, 4, 13])
+        self.assertEqual(list(frame['username'])[-1], 'james')
+
+    def test_reading_arriving_during_archival_is_kept(self):
+        """
+        Test that a reading inserted after its day was read is left for the next run, not deleted.
+        """
+        write_day = archive._write_day
+
+        def write_then_insert(archive_dir, day, table):
+            write_day(archive_dir, day, table)
+            with self.conn:
+                self.conn.execute(schema.INSERT_READING_SQL, ('james', day + 60, 37.0, 51.0))
+
+        # The first run archives the first day at once, the second the next day in batches.
+        for max_age_days, batch_size in ((2, None), (1, 2)):
+            with mock.patch('archive._write_day', write_then_insert):
+                moved = archive.archive_readings(self.conn, self.archive_dir, max_age_days=max_age_days,
+                                                 now=self.now, batch_size=batch_size)
+            self.assertEqual(moved, 4)
+            self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM incubator_readings WHERE username = 'james'")
+                             .fetchone(), (1,))
+            self.assertEqual(archive.archive_readings(self.conn, self.archive_dir, max_age_days=max_age_days,
+                                                      now=self.now), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
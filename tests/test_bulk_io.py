@@ -0,0 +1,133 @@
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import archive
+import bulk_io
+import schema
+
+
+class TestBulkIO(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up an in-memory database with the readings tables.
+        """
+        self.conn = sqlite3.connect(':memory:')
+        schema.ensure_schema(self.conn)
+
+    def tearDown(self):
+        """
+        Close the in-memory database.
+        """
+        self.conn.close()
+
+    def test_parse_csv(self):
+        """
+        Test that CSV lines are parsed with optional usernames and bad lines are rejected.
+        """
+        upload = (b'id,username,timestamp,temperature,humidity\n'
+                  b'7,mary,1704067200,36.5,50\n'
+                  b',,2024-01-01 00:00:05,37,51.5\n'
+                  b'9,mary,yesterday,36.5,50\n')
+        rows = list(bulk_io.parse_csv(io.BytesIO(upload), default_username='james'))
+        self.assertEqual(rows, [('mary', 1704067200, 36.5, 50.0), ('james', 1704067205, 37.0, 51.5), None])
+        rows = list(bulk_io.parse_csv(io.BytesIO(upload), username='james'))
+        self.assertEqual([row[0] for row in rows[:2]], ['james', 'james'])
+
+    def test_parse_ndjson(self):
+        """
+        Test that NDJSON lines are parsed and invalid lines are rejected.
+        """
+        upload = io.BytesIO(b'{"username": "mary", "timestamp": 1704067200, "temperature": 36.5, "humidity": 50}\n'
+                            b'\n'
+                            b'not json\n'
+                            b'[1, 2]\n'
+                            b'{"timestamp": 1704067201, "temperature": 36.5}\n')
+        rows = list(bulk_io.parse_ndjson(upload, default_username='james'))
+        self.assertEqual(rows, [('mary', 1704067200, 36.5, 50.0), None, None, None])
+
+    def test_import_in_batches(self):
+        """
+        Test that readings are inserted batch by batch together with their rollups.
+        """
+        rows = [('mary', 1704067200 + i, 36.5, 50.0) for i in range(25)] + [None]
+        imported, rejected, last_id = bulk_io.import_readings(self.conn, iter(rows), batch_size=10)
+        self.assertEqual((imported, rejected), (25, 1))
+        self.assertEqual(self.conn.execute('SELECT MAX(id) FROM incubator_readings').fetchone(), (last_id,))
+        self.assertEqual(bulk_io.import_readings(self.conn, iter(rows[:12]), batch_size=10)[2], 37)
+        self.assertEqual(self.conn.execute('SELECT SUM(count) FROM incubator_readings_1m').fetchone(), (37,))
+
+    def test_import_rejects_rows_the_table_refuses(self):
+        """
+        Test that a row the table refuses is counted as rejected and the rest of its batch kept.
+        """
+        rows = [('mary', 1704067200 + i, 36.5, 50.0) for i in range(5)]
+        rows[2] = ('mary', 1704067202, None, 50.0)
+        imported, rejected, last_id = bulk_io.import_readings(self.conn, iter(rows), batch_size=10)
+        self.assertEqual((imported, rejected, last_id), (4, 1, 4))
+        self.assertEqual(self.conn.execute('SELECT SUM(count) FROM incubator_readings_1m').fetchone(), (4,))
+
+    def test_import_runs_listeners_per_batch(self):
+        """
+        Test that the listeners see every committed batch with its highest reading id.
+        """
+        seen = []
+        rows = [('mary', 1704067200 + i, 36.5, 50.0) for i in range(25)]
+        bulk_io.import_readings(self.conn, iter(rows), batch_size=10,
+                                listeners=[lambda batch, last_id: seen.append((len(batch), last_id))])
+        self.assertEqual(seen, [(10, 10), (10, 20), (5, 25)])
+
+    def test_export_round_trip(self):
+        """
+        Test that exported CSV and NDJSON import back to the same readings.
+        """
+        rows = [('mary' if i % 2 else 'james', 1704067200 + 10 - i, 36.5 + i, 50.0) for i in range(10)]
+        bulk_io.import_readings(self.conn, rows)
+        exported = list(bulk_io.iter_readings(self.conn, start=1704067202, username='james', chunk_size=3))
+        self.assertEqual([row[2] for row in exported], [1704067202, 1704067204, 1704067206, 1704067208, 1704067210])
+        csv_text = ''.join(bulk_io.csv_chunks(exported, chunk_size=2))
+        self.assertTrue(csv_text.startswith('id,username,timestamp,temperature,humidity\n'))
+        parsed = list(bulk_io.parse_csv(io.BytesIO(csv_text.encode())))
+        self.assertEqual(parsed, [row[1:] for row in exported])
+        ndjson_text = ''.join(bulk_io.ndjson_chunks(exported, chunk_size=2))
+        self.assertEqual(list(bulk_io.parse_ndjson(io.BytesIO(ndjson_text.encode()))), parsed)
+
+    def test_export_holds_no_transaction_between_chunks(self):
+        """
+        Test that readings sharing a timestamp are exported once across chunks, and that the WAL
+        can be checkpointed while an export is half read.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_name = os.path.join(tmp_dir, 'test_users.db')
+            conn = sqlite3.connect(db_name)
+            conn.execute('PRAGMA journal_mode = WAL')
+            schema.ensure_schema(conn)
+            rows = [('mary', 1704067200 + i // 4, 36.5, 50.0) for i in range(10)]
+            bulk_io.import_readings(conn, rows)
+            exported = bulk_io.iter_readings(conn, chunk_size=3)
+            self.assertEqual([next(exported)[0] for _ in range(3)], [1, 2, 3])
+            writer = sqlite3.connect(db_name)
+            bulk_io.import_readings(writer, [('mary', 1704067300, 36.5, 50.0)])
+            self.assertEqual(writer.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()[0], 0)
+            writer.close()
+            self.assertEqual([row[0] for row in exported], list(range(4, 12)))
+            conn.close()
+
+    def test_iter_archived(self):
+        """
+        Test that archived readings are exported a day at a time in timestamp order.
+        """
+        rows = [('mary', 1704067200 + i * 43200, 36.5, 50.0) for i in range(4)]
+        bulk_io.import_readings(self.conn, rows)
+        with tempfile.TemporaryDirectory() as archive_dir:
+            archive.archive_readings(self.conn, archive_dir, max_age_days=0, now=1704067200 + 3 * 86400)
+            reader = archive.ReadingArchive(archive_dir)
+            exported = list(bulk_io.iter_archived(reader, start=1704067200 + 43200))
+            self.assertEqual([row[0] for row in exported], [2, 3, 4])
+            self.assertEqual(list(bulk_io.iter_archived(reader, username='james')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
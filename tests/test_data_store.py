@@ -0,0 +1,157 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+
+import archive
+import schema
+from data_store import ReadingStore
+from forecasting import Forecaster
+
+
+class TestReadingStore(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a temporary readings table and a store over it.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_db_name = os.path.join(self.tmp_dir.name, 'test_users.db')
+        self.conn = sqlite3.connect(self.test_db_name)
+        schema.ensure_schema(self.conn)
+        self.engine = create_engine(f'sqlite:///{self.test_db_name}')
+
+    def tearDown(self):
+        """
+        Close connections and remove the temporary database.
+        """
+        self.conn.close()
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def insert_readings(self, count, timestamp=1704067200, username='test_user'):
+        rows = [(username, timestamp + i, 36.5, 50.0) for i in range(count)]
+        with self.conn:
+            self.conn.executemany(schema.INSERT_READING_SQL, rows)
+
+    def test_refresh_appends_only_new_rows(self):
+        """
+        Test that refresh() reads only rows inserted after the previous refresh.
+        """
+        store = ReadingStore(self.engine)
+        self.insert_readings(5)
+        self.assertEqual(len(store.refresh()), 5)
+        self.assertEqual(store.last_id, 5)
+        self.insert_readings(3)
+        frame = store.refresh()
+        self.assertEqual(list(frame['id']), [6, 7, 8])
+        self.assertTrue(store.refresh().empty)
+
+    def test_refresh_is_bounded(self):
+        """
+        Test that a refresh reads only the newest max_rows readings.
+        """
+        store = ReadingStore(self.engine, max_rows=4)
+        self.insert_readings(6)
+        self.assertEqual(list(store.refresh()['id']), [3, 4, 5, 6])
+        self.insert_readings(5)
+        self.assertEqual(list(store.refresh()['id']), [8, 9, 10, 11])
+
+    def test_between_and_since_for_all_users(self):
+        """
+        Test that ranges and newer readings of all users are read from the database.
+        """
+        store = ReadingStore(self.engine, max_rows=5)
+        self.insert_readings(5, username='mary')
+        self.insert_readings(5, username='james')
+        store.refresh()
+        self.assertEqual(list(store.between(1704067203, 1704067204)['id']), [4, 5, 9, 10])
+        self.assertEqual(list(store.since(4, limit=3)['id']), [5, 6, 7])
+        self.assertEqual(list(store.since(8)['id']), [9, 10])
+
+    def test_between_reads_archived_days(self):
+        """
+        Test that ranges reaching into the archive combine archived and database readings.
+        """
+        with self.conn:
+            self.conn.executemany(schema.INSERT_READING_SQL,
+                                  [('test_user', 1704067200 + i * 43200, 36.5, 50.0) for i in range(6)])
+        archive_dir = os.path.join(self.tmp_dir.name, 'archive')
+        archive.archive_readings(self.conn, archive_dir, max_age_days=1, now=1704067200 + 3 * 86400)
+        store = ReadingStore(self.engine, max_rows=1, archive=archive.ReadingArchive(archive_dir))
+        frame = store.between(1704067200 + 43200, 1704067200 + 4 * 43200, columns=['id', 'timestamp'])
+        self.assertEqual(list(frame.columns), ['id', 'timestamp'])
+        self.assertEqual(list(frame['id']), [2, 3, 4, 5])
+        self.assertEqual(list(store.between(0, 1704067200 + 43200)['id']), [1, 2])
+
+    def test_load_reuses_recent_refresh(self):
+        """
+        Test that load() does not query again within min_interval.
+        """
+        store = ReadingStore(self.engine, min_interval=60)
+        self.insert_readings(2)
+        self.assertEqual(store.load(), 2)
+        self.insert_readings(2)
+        self.assertEqual(store.load(), 2)
+        self.assertEqual(len(store.refresh()), 2)
+
+    def test_refresh_loaded_waits_for_first_read(self):
+        """
+        Test that refresh_loaded() reads nothing until the window was loaded once.
+        """
+        store = ReadingStore(self.engine)
+        self.insert_readings(2)
+        self.assertIsNone(store.refresh_loaded())
+        self.assertEqual(store.last_id, 0)
+        store.load()
+        self.insert_readings(1)
+        self.assertEqual(len(store.refresh_loaded()), 1)
+
+    def test_user_window_holds_one_users_readings(self):
+        """
+        Test that a user's window is read through the index and extended by refresh().
+        """
+        store = ReadingStore(self.engine, user_rows=3)
+        self.insert_readings(4, username='mary')
+        self.insert_readings(2, username='james')
+        self.assertEqual(list(store.user_window('mary').ids), [2, 3, 4])
+        self.assertEqual(list(store.user_window('james').ids), [5, 6])
+        self.insert_readings(1, username='mary')
+        store.refresh()
+        self.assertEqual(list(store.user_window('mary').ids), [3, 4, 7])
+        nbytes, readings = store.memory()
+        self.assertEqual(readings, 5)
+        self.assertGreater(nbytes, 5 * 24)
+        rows = store.since(5, username='james')
+        self.assertEqual(list(rows['id']), [6])
+        self.assertEqual(list(rows['username']), ['james'])
+        self.assertEqual(rows['temperature'].iloc[0], 36.5)
+        self.assertTrue(store.user_window('nobody').empty)
+
+    def test_between_for_one_user(self):
+        """
+        Test that ranges for a user come from their window or their indexed rows only.
+        """
+        store = ReadingStore(self.engine, user_rows=2)
+        self.insert_readings(4, username='mary')
+        self.insert_readings(4, username='james')
+        self.assertEqual(list(store.between(1704067202, 1704067203, username='mary')['id']), [3, 4])
+        self.assertEqual(list(store.between(1704067200, 1704067201, username='james')['id']), [5, 6])
+
+    def test_refresh_updates_forecaster(self):
+        """
+        Test that each refresh hands only its new readings to the forecaster.
+        """
+        forecaster = Forecaster()
+        store = ReadingStore(self.engine, forecaster=forecaster)
+        self.insert_readings(12)
+        store.refresh()
+        self.insert_readings(3, timestamp=1704067300)
+        store.refresh()
+        self.assertEqual(forecaster.readings_seen, 15)
+        self.assertAlmostEqual(forecaster.forecast('test_user')['temperature'][-1], 36.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
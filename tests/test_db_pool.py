@@ -0,0 +1,81 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a pool over a temporary database.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(os.path.join(self.tmp_dir.name, 'test_users.db'), size=2, timeout=0.1)
+
+    def tearDown(self):
+        """
+        Close the pool and remove the temporary database.
+        """
+        self.pool.close()
+        self.tmp_dir.cleanup()
+
+    def test_connections_are_configured_and_reused(self):
+        """
+        Test that pooled connections use WAL and are handed out again after release.
+        """
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(conn.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+        with self.pool.connection() as again:
+            self.assertIs(again, conn)
+
+    def test_pool_size_is_bounded(self):
+        """
+        Test that acquiring beyond the pool size times out with PoolTimeout.
+        """
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire()
+        self.pool.release(first)
+        self.assertIs(self.pool.acquire(), first)
+        self.pool.release(first)
+        self.pool.release(second)
+
+    def test_release_rolls_back_open_transaction(self):
+        """
+        Test that a connection is returned without a pending transaction.
+        """
+        with self.pool.connection() as conn:
+            conn.execute('CREATE TABLE t (x INTEGER)')
+            conn.execute('INSERT INTO t VALUES (1)')
+            self.assertTrue(conn.in_transaction)
+        with self.pool.connection() as conn:
+            self.assertFalse(conn.in_transaction)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM t').fetchone()[0], 0)
+
+    def test_shared_across_threads(self):
+        """
+        Test that a connection opened in one thread can be used from another.
+        """
+        errors = []
+
+        def worker():
+            try:
+                with self.pool.connection() as conn:
+                    conn.execute('SELECT 1').fetchone()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
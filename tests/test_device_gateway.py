@@ -0,0 +1,124 @@
+import http.client
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from device_gateway import INGEST_PATH, DeviceGateway, parse_batch
+from ingestion import IngestionWriter
+
+
+class TestDeviceGateway(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a writer on a temporary database and a gateway on a free port.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_db_name = os.path.join(self.tmp_dir.name, 'test_users.db')
+        self.writer = IngestionWriter(self.test_db_name, batch_size=100, flush_interval=0.05)
+        self.writer.start()
+        self.gateways = []
+
+    def tearDown(self):
+        """
+        Stop the gateways and the writer and remove the temporary database.
+        """
+        for gateway in self.gateways:
+            gateway.close()
+        self.writer.stop(timeout=10)
+        self.tmp_dir.cleanup()
+
+    def start_gateway(self, writer, token=None):
+        gateway = DeviceGateway(writer, 0, token=token)
+        gateway.start()
+        self.assertTrue(gateway.ready.wait(5))
+        self.gateways.append(gateway)
+        return http.client.HTTPConnection('127.0.0.1', gateway.port, timeout=5)
+
+    def post(self, conn, batch, headers=None):
+        conn.request('POST', INGEST_PATH, json.dumps(batch), headers or {})
+        response = conn.getresponse()
+        return response, json.loads(response.read())
+
+    def test_parse_batch(self):
+        """
+        Test that invalid readings are rejected by position and the rest converted.
+        """
+        rows, rejected = parse_batch(json.dumps({'username': 'incubator-1', 'readings': [
+            {'timestamp': 1704067200, 'temperature': 37.1, 'humidity': 52},
+            {'timestamp': 1704067205, 'temperature': 'hot', 'humidity': 52},
+            'not a reading',
+            {'username': 'incubator-2', 'timestamp': '2024-01-01 00:00:10', 'temperature': '37.2', 'humidity': 51},
+            {'timestamp': 1704067215, 'temperature': float('nan'), 'humidity': 52},
+            {'timestamp': 1704067220, 'temperature': 37.1, 'humidity': 'Infinity'},
+            {'timestamp': float('inf'), 'temperature': 37.1, 'humidity': 52},
+            {'timestamp': 1e300, 'temperature': 37.1, 'humidity': 52},
+            {'timestamp': True, 'temperature': 37.1, 'humidity': 52},
+            {'timestamp': -1, 'temperature': 37.1, 'humidity': 52},
+        ]}).encode())
+        self.assertEqual(rows, [('incubator-1', 1704067200, 37.1, 52.0), ('incubator-2', 1704067210, 37.2, 51.0)])
+        self.assertEqual(rejected, [1, 2, 4, 5, 6, 7, 8, 9])
+        for body in (b'{', b'[]', b'{"readings": 3}'):
+            with self.assertRaises(ValueError):
+                parse_batch(body)
+
+    def test_batches_are_acknowledged_and_written(self):
+        """
+        Test that batches on one keep-alive connection are acknowledged and written.
+        """
+        conn = self.start_gateway(self.writer)
+        for batch_number in (1, 2):
+            readings = [{'timestamp': 1704067200 + i, 'temperature': 37.0, 'humidity': 50.0} for i in range(10)]
+            readings.append({'timestamp': None})
+            response, ack = self.post(conn, {'username': 'incubator-1', 'readings': readings})
+            self.assertEqual(response.status, 202)
+            self.assertEqual(ack, {'batch': batch_number, 'accepted': 10, 'rejected': [10]})
+        conn.close()
+        self.assertTrue(self.writer.flush(timeout=10))
+        db = sqlite3.connect(self.test_db_name)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM incubator_readings').fetchone()[0], 20)
+        db.close()
+
+    def test_full_queue_asks_for_retry(self):
+        """
+        Test that a batch that does not fit in the queue is refused with a retry hint.
+        """
+        # A writer that is never started keeps everything queued.
+        conn = self.start_gateway(IngestionWriter(self.test_db_name, max_queue=5))
+        readings = [{'timestamp': 1704067200 + i, 'temperature': 37.0, 'humidity': 50.0} for i in range(4)]
+        response, ack = self.post(conn, {'username': 'incubator-1', 'readings': readings})
+        self.assertEqual(response.status, 202)
+        response, ack = self.post(conn, {'username': 'incubator-1', 'readings': readings})
+        self.assertEqual(response.status, 503)
+        self.assertEqual(response.getheader('Retry-After'), '1')
+        self.assertEqual(ack['retry_after'], 1)
+        self.assertEqual(self.gateways[0].writer.queue.qsize(), 4)
+        conn.close()
+
+    def test_token_and_request_errors(self):
+        """
+        Test that a required token is checked and that bad requests get a JSON error.
+        """
+        conn = self.start_gateway(self.writer, token='secret')
+        batch = {'username': 'incubator-1', 'readings': []}
+        self.assertEqual(self.post(conn, batch)[0].status, 401)
+        self.assertEqual(self.post(conn, batch, {'Authorization': 'Bearer wrong'})[0].status, 401)
+        self.assertEqual(self.post(conn, batch, {'Authorization': 'Bearer secret'})[0].status, 202)
+        conn.request('POST', INGEST_PATH, b'{', {'Authorization': 'Bearer secret'})
+        response = conn.getresponse()
+        self.assertEqual(response.status, 400)
+        self.assertIn('error', json.loads(response.read()))
+        conn.request('GET', INGEST_PATH)
+        response = conn.getresponse()
+        response.read()
+        self.assertEqual(response.status, 405)
+        conn.request('POST', '/elsewhere', b'{}')
+        response = conn.getresponse()
+        response.read()
+        self.assertEqual(response.status, 404)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+
+import downsampling
+
+
+class TestDownsampling(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a noisy series with a single spike.
+        """
+        rng = np.random.default_rng(0)
+        self.x = np.arange(10000, dtype=np.float64)
+        self.y = rng.normal(37, 0.2, size=10000)
+        self.spike = 4321
+        self.y[self.spike] = 45.0
+
+    def test_lttb_keeps_endpoints_and_spike(self):
+        """
+        Test that LTTB returns n_out sorted indices including the endpoints and the spike.
+        """
+        indices = downsampling.lttb_indices(self.x, self.y, 200)
+        self.assertEqual(len(indices), 200)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], 9999)
+        self.assertIn(self.spike, indices)
+
+    def test_minmax_keeps_extremes(self):
+        """
+        Test that min/max buckets keep the global minimum and maximum.
+        """
+        indices = downsampling.minmax_indices(self.y, 200)
+        self.assertLessEqual(len(indices), 202)
+        self.assertIn(int(np.argmax(self.y)), indices)
+        self.assertIn(int(np.argmin(self.y)), indices)
+
+    def test_short_series_is_unchanged(self):
+        """
+        Test that series already shorter than n_out are returned whole.
+        """
+        for method in ('lttb', 'minmax'):
+            indices = downsampling.downsample(self.x[:50], self.y[:50], 100, method)
+            self.assertTrue(np.array_equal(indices, np.arange(50)))
+
+    def test_unknown_method(self):
+        """
+        Test that an unknown method raises ValueError.
+        """
+        with self.assertRaises(ValueError):
+            downsampling.downsample(self.x, self.y, 100, 'mean')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+import pandas as pd
+
+from figure_cache import FigureCache
+
+
+class TestFigureCache(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a small cache and a figure with a datetime trace.
+        """
+        self.cache = FigureCache(max_entries=3)
+        self.figure = {'data': [{'x': pd.to_datetime([1704067200], unit='s'), 'y': [36.5], 'type': 'line'}],
+                       'layout': {'title': 'Incubator Readings'}}
+
+    def test_hit_and_miss(self):
+        """
+        Test that a stored figure is returned as a copy and that lookups are counted.
+        """
+        key = ('mary', 'line', 0, 10)
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, [self.figure, 10])
+        figure, live_id = self.cache.get(key)
+        self.assertEqual(figure['data'][0]['x'], ['2024-01-01T00:00:00'])
+        self.assertEqual(live_id, 10)
+        figure['layout']['title'] = 'changed'
+        self.assertEqual(self.cache.get(key)[0]['layout']['title'], 'Incubator Readings')
+        self.assertEqual(self.cache.stats()['hits'], 2)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_newer_readings_replace_only_the_same_view(self):
+        """
+        Test that storing a newer figure drops the older one for the same view only.
+        """
+        self.cache.put(('mary', 'line', 0, 10), self.figure)
+        self.cache.put(('mary', 'bar', 0, 10), self.figure)
+        self.cache.put(('james', 'line', 0, 10), self.figure)
+        self.cache.put(('mary', 'line', 0, 11), self.figure)
+        self.assertIsNone(self.cache.get(('mary', 'line', 0, 10)))
+        self.assertIsNotNone(self.cache.get(('mary', 'bar', 0, 10)))
+        self.assertIsNotNone(self.cache.get(('james', 'line', 0, 10)))
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+        self.assertEqual(self.cache.stats()['evictions'], 0)
+
+    def test_least_recently_used_is_evicted(self):
+        """
+        Test that the least recently used figure is evicted when the cache is full.
+        """
+        for graph_type in ('line', 'bar', 'table'):
+            self.cache.put(('mary', graph_type, 0, 1), self.figure)
+        self.cache.get(('mary', 'line', 0, 1))
+        self.cache.put(('mary', 'line', 3600, 1), self.figure)
+        self.assertIsNone(self.cache.get(('mary', 'bar', 0, 1)))
+        self.assertIsNotNone(self.cache.get(('mary', 'line', 0, 1)))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual(len(self.cache), 3)
+
+    def test_invalidate_user(self):
+        """
+        Test that invalidating a user drops only that user's figures.
+        """
+        self.cache.put(('mary', 'line', 0, 1), self.figure)
+        self.cache.put(('james', 'line', 0, 1), self.figure)
+        self.assertEqual(self.cache.invalidate('mary'), 1)
+        self.assertEqual(self.cache.stats()['entries'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import fleet
+import rollups
+import schema
+
+
+class TestFleet(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up readings for four incubators: steady, out of range now, out of range earlier
+        in the hour, and silent for ten minutes.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_db_name = os.path.join(self.tmp_dir.name, 'test_users.db')
+        self.conn = sqlite3.connect(self.test_db_name)
+        schema.ensure_schema(self.conn)
+        self.now = 1704067200 + 12 * 3600
+        rows = []
+        for i in range(30):
+            timestamp = self.now - 1800 + i * 60
+            rows.append(('ann', timestamp, 37.0, 50.0))
+            rows.append(('bob', timestamp, 39.0 if i == 29 else 37.0, 50.0))
+            rows.append(('cat', timestamp, 37.0, 75.0 if i == 3 else 50.0))
+            rows.append(('dan', timestamp - 600, 37.0, 50.0))
+        rows.append(('eve', self.now - 3 * 86400, 37.0, 50.0))
+        with self.conn:
+            self.conn.executemany(schema.INSERT_READING_SQL, rows)
+            rollups.update_rollups(self.conn, rows)
+
+    def tearDown(self):
+        """
+        Close the connection and remove the temporary database.
+        """
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def test_query_fleet(self):
+        """
+        Test that one query returns each active incubator's latest reading and hourly range.
+        """
+        summary = fleet.query_fleet(self.conn, self.now)
+        self.assertEqual(list(summary['username']), ['ann', 'bob', 'cat', 'dan'])
+        self.assertEqual(list(summary['temperature']), [37.0, 39.0, 37.0, 37.0])
+        self.assertEqual(list(summary['timestamp']), [self.now - 60] * 3 + [self.now - 660])
+        self.assertEqual(list(summary['count']), [30, 30, 30, 30])
+        self.assertEqual(summary['humidity_max'][2], 75.0)
+        empty = fleet.query_fleet(self.conn, self.now + 30 * 86400)
+        self.assertEqual(len(empty['username']), 0)
+
+    def test_health_and_cached_summary(self):
+        """
+        Test that statuses are worked out for all incubators and summaries are reused.
+        """
+        overview = fleet.FleetOverview(lambda: sqlite3.connect(self.test_db_name), refresh_seconds=60)
+        summary = overview.summary(self.now)
+        self.assertEqual([tile['status'] for tile in summary['incubators']], ['ok', 'alert', 'warning', 'stale'])
+        self.assertEqual(summary['counts'], {'stale': 1, 'alert': 1, 'warning': 1, 'drifting': 0, 'ok': 1})
+        self.assertEqual(summary['incubators'][0]['time'], '2024-01-01 11:59:00')
+        self.assertIs(overview.summary(self.now), summary)
+        own = overview.summary(self.now, username='bob')
+        self.assertEqual([tile['username'] for tile in own['incubators']], ['bob'])
+        self.assertEqual(own['counts'], {'stale': 0, 'alert': 1, 'warning': 0, 'drifting': 0, 'ok': 0})
+        statuses = fleet.health(fleet.query_fleet(self.conn, self.now), self.now, drifting={'ann': (39.0, 50.0)})
+        self.assertEqual(statuses[0], 'drifting')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import forecasting
+from forecasting import Forecaster
+
+
+def readings(username, count, temperature, humidity=50.0, start=1704067200, interval=5):
+    return pd.DataFrame({'username': username, 'timestamp': start + np.arange(count) * interval,
+                         'temperature': temperature, 'humidity': humidity})
+
+
+class TestForecaster(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a forecaster with the default smoothing.
+        """
+        self.forecaster = Forecaster()
+
+    def test_follows_a_trend(self):
+        """
+        Test that a steady rise is extended over the horizon, with a band around it.
+        """
+        rise = 37.0 + 0.01 * np.arange(100)
+        self.forecaster.update(readings('mary', 100, rise + np.tile([0.02, -0.02], 50)))
+        forecast = self.forecaster.forecast('mary', points=3)
+        self.assertEqual(list(forecast['timestamp']), [1704067695, 1704067995, 1704068295])
+        self.assertAlmostEqual(forecast['temperature'][-1], 39.19, delta=0.1)
+        self.assertEqual(forecast['temperature_lower'][0], forecast['temperature_upper'][0])
+        self.assertLess(forecast['temperature_lower'][-1], forecast['temperature'][-1])
+        self.assertGreater(forecast['temperature_upper'][-1], forecast['temperature'][-1])
+        self.assertAlmostEqual(forecast['humidity'][-1], 50.0)
+
+    def test_incremental_updates_match_one_batch(self):
+        """
+        Test that one batch gives the same models as its readings one at a time, for every
+        incubator, and that late readings are skipped.
+        """
+        batch = pd.concat([readings('mary', 30, 37.0 + np.sin(np.arange(30))),
+                           readings('james', 20, 36.5 + np.cos(np.arange(20)), interval=7)])
+        batched = Forecaster()
+        batched.update(batch.sample(frac=1, random_state=0))
+        for i in range(len(batch)):
+            self.forecaster.update(batch.iloc[i:i + 1])
+        self.forecaster.update(readings('mary', 1, 45.0, start=1704067200))
+        for username in ('mary', 'james'):
+            for key, values in batched.forecast(username).items():
+                np.testing.assert_allclose(self.forecaster.forecast(username)[key], values)
+        self.assertIsNone(self.forecaster.forecast('nobody'))
+        self.assertIsNone(Forecaster().forecast('mary'))
+
+    def test_drifting(self):
+        """
+        Test that incubators forecast to leave their limits are found before they do.
+        """
+        self.forecaster.update(pd.concat([readings('mary', 60, 37.5 + 0.01 * np.arange(60)),
+                                          readings('james', 60, 37.5),
+                                          readings('ann', 60, 39.0 + 0.005 * np.arange(60)),
+                                          readings('bob', forecasting.MIN_READINGS - 1, 37.5 + np.arange(9))]))
+        drifting = self.forecaster.drifting()
+        self.assertEqual(list(drifting), ['mary'])
+        self.assertGreater(drifting['mary'][0], 38.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import data_generator
+from alerts import AlertEngine
+from ingest_service import ChangeForwarder, IngestClient, IngestService, parse_address
+from ingestion import IngestionWriter
+from notifier import ChangeNotifier
+
+AUTHKEY = b'test-ingest-authkey'
+
+
+class TestIngestService(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a writer on a temporary database and a service on a Unix socket.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_db_name = os.path.join(self.tmp_dir.name, 'test_users.db')
+        self.address = os.path.join(self.tmp_dir.name, 'ingest.sock')
+        self.writer = IngestionWriter(self.test_db_name, batch_size=100, flush_interval=0.05)
+        self.service = IngestService(self.writer, AlertEngine(), self.address, authkey=AUTHKEY)
+        self.writer.start()
+        self.service.start()
+        self.client = IngestClient(self.address, authkey=AUTHKEY)
+
+    def tearDown(self):
+        """
+        Stop the service and the writer and remove the temporary database.
+        """
+        self.service.close()
+        self.writer.stop(timeout=10)
+        self.tmp_dir.cleanup()
+
+    def count_readings(self):
+        conn = sqlite3.connect(self.test_db_name)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM incubator_readings').fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_parse_address(self):
+        """
+        Test that 'host:port' becomes a tuple and anything else a socket path.
+        """
+        self.assertEqual(parse_address('127.0.0.1:6001'), ('127.0.0.1', 6001))
+        self.assertEqual(parse_address('/run/emm/ingest.sock'), '/run/emm/ingest.sock')
+
+    def test_submitted_readings_are_written(self):
+        """
+        Test that readings sent by a client are committed by the service's writer.
+        """
+        self.assertTrue(self.client.submit(data_generator.generate_data(), 'mary'))
+        rows = [('james', 1704067200 + i, 36.5, 50.0) for i in range(250)]
+        self.assertEqual(self.client.submit_many(rows), 250)
+        self.assertTrue(self.client.flush(timeout=10))
+        self.assertEqual(self.count_readings(), 251)
+
+    def test_alerts_and_new_ids_reach_the_client(self):
+        """
+        Test that clients can long-poll for new readings and read the service's alerts.
+        """
+        notifier = ChangeNotifier()
+        forwarder = ChangeForwarder(IngestClient(self.address, authkey=AUTHKEY), notifier)
+        forwarder.start()
+        self.client.submit_many([('mary', int(time.time()), 40.0, 50.0)])
+        self.assertEqual(notifier.wait_for(0, timeout=10), 1)
+        forwarder.stop()
+        alerts = self.client.recent('mary')
+        self.assertEqual([alert['rule'] for alert in alerts], ['temperature_out_of_range'])
+
+    def test_errors(self):
+        """
+        Test that unknown requests, a wrong key and a missing key are refused.
+        """
+        with self.assertRaises(RuntimeError):
+            self.client.call('drop_tables')
+        with self.assertRaises(ConnectionError):
+            IngestClient(os.path.join(self.tmp_dir.name, 'missing.sock'), authkey=AUTHKEY).flush()
+        with self.assertRaises(ConnectionError):
+            IngestClient(self.address, authkey=b'wrong-ingest-authkey').flush()
+        # There is no default key to fall back on, and short keys are refused.
+        with self.assertRaises(ValueError):
+            IngestClient(self.address, authkey=None)
+        with self.assertRaises(ValueError):
+            IngestService(self.writer, AlertEngine(), os.path.join(self.tmp_dir.name, 'other.sock'), authkey=b'test')
+        self.assertTrue(self.client.flush(timeout=10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import data_generator
+from ingestion import IngestionWriter
+
+
+class TestIngestionWriter(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a temporary database for each test.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_db_name = os.path.join(self.tmp_dir.name, 'test_users.db')
+
+    def tearDown(self):
+        """
+        Remove the temporary database.
+        """
+        self.tmp_dir.cleanup()
+
+    def count_readings(self):
+        conn = sqlite3.connect(self.test_db_name)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM incubator_readings').fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_flush_commits_queued_readings(self):
+        """
+        Test that flush() returns only after every queued reading is committed.
+        """
+        writer = IngestionWriter(self.test_db_name, batch_size=100, flush_interval=60)
+        writer.start()
+        for _ in range(250):
+            self.assertTrue(writer.submit(data_generator.generate_data(), 'test_user'))
+        self.assertTrue(writer.flush(timeout=10))
+        self.assertEqual(self.count_readings(), 250)
+        self.assertEqual(writer.batches_written, 3)
+        writer.stop()
+        self.assertFalse(writer.is_alive())
+
+    def test_stop_writes_pending_batch(self):
+        """
+        Test that stop() commits readings that have not reached a size or time threshold.
+        """
+        writer = IngestionWriter(self.test_db_name, batch_size=1000, flush_interval=60)
+        writer.start()
+        rows = [('test_user', 1704067200, 36.5, 50.0)] * 10
+        self.assertEqual(writer.submit_many(rows), 10)
+        writer.stop(timeout=10)
+        self.assertEqual(self.count_readings(), 10)
+
+    def test_listeners_receive_last_id(self):
+        """
+        Test that listeners are called after each committed batch with the highest id written.
+        """
+        writer = IngestionWriter(self.test_db_name, batch_size=5, flush_interval=60)
+        calls = []
+        writer.add_listener(lambda batch, last_id: calls.append((len(batch), last_id)))
+        writer.start()
+        writer.submit_many([('test_user', 1704067200, 36.5, 50.0)] * 7)
+        writer.stop(timeout=10)
+        self.assertEqual(calls, [(5, 5), (2, 7)])
+
+    def test_failed_batch_does_not_stop_writer(self):
+        """
+        Test that a batch that cannot be written is dropped and counted, and later batches still are.
+        """
+        writer = IngestionWriter(self.test_db_name, batch_size=1, flush_interval=60)
+        writer.start()
+        writer.submit_many([('test_user', 2 ** 70, 36.5, 50.0), ('test_user', 1704067200, 36.5, 50.0)])
+        writer.stop(timeout=10)
+        self.assertEqual((writer.rows_failed, writer.rows_written), (1, 1))
+        self.assertEqual(self.count_readings(), 1)
+
+    def test_locked_database_is_retried(self):
+        """
+        Test that a batch is retried, not dropped, while another connection holds the write lock.
+        """
+        writer = IngestionWriter(self.test_db_name, retries=5, retry_delay=0.05)
+        writer.connect()
+        writer.conn.execute('PRAGMA busy_timeout = 0')
+        other = sqlite3.connect(self.test_db_name, check_same_thread=False)
+        other.execute('BEGIN IMMEDIATE')
+        threading.Timer(0.2, other.rollback).start()
+        self.assertTrue(writer.write_batch([('test_user', 1704067200, 36.5, 50.0)]))
+        self.assertEqual(writer.rows_failed, 0)
+        other.close()
+        writer.conn.close()
+        self.assertEqual(self.count_readings(), 1)
+
+    def test_backpressure_when_queue_full(self):
+        """
+        Test that non-blocking submits are refused once the queue is full.
+        """
+        writer = IngestionWriter(self.test_db_name, max_queue=2)
+        data = data_generator.generate_data()
+        self.assertTrue(writer.submit(data, 'test_user', block=False))
+        self.assertTrue(writer.submit(data, 'test_user', block=False))
+        self.assertFalse(writer.submit(data, 'test_user', block=False))
+        self.assertEqual(writer.submit_many([('test_user', data['timestamp'], 36.5, 50.0)], block=False), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,12 +3,19 @@ import hashlib
 import logging
 import os
 import secrets
+import sqlite3
 import string
+import tempfile
 import threading
 from datetime import datetime
+from unittest import mock
 import pandas as pd
 
 import data_generator
+import main
+import passwords
+import schema
+from main import UserManagement
 
 class TestUserManagement(unittest.TestCase):
     def setUp(self):
@@ -30,8 +37,9 @@ class TestUserManagement(unittest.TestCase):
 
         This method is called after each test method is executed.
         """
-        if os.path.exists(self.test_db_name):
-            os.remove(self.test_db_name)
+        for path in (self.test_db_name, f'{self.test_db_name}-wal', f'{self.test_db_name}-shm'):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_constructor(self):
         """
@@ -85,6 +93,29 @@ class TestUserManagement(unittest.TestCase):
         reset = user_manager.reset_password('non_existent_user')
         self.assertFalse(reset)
 
+    def test_login_after_reset_password(self):
+        """
+        Test that a cached user lookup is dropped when the password is reset.
+        """
+        user_manager = UserManagement(self.test_db_name)
+        user_manager.register(self.test_username, self.test_password)
+        self.assertTrue(user_manager.login(self.test_username, self.test_password))
+        self.assertTrue(user_manager.reset_password(self.test_username))
+        self.assertFalse(user_manager.login(self.test_username, self.test_password))
+
+    def test_login_rehashes_legacy_password(self):
+        """
+        Test that a legacy SHA-256 password still logs in and is then stored with scrypt.
+        """
+        user_manager = UserManagement(self.test_db_name, hasher=passwords.PasswordHasher(n=2 ** 10))
+        with user_manager.pool.connection() as conn:
+            with conn:
+                conn.execute(user_manager.INSERT_USER_SQL, (self.test_username, self.test_hashed_password_with_salt))
+        self.assertFalse(user_manager.login(self.test_username, 'wrong_password'))
+        self.assertTrue(user_manager.login(self.test_username, self.test_password))
+        self.assertTrue(user_manager.cached_password(self.test_username).startswith('scrypt$'))
+        self.assertTrue(user_manager.login(self.test_username, self.test_password))
+
     def test_hash_password(self):
         """
         Test the hash_password method of the UserManagement class.
@@ -94,6 +125,57 @@ class TestUserManagement(unittest.TestCase):
         self.assertEqual(hashed_password, self.test_hashed_password)
 
 
+class TestCreateApp(unittest.TestCase):
+    def test_create_app(self):
+        """
+        Test that importing main sets nothing up, and that create_app() does so once,
+        without reading any readings.
+        """
+        self.assertIsNone(main.dash_app)
+        self.assertIsNone(main.user_manager)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_name = os.path.join(tmp_dir, 'users.db')
+            # Web workers must share a session key.
+            with mock.patch.object(main, 'ingest_address', '127.0.0.1:6001'), mock.patch.dict(os.environ):
+                os.environ.pop('EMM_SECRET_KEY', None)
+                with self.assertRaises(ValueError):
+                    main.create_app(db_name, start_workers=False)
+            app = main.create_app(db_name, start_workers=False)
+            self.assertIs(main.create_app(db_name), app)
+            conn = sqlite3.connect(db_name)
+            self.assertEqual(conn.execute('PRAGMA user_version').fetchone()[0], schema.SCHEMA_VERSION)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'users'").fetchone(), (1,))
+            conn.close()
+            self.assertEqual(main.reading_store.last_id, 0)
+            client = app.test_client()
+            self.assertEqual(client.get('/login').status_code, 200)
+            self.assertEqual(client.get('/dash/').status_code, 200)
+            self.assertEqual(client.get('/fleet').status_code, 302)
+            with client.session_transaction() as flask_session:
+                flask_session['username'] = 'test_user'
+            self.assertIn(b'No incubator has reported', client.get('/fleet').data)
+            # Only admins see every user's incubators.
+            with mock.patch.object(main.fleet_overview, 'summary', return_value={}) as summary:
+                client.get('/api/fleet')
+                with mock.patch.object(main, 'admin_users', {'test_user'}):
+                    client.get('/api/fleet')
+            self.assertEqual([call.kwargs['username'] for call in summary.call_args_list], ['test_user', None])
+            # Imports and exports are scoped to the logged-in user, whatever the file or arguments say.
+            upload = b'username,timestamp,temperature,humidity\nbob,1704067200,36.5,50\nbob,1704067201,nan,50\n'
+            response = client.post('/api/readings/import?format=csv', data=upload)
+            self.assertEqual(response.get_json(), {'imported': 1, 'rejected': 1})
+            conn = sqlite3.connect(db_name)
+            conn.execute(schema.INSERT_READING_SQL, ('bob', 1704067202, 36.5, 50.0))
+            conn.commit()
+            self.assertEqual(conn.execute('SELECT username FROM incubator_readings ORDER BY id').fetchall(),
+                             [('test_user',), ('bob',)])
+            conn.close()
+            exported = client.get('/api/readings/export?username=bob').data.decode().splitlines()
+            self.assertEqual(len(exported), 2)
+            self.assertIn('test_user', exported[1])
+            main.user_manager.close()
+
+
 if __name__ == '__main__':
     unittest.main()
 
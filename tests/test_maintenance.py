@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import archive
+import maintenance
+import rollups
+import schema
+from maintenance import MaintenanceScheduler
+
+
+class TestMaintenance(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a database file with hourly readings of two incubators over ten days.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_db_name = os.path.join(self.tmp_dir.name, 'test_users.db')
+        self.conn = sqlite3.connect(self.test_db_name)
+        schema.ensure_schema(self.conn)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.day = 1704067200  # 2024-01-01 00:00:00 UTC
+        self.now = self.day + 10 * 86400
+        rows = [(username, self.day + hour * 3600, 37.0, 50.0) for hour in range(240) for username in ('ann', 'bob')]
+        with self.conn:
+            self.conn.executemany(schema.INSERT_READING_SQL, rows)
+            rollups.update_rollups(self.conn, rows)
+
+    def tearDown(self):
+        """
+        Close the connection and remove the temporary database.
+        """
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def test_parse_retention(self):
+        """
+        Test that retention applies only to the tables given, or the defaults when asked for,
+        and that unknown tables are refused.
+        """
+        retention = maintenance.parse_retention('incubator_readings=7, incubator_readings_1h=none')
+        self.assertEqual(retention['incubator_readings'], 7.0)
+        self.assertIsNone(retention['incubator_readings_1h'])
+        self.assertIsNone(retention['incubator_readings_1m'])
+        self.assertEqual(maintenance.parse_retention(''), dict.fromkeys(maintenance.RETENTION_DAYS))
+        self.assertEqual(maintenance.parse_retention('default'), maintenance.RETENTION_DAYS)
+        retention = maintenance.parse_retention('default, incubator_readings=7')
+        self.assertEqual(retention['incubator_readings'], 7.0)
+        self.assertEqual(retention['incubator_readings_1m'], maintenance.RETENTION_DAYS['incubator_readings_1m'])
+        self.assertIn('incubator_readings 7 days', maintenance.describe_retention(retention))
+        with self.assertRaises(ValueError):
+            maintenance.parse_retention('users=1')
+
+    def test_scheduler_logs_its_retention(self):
+        """
+        Test that a scheduler logs what it will prune when it starts, and prunes nothing by default.
+        """
+        scheduler = MaintenanceScheduler(self.test_db_name, maintenance.parse_retention('incubator_readings=2'))
+        with self.assertLogs(level='INFO') as logs:
+            scheduler.start()
+            scheduler.stop()
+            scheduler.join(10)
+        self.assertIn('incubator_readings 2 days, incubator_readings_1m forever', logs.output[0])
+        self.assertIn('expired readings are deleted', logs.output[0])
+        report = MaintenanceScheduler(self.test_db_name, pause=0).run_pass(self.now)
+        self.assertEqual(report['deleted'], {})
+
+    def test_pass_deletes_expired_rows_in_batches(self):
+        """
+        Test that a pass deletes each table's rows past its retention and keeps the rest.
+        """
+        retention = {'incubator_readings': 2, 'incubator_readings_1m': 5,
+                     'incubator_readings_1h': None, 'incubator_readings_1d': None}
+        report = MaintenanceScheduler(self.test_db_name, retention, batch_size=7, pause=0).run_pass(self.now)
+        self.assertEqual(report['deleted'], {'incubator_readings': 2 * 192, 'incubator_readings_1m': 2 * 120})
+        oldest = self.conn.execute('SELECT MIN(timestamp) FROM incubator_readings').fetchone()[0]
+        self.assertEqual(oldest, self.now - 2 * 86400)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM incubator_readings_1h').fetchone(), (480,))
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone(),
+                         (1,))
+
+    def test_pass_archives_readings_when_given_an_archive(self):
+        """
+        Test that readings past their retention are moved to the archive instead of deleted.
+        """
+        archive_dir = os.path.join(self.tmp_dir.name, 'archive')
+        report = MaintenanceScheduler(self.test_db_name, {'incubator_readings': 2}, archive_dir,
+                                      batch_size=7, pause=0).run_pass(self.now)
+        self.assertEqual(report['archived'], 2 * 192)
+        self.assertEqual(len(archive.ReadingArchive(archive_dir).days()), 8)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM incubator_readings').fetchone(), (2 * 48,))
+
+    def test_pass_reclaims_freed_pages(self):
+        """
+        Test that a new database uses incremental auto-vacuum and shrinks once rows are deleted.
+        """
+        self.assertEqual(self.conn.execute('PRAGMA auto_vacuum').fetchone()[0], maintenance.AUTO_VACUUM_INCREMENTAL)
+        before = self.conn.execute('PRAGMA page_count').fetchone()[0]
+        report = MaintenanceScheduler(self.test_db_name, {'incubator_readings': 0}, pause=0).run_pass(self.now)
+        self.assertGreater(report['pages_reclaimed'], 0)
+        self.assertEqual(report['free_pages'], 0)
+        self.assertLess(report['page_count'], before)
+
+    def test_small_database_is_converted_to_incremental_vacuum(self):
+        """
+        Test that a small database created without incremental auto-vacuum is converted.
+        """
+        db_name = os.path.join(self.tmp_dir.name, 'old_users.db')
+        conn = sqlite3.connect(db_name)
+        conn.execute('PRAGMA journal_mode = WAL')
+        schema.ensure_schema(conn)
+        self.assertEqual(conn.execute('PRAGMA auto_vacuum').fetchone()[0], 0)
+        self.assertFalse(maintenance.ensure_incremental_vacuum(conn, max_bytes=0))
+        self.assertTrue(maintenance.ensure_incremental_vacuum(conn))
+        self.assertEqual(conn.execute('PRAGMA auto_vacuum').fetchone()[0], maintenance.AUTO_VACUUM_INCREMENTAL)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import urllib.request
+
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up an empty registry, so the application's metrics are not touched.
+        """
+        self.registry = metrics.Registry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        """
+        Test that observations land in the right buckets and render cumulatively.
+        """
+        histogram = metrics.Histogram('test_seconds', 'Test latency.', ('route',), buckets=(0.1, 1.0),
+                                      registry=self.registry)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, ('/login',))
+        self.assertEqual(histogram.count(('/login',)), 4)
+        lines = self.registry.render().splitlines()
+        self.assertEqual(lines[:2], ['# HELP test_seconds Test latency.', '# TYPE test_seconds histogram'])
+        self.assertIn('test_seconds_bucket{route="/login",le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{route="/login",le="1.0"} 3', lines)
+        self.assertIn('test_seconds_bucket{route="/login",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_sum{route="/login"} 3.65', lines)
+        self.assertIn('test_seconds_count{route="/login"} 4', lines)
+
+    def test_timer_and_decorator_record_failures(self):
+        """
+        Test that timed blocks and calls are recorded even when they raise.
+        """
+        histogram = metrics.Histogram('test_seconds', 'Test latency.', ('callback',), registry=self.registry)
+
+        @metrics.timed(histogram, ('fails',))
+        def fails():
+            raise ValueError()
+
+        with histogram.time(('block',)):
+            pass
+        with self.assertRaises(ValueError):
+            fails()
+        self.assertEqual(histogram.count(('block',)), 1)
+        self.assertEqual(histogram.count(('fails',)), 1)
+
+    def test_counter_gauge_and_escaping(self):
+        """
+        Test counters and gauges, and that label values are escaped.
+        """
+        counter = metrics.Counter('test_rows_total', 'Test rows.', ('query',), registry=self.registry)
+        counter.inc(5, ('say "hi"\n',))
+        counter.inc(labels=('say "hi"\n',))
+        metrics.Gauge('test_depth', 'Test depth.', lambda: 7, registry=self.registry)
+        text = self.registry.render()
+        self.assertIn('test_rows_total{query="say \\"hi\\"\\n"} 6', text)
+        self.assertIn('test_depth 7', text)
+
+    def test_serve(self):
+        """
+        Test that the standalone server serves the registry on /metrics.
+        """
+        metrics.Gauge('test_depth', 'Test depth.', lambda: 3, registry=self.registry)
+        server = metrics.serve(0, registry=self.registry)
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+            with urllib.request.urlopen(url, timeout=5) as response:
+                self.assertIn(b'test_depth 3', response.read())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
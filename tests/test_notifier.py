@@ -0,0 +1,47 @@
+import threading
+import time
+import unittest
+
+from notifier import ChangeNotifier, RefreshSubscriber
+
+
+class TestChangeNotifier(unittest.TestCase):
+    def test_wait_for_returns_published_id(self):
+        """
+        Test that a waiter wakes with the id published by another thread.
+        """
+        notifier = ChangeNotifier()
+        threading.Timer(0.05, notifier.publish, args=(7,)).start()
+        self.assertEqual(notifier.wait_for(0, timeout=5), 7)
+
+    def test_wait_for_times_out(self):
+        """
+        Test that waiting without a newer id returns the current id after the timeout.
+        """
+        notifier = ChangeNotifier()
+        notifier.publish(3)
+        notifier.publish(2)
+        self.assertEqual(notifier.wait_for(3, timeout=0.01), 3)
+
+    def test_subscriber_runs_callback_per_change(self):
+        """
+        Test that the subscriber calls back after publishes and coalesces bursts.
+        """
+        notifier = ChangeNotifier()
+        calls = []
+        subscriber = RefreshSubscriber(notifier, lambda: calls.append(notifier.latest_id))
+        subscriber.start()
+        for latest_id in range(1, 6):
+            notifier.publish(latest_id)
+        deadline = time.monotonic() + 5
+        while subscriber.seen_id < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        subscriber.stop()
+        subscriber.join(timeout=5)
+        self.assertEqual(subscriber.seen_id, 5)
+        self.assertTrue(1 <= len(calls) <= 5)
+        self.assertEqual(calls[-1], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import sqlite3
+import unittest
+
+import paging
+import schema
+
+
+class TestPaging(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up an in-memory readings table with 30 readings for two users.
+        """
+        self.conn = sqlite3.connect(':memory:')
+        schema.ensure_schema(self.conn)
+        rows = [('mary' if i % 2 else 'james', 1704067200 + i, 36 + i / 10, 50.0) for i in range(30)]
+        self.conn.executemany(schema.INSERT_READING_SQL, rows)
+        self.cache = paging.PageCache()
+
+    def tearDown(self):
+        """
+        Close the in-memory database.
+        """
+        self.conn.close()
+
+    def test_default_page_is_newest_first(self):
+        """
+        Test that the first unsorted page holds the newest readings.
+        """
+        rows, page_count = paging.fetch_page(self.conn, 0, 10, cache=self.cache)
+        self.assertEqual([row['id'] for row in rows], list(range(30, 20, -1)))
+        self.assertEqual(rows[0]['timestamp'], '2024-01-01 00:00:29')
+        self.assertEqual(page_count, 3)
+
+    def test_sort_and_offset(self):
+        """
+        Test that sorting happens before paging.
+        """
+        rows, _ = paging.fetch_page(self.conn, 1, 5, [{'column_id': 'temperature', 'direction': 'asc'}],
+                                    cache=self.cache)
+        self.assertEqual([row['id'] for row in rows], [6, 7, 8, 9, 10])
+
+    def test_filter(self):
+        """
+        Test that filters are applied in SQL and counted for the page count.
+        """
+        rows, page_count = paging.fetch_page(self.conn, 0, 10, [], '{username} contains "mar" && {temperature} s>= 38',
+                                             cache=self.cache)
+        self.assertTrue(all(row['username'] == 'mary' and row['temperature'] >= 38 for row in rows))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(page_count, 1)
+
+    def test_username_scope(self):
+        """
+        Test that a username limits both the page and the page count to that user.
+        """
+        rows, page_count = paging.fetch_page(self.conn, 0, 10, [], '{temperature} s>= 38', 'james', cache=self.cache)
+        self.assertEqual([row['id'] for row in rows], [29, 27, 25, 23, 21])
+        self.assertEqual(page_count, 1)
+        _, page_count = paging.fetch_page(self.conn, 0, 5, username='mary', cache=self.cache)
+        self.assertEqual(page_count, 3)
+
+    def test_timestamp_filters(self):
+        """
+        Test that timestamps are filtered by their displayed form.
+        """
+        rows, _ = paging.fetch_page(self.conn, 0, 50, [], '{timestamp} >= 2024-01-01 00:00:25', cache=self.cache)
+        self.assertEqual([row['id'] for row in rows], [30, 29, 28, 27, 26])
+        rows, _ = paging.fetch_page(self.conn, 0, 50, [], '{timestamp} contains 00:00:1', cache=self.cache)
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(paging.parse_filter_query('{timestamp} > yesterday'), ('', []))
+
+    def test_unknown_columns_are_ignored(self):
+        """
+        Test that filters and sorts on unknown columns cannot reach the SQL.
+        """
+        self.assertEqual(paging.parse_filter_query('{password} = x'), ('', []))
+        self.assertEqual(paging.order_by_clause([{'column_id': 'password', 'direction': 'asc'}]),
+                         'ORDER BY timestamp DESC, id DESC')
+
+    def test_pages_are_read_by_key(self):
+        """
+        Test that paging on continues after the previous page, through the index.
+        """
+        sort_by = [{'column_id': 'timestamp', 'direction': 'asc'}]
+        self.assertEqual(paging.order_by_clause(sort_by), 'ORDER BY timestamp ASC, id ASC')
+        pages = [[row['id'] for row in paging.fetch_page(self.conn, page, 4, sort_by, username='mary',
+                                                          cache=self.cache)[0]] for page in range(4)]
+        self.assertEqual(pages, [[2, 4, 6, 8], [10, 12, 14, 16], [18, 20, 22, 24], [26, 28, 30]])
+        # A reading arriving late for an earlier time does not shift pages already started.
+        self.conn.execute(schema.INSERT_READING_SQL, ('mary', 1704067200, 36.0, 50.0))
+        rows, _ = paging.fetch_page(self.conn, 2, 4, sort_by, username='mary', cache=self.cache)
+        self.assertEqual([row['id'] for row in rows], [18, 20, 22, 24])
+        plan = self.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM incubator_readings WHERE username = ? AND (timestamp, id) < (?, ?) "
+            f"{paging.order_by_clause([])} LIMIT 4", ('mary', 1704067210, 11)).fetchall()
+        self.assertIn('ix_incubator_readings_username_timestamp', plan[0][3])
+        self.assertNotIn('TEMP B-TREE', str(plan))
+
+    def test_page_count_is_reused(self):
+        """
+        Test that the page count is counted again only once it is old.
+        """
+        _, page_count = paging.fetch_page(self.conn, 0, 5, username='mary', cache=self.cache)
+        self.conn.executemany(schema.INSERT_READING_SQL, [('mary', 1704067300, 36.0, 50.0)] * 10)
+        self.assertEqual(paging.fetch_page(self.conn, 0, 5, username='mary', cache=self.cache)[1], page_count)
+        self.cache.count_ttl = 0
+        self.assertEqual(paging.fetch_page(self.conn, 0, 5, username='mary', cache=self.cache)[1], page_count + 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+import passwords
+from passwords import HasherBusy, PasswordHasher
+
+
+class TestPasswordHasher(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a hasher with a low cost, so the tests run quickly.
+        """
+        self.hasher = PasswordHasher(n=2 ** 10, workers=2, max_pending=2)
+
+    def tearDown(self):
+        self.hasher.close()
+
+    def test_hash_and_verify(self):
+        """
+        Test that a hash verifies its password only, and embeds its cost and a fresh salt.
+        """
+        stored = self.hasher.hash('test_password')
+        self.assertEqual(stored.split('$')[:4], ['scrypt', '1024', '8', '1'])
+        self.assertNotEqual(stored, self.hasher.hash('test_password'))
+        self.assertEqual(self.hasher.verify('test_password', stored), (True, False))
+        self.assertEqual(self.hasher.verify('wrong_password', stored), (False, False))
+        self.assertEqual(self.hasher.verify('test_password', 'scrypt$bad'), (False, False))
+
+    def test_legacy_and_other_cost_need_rehash(self):
+        """
+        Test that legacy SHA-256 hashes and hashes with another cost verify but ask for a rehash.
+        """
+        legacy = f"{passwords.legacy_hash('test_password', 'abcd')}:abcd"
+        self.assertEqual(self.hasher.verify('test_password', legacy), (True, True))
+        self.assertEqual(self.hasher.verify('wrong_password', legacy), (False, False))
+        cheaper = PasswordHasher(n=2 ** 8)
+        self.assertEqual(self.hasher.verify('test_password', cheaper.hash('test_password')), (True, True))
+        cheaper.close()
+
+    def test_full_pool_refuses(self):
+        """
+        Test that a hash is refused at once while the pool is full, and accepted afterwards.
+        """
+        self.assertTrue(self.hasher._slots.acquire(blocking=False))
+        self.assertTrue(self.hasher._slots.acquire(blocking=False))
+        with self.assertRaises(HasherBusy):
+            self.hasher.hash('test_password')
+        self.hasher._slots.release()
+        self.assertTrue(self.hasher.hash('test_password').startswith('scrypt$'))
+
+
+if __name__ == '__main__':
+    unittest.main()
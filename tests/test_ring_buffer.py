@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+
+from ring_buffer import ReadingRing, ReadingWindow, widen
+
+
+def readings(first_id, count, timestamp=1704067200):
+    ids = np.arange(first_id, first_id + count)
+    return ids, timestamp + ids * 5, np.full(count, 36.8), np.full(count, 50.25)
+
+
+class TestReadingRing(unittest.TestCase):
+    def test_keeps_newest_readings_up_to_capacity(self):
+        """
+        Test that appends beyond the capacity drop the oldest readings, in small and large batches.
+        """
+        ring = ReadingRing('mary', capacity=100, headroom=10)
+        for first_id in range(1, 301, 3):
+            ring.append(*readings(first_id, 3))
+        self.assertEqual(len(ring), 100)
+        self.assertEqual(list(ring.window().ids), list(range(201, 301)))
+        ring.append(*readings(301, 250))
+        self.assertEqual(list(ring.window().ids), list(range(451, 551)))
+        self.assertEqual(ring.nbytes, 110 * 24)
+        self.assertAlmostEqual(ring.bytes_per_reading, 26.4)
+
+    def test_windows_are_views_that_never_change(self):
+        """
+        Test that windows share the ring's arrays and keep their values after later appends.
+        """
+        ring = ReadingRing('mary', capacity=8, headroom=4)
+        ring.append(*readings(1, 8))
+        window = ring.window()
+        self.assertTrue(np.shares_memory(window.temperatures, ring.window().temperatures))
+        self.assertTrue(np.shares_memory(window.since(4).ids, window.ids))
+        ring.append(*readings(9, 10))
+        self.assertEqual(list(window.ids), list(range(1, 9)))
+        self.assertEqual(window.temperatures.dtype, np.float32)
+        self.assertEqual(list(ring.window().ids), list(range(11, 19)))
+
+    def test_since_and_between(self):
+        """
+        Test that id and time ranges are found by binary search, or filtered when out of order.
+        """
+        window = ReadingRing('mary', capacity=50)
+        window.append(*readings(1, 20))
+        window = window.window()
+        self.assertEqual(list(window.since(15, limit=3).ids), [16, 17, 18])
+        self.assertEqual(list(window.between(1704067200 + 25, 1704067200 + 35).ids), [5, 6, 7])
+        self.assertTrue(window.is_sorted)
+
+        ring = ReadingRing('mary', capacity=50)
+        ids, timestamps, temperatures, humidities = readings(1, 5)
+        ring.append(ids, timestamps[::-1], temperatures, humidities)
+        self.assertFalse(ring.window().is_sorted)
+        self.assertEqual(list(ring.window().between(timestamps[0], timestamps[1]).ids), [4, 5])
+
+    def test_to_frame_widens_values(self):
+        """
+        Test that frames carry the username and float64 values without float32 noise.
+        """
+        ring = ReadingRing('mary', capacity=10)
+        ring.append(*readings(1, 2))
+        frame = ring.window().to_frame()
+        self.assertEqual(list(frame.columns), ['id', 'username', 'timestamp', 'temperature', 'humidity'])
+        self.assertEqual(frame['temperature'].dtype, np.float64)
+        self.assertEqual(frame.to_dict('records')[0]['temperature'], 36.8)
+        self.assertEqual(list(ReadingWindow('mary', *[np.empty(0)] * 4).to_frame(['id']).columns), ['id'])
+        self.assertEqual(widen(np.array([1.5])).dtype, np.float64)
+
+
+if __name__ == '__main__':
+    unittest.main()
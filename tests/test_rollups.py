@@ -0,0 +1,95 @@
+import sqlite3
+import unittest
+
+import rollups
+import schema
+
+
+class TestRollups(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up an in-memory database with the readings and rollup tables.
+        """
+        self.conn = sqlite3.connect(':memory:')
+        schema.ensure_schema(self.conn)
+        self.day = 1704067200  # 2024-01-01 00:00:00 UTC
+        self.rows = [
+            ('mary', self.day + 10, 36.0, 50.0),
+            ('mary', self.day + 50, 37.0, 52.0),
+            ('mary', self.day + 70, 36.5, 48.0),
+            ('james', self.day + 5 * 3600, 37.5, 55.0),
+        ]
+
+    def tearDown(self):
+        """
+        Close the in-memory database.
+        """
+        self.conn.close()
+
+    def test_update_rollups_aggregates_buckets(self):
+        """
+        Test that readings are folded into min/max/sum/count per user and bucket.
+        """
+        rollups.update_rollups(self.conn, self.rows[:2])
+        rollups.update_rollups(self.conn, self.rows[2:])
+        minute = self.conn.execute(
+            'SELECT count, temperature_min, temperature_max, temperature_sum FROM incubator_readings_1m '
+            'WHERE username = ? ORDER BY bucket', ('mary',)).fetchall()
+        self.assertEqual(minute, [(2, 36.0, 37.0, 73.0), (1, 36.5, 36.5, 36.5)])
+        day = self.conn.execute('SELECT SUM(count) FROM incubator_readings_1d').fetchone()
+        self.assertEqual(day, (4,))
+
+    def test_rebuild_matches_incremental(self):
+        """
+        Test that backfilling from existing readings gives the same rollups as incremental updates.
+        """
+        rollups.update_rollups(self.conn, self.rows)
+        incremental = self.conn.execute('SELECT * FROM incubator_readings_1h ORDER BY username, bucket').fetchall()
+
+        conn = sqlite3.connect(':memory:')
+        conn.execute(schema.READINGS_TABLE_SQL)
+        conn.executemany(schema.INSERT_READING_SQL, self.rows)
+        conn.commit()
+        schema.ensure_schema(conn)
+        rebuilt = conn.execute('SELECT * FROM incubator_readings_1h ORDER BY username, bucket').fetchall()
+        conn.close()
+        self.assertEqual(incremental, rebuilt)
+
+    def test_choose_resolution(self):
+        """
+        Test that the coarsest rollup with enough buckets is chosen.
+        """
+        self.assertEqual(rollups.choose_resolution(0, 3600, 500), None)
+        self.assertEqual(rollups.choose_resolution(0, 86400, 500), ('1m', 60))
+        self.assertEqual(rollups.choose_resolution(0, 30 * 86400, 500), ('1h', 3600))
+        self.assertEqual(rollups.choose_resolution(0, 2 * 365 * 86400, 500), ('1d', 86400))
+
+    def test_choose_resolution_skips_pruned_rollups(self):
+        """
+        Test that a range starting before a rollup's retention falls back to the next coarser rollup.
+        """
+        retention = {'incubator_readings_1m': 90, 'incubator_readings_1h': 730, 'incubator_readings_1d': None}
+        now = 1000 * 86400
+        start = now - 100 * 86400
+        self.assertEqual(rollups.choose_resolution(start, start + 14 * 86400, 500), ('1m', 60))
+        self.assertEqual(rollups.choose_resolution(start, start + 14 * 86400, 500, retention, now), ('1h', 3600))
+        self.assertEqual(rollups.choose_resolution(now - 80 * 86400, now - 66 * 86400, 500, retention, now),
+                         ('1m', 60))
+        start = now - 800 * 86400
+        self.assertEqual(rollups.choose_resolution(start, start + 14 * 86400, 500, retention, now), ('1d', 86400))
+
+    def test_query_range(self):
+        """
+        Test that a range query returns one row per bucket with means across users.
+        """
+        rollups.update_rollups(self.conn, self.rows)
+        frame = rollups.query_range(self.conn, '2024-01-01 00:00:00', '2024-01-02 00:00:00', min_points=1000)
+        self.assertEqual(list(frame['timestamp']), [self.day, self.day + 60, self.day + 5 * 3600])
+        self.assertEqual(list(frame['temperature']), [36.5, 36.5, 37.5])
+        frame = rollups.query_range(self.conn, '2024-01-01', '2024-01-02', username='james', min_points=10)
+        self.assertEqual(list(frame['count']), [1])
+        self.assertIsNone(rollups.query_range(self.conn, '2024-01-01 00:00:00', '2024-01-01 00:05:00'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import sqlite3
+import time
+import unittest
+
+import schema
+
+
+class TestSchema(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up an empty in-memory database.
+        """
+        self.conn = sqlite3.connect(':memory:')
+
+    def tearDown(self):
+        """
+        Close the in-memory database.
+        """
+        self.conn.close()
+
+    def test_fresh_database_is_created_at_current_version(self):
+        """
+        Test that a fresh database gets the readings, rollup and index tables.
+        """
+        schema.ensure_schema(self.conn)
+        self.assertEqual(self.conn.execute('PRAGMA user_version').fetchone()[0], schema.SCHEMA_VERSION)
+        indexes = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn('ix_incubator_readings_username_timestamp', indexes)
+        self.assertIn('ix_incubator_readings_timestamp', indexes)
+        self.assertIn('ix_incubator_readings_1m_bucket', indexes)
+
+    def test_ensure_schema_is_idempotent(self):
+        """
+        Test that running `ensure_schema` again keeps the existing readings.
+        """
+        schema.ensure_schema(self.conn)
+        self.conn.execute(schema.INSERT_READING_SQL, ('mary', 1704067200, 36.5, 50.0))
+        self.conn.commit()
+        schema.ensure_schema(self.conn)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM incubator_readings').fetchone(), (1,))
+
+    def test_text_timestamps_are_migrated(self):
+        """
+        Test that local text timestamps from the old schema become UTC epoch seconds.
+        """
+        self.conn.execute('''CREATE TABLE incubator_readings (
+                                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                 username TEXT,
+                                 timestamp DATETIME,
+                                 temperature FLOAT,
+                                 humidity FLOAT)''')
+        self.conn.executemany(
+            'INSERT INTO incubator_readings (username, timestamp, temperature, humidity) VALUES (?, ?, ?, ?)',
+            [('mary', '2024-01-01 12:00:00', 36.5, 50.0), ('mary', 'not a time', 36.5, 50.0)])
+        self.conn.commit()
+        schema.ensure_schema(self.conn)
+        rows = self.conn.execute('SELECT id, username, timestamp, typeof(timestamp) FROM incubator_readings').fetchall()
+        local = int(time.mktime(time.strptime('2024-01-01 12:00:00', '%Y-%m-%d %H:%M:%S')))
+        self.assertEqual(rows, [(1, 'mary', local, 'integer')])
+        self.assertEqual(self.conn.execute('SELECT SUM(count) FROM incubator_readings_1d').fetchone(), (1,))
+
+    def test_time_window_queries_use_indexes(self):
+        """
+        Test that per-user and time-window queries are served by an index.
+        """
+        schema.ensure_schema(self.conn)
+        plan = self.conn.execute('EXPLAIN QUERY PLAN SELECT * FROM incubator_readings '
+                                 'WHERE username = ? AND timestamp BETWEEN ? AND ?', ('mary', 0, 1)).fetchall()
+        self.assertIn('ix_incubator_readings_username_timestamp', plan[0][-1])
+        plan = self.conn.execute('EXPLAIN QUERY PLAN SELECT * FROM incubator_readings '
+                                 'WHERE timestamp BETWEEN ? AND ?', (0, 1)).fetchall()
+        self.assertIn('ix_incubator_readings_timestamp', plan[0][-1])
+
+    def test_timestamp_conversions(self):
+        """
+        Test that display strings and epoch seconds round-trip as UTC.
+        """
+        self.assertEqual(schema.to_epoch('2024-01-01 00:01:05'), 1704067265)
+        self.assertEqual(schema.to_epoch('2024-01-01T00:01:05.5'), 1704067265)
+        self.assertEqual(schema.to_epoch('2024-01-01T00:01:05'), 1704067265)
+        self.assertEqual(schema.to_epoch('01/01/2024 00:01:05'), 1704067265)
+        with self.assertRaises(ValueError):
+            schema.to_epoch('yesterday at noon!')
+        self.assertEqual(schema.to_epoch(1704067265.9), 1704067265)
+        self.assertEqual(schema.format_timestamp(1704067265), '2024-01-01 00:01:05')
+
+
+if __name__ == '__main__':
+    unittest.main()
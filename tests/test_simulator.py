@@ -0,0 +1,47 @@
+import threading
+import time
+import unittest
+
+from simulator import ReadingSimulator
+
+
+class TestReadingSimulator(unittest.TestCase):
+    def test_generate_batch(self):
+        """
+        Test that batches cycle through the incubators with values in the generate_data ranges.
+        """
+        simulator = ReadingSimulator(incubators=3, seed=1)
+        batch = simulator.generate_batch(7)
+        self.assertEqual([row[0] for row in batch], ['incubator-0001', 'incubator-0002', 'incubator-0003'] * 2 + ['incubator-0001'])
+        self.assertEqual([row[0] for row in simulator.generate_batch(2)], ['incubator-0002', 'incubator-0003'])
+        for _, timestamp, temperature, humidity in batch:
+            self.assertIsInstance(timestamp, int)
+            self.assertTrue(36 <= temperature <= 37.5)
+            self.assertTrue(45 <= humidity <= 55)
+        self.assertEqual(simulator.generated, 9)
+
+    def test_owners(self):
+        """
+        Test that incubators are assigned to the given owners round-robin.
+        """
+        simulator = ReadingSimulator(incubators=4, usernames=['mary', 'james'])
+        self.assertEqual([row[0] for row in simulator.generate_batch(4)], ['mary', 'james', 'mary', 'james'])
+
+    def test_run_paces_and_stops(self):
+        """
+        Test that run() emits readings at about the configured rate and stops on request.
+        """
+        simulator = ReadingSimulator(incubators=10, rate=1000, tick=0.05)
+        received = []
+        stop_event = threading.Event()
+        thread = threading.Thread(target=simulator.run, args=(received.extend, stop_event))
+        thread.start()
+        time.sleep(0.5)
+        stop_event.set()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(300 <= len(received) <= 700)
+
+
+if __name__ == '__main__':
+    unittest.main()
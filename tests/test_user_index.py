@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import user_index
+
+
+class TestUserIndex(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a temporary users table with three users.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_db_name = os.path.join(self.tmp_dir.name, 'test_users.db')
+        self.conn = sqlite3.connect(self.test_db_name)
+        self.conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                          'username TEXT UNIQUE NOT NULL, password TEXT NOT NULL)')
+        self.add_users('mary', 'james', 'sue')
+        self.index = user_index.UserIndex(self.test_db_name)
+
+    def tearDown(self):
+        """
+        Close connections and remove the temporary database.
+        """
+        self.index.close()
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def add_users(self, *usernames):
+        with self.conn:
+            self.conn.executemany('INSERT INTO users (username, password) VALUES (?, ?)',
+                                  [(username, 'x:y') for username in usernames])
+
+    def test_random_user_comes_from_table(self):
+        """
+        Test that every pick is an existing user.
+        """
+        picks = {self.index.random_user() for _ in range(200)}
+        self.assertEqual(picks, {'mary', 'james', 'sue'})
+
+    def test_new_users_appear_after_mark_stale(self):
+        """
+        Test that users added later are picked only after the index is marked stale.
+        """
+        self.index.random_user()
+        self.add_users('micah')
+        self.assertEqual(len(self.index.ids), 3)
+        self.index.mark_stale()
+        self.index.random_user()
+        self.assertEqual(list(self.index.ids), [1, 2, 3, 4])
+
+    def test_new_users_appear_after_refresh_seconds(self):
+        """
+        Test that users registered by another process are picked up without `mark_stale`.
+        """
+        index = user_index.UserIndex(self.test_db_name, refresh_seconds=0)
+        index.random_user()
+        self.add_users('micah')
+        index.random_user()
+        self.assertEqual(list(index.ids), [1, 2, 3, 4])
+        index.close()
+
+    def test_deleted_user_triggers_rebuild(self):
+        """
+        Test that a deleted user is never returned.
+        """
+        self.index.random_user()
+        with self.conn:
+            self.conn.execute("DELETE FROM users WHERE username != 'sue'")
+        self.assertEqual({self.index.random_user() for _ in range(20)}, {'sue'})
+
+    def test_no_users(self):
+        """
+        Test that an empty or missing users table gives None.
+        """
+        with self.conn:
+            self.conn.execute('DELETE FROM users')
+        self.assertIsNone(self.index.random_user())
+        empty = user_index.UserIndex(os.path.join(self.tmp_dir.name, 'empty.db'))
+        self.assertIsNone(empty.random_user())
+        empty.close()
+
+    def test_shared_index_per_database(self):
+        """
+        Test that get_user_index returns one index per database file.
+        """
+        shared = user_index.get_user_index(self.test_db_name)
+        self.assertIs(user_index.get_user_index(self.test_db_name), shared)
+        shared.random_user()
+        user_index.mark_stale(self.test_db_name)
+        self.assertTrue(shared.stale)
+        shared.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from array import array
+
+SELECT_IDS_SQL = 'SELECT id FROM users WHERE id > ? ORDER BY id'
+SELECT_USERNAME_SQL = 'SELECT username FROM users WHERE id = ?'
+
+""" Seconds before an index looks for new users on its own, e.g. users registered by another process """
+REFRESH_SECONDS = 10.0
+
+
+""" UserIndex for constant-time random user selection """
+class UserIndex:
+    def __init__(self, db_name='users.db', refresh_seconds=REFRESH_SECONDS):
+        """
+        Initializes a new, empty index. The ids are loaded on first use.
+
+        The index keeps every user id in a compact array, so a random user is picked by
+        drawing a random position and looking the id up on the primary key, instead of
+        sorting the whole table with ORDER BY RANDOM().
+
+        Registrations in the same process mark the index stale (see `mark_stale`); users
+        registered by other processes, such as web workers while the ingestion service
+        generates data, are picked up by a refresh every `refresh_seconds`. A refresh only
+        reads the ids above the highest one already loaded.
+
+        Parameters:
+            db_name (str): The database holding the 'users' table. Defaults to 'users.db'.
+            refresh_seconds (float): Seconds between refreshes. Defaults to `REFRESH_SECONDS`.
+
+        Returns:
+            None
+        """
+        self.db_name = db_name
+        self.refresh_seconds = refresh_seconds
+        self.ids = array('q')
+        self.max_id = 0
+        self.stale = True
+        self.refreshed_at = None
+        self.conn = None
+        self._lock = threading.Lock()
+
+    def mark_stale(self):
+        """
+        Marks the index as outdated, e.g. after a user registered. The next pick first
+        loads the ids added since the last refresh.
+
+        Returns:
+            None
+        """
+        self.stale = True
+
+    def _refresh(self, full=False):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        if full:
+            self.ids = array('q')
+            self.max_id = 0
+        self.stale = False
+        self.refreshed_at = time.monotonic()
+        try:
+            rows = self.conn.execute(SELECT_IDS_SQL, (self.max_id,)).fetchall()
+        except sqlite3.OperationalError:
+            # No 'users' table yet.
+            return
+        self.ids.extend(row[0] for row in rows)
+        if self.ids:
+            self.max_id = self.ids[-1]
+
+    def refresh(self, full=False):
+        """
+        Loads user ids added since the last refresh, or all ids if `full` is set.
+
+        Parameters:
+            full (bool): Whether to reload the index from scratch. Defaults to False.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._refresh(full)
+
+    def random_user(self):
+        """
+        Picks a random user.
+
+        Returns:
+            str: The username of a random user, or None if there are no users.
+        """
+        with self._lock:
+            if self.stale or time.monotonic() - self.refreshed_at >= self.refresh_seconds:
+                self._refresh()
+            for attempt in range(2):
+                if not self.ids:
+                    return None
+                user_id = self.ids[random.randrange(len(self.ids))]
+                row = self.conn.execute(SELECT_USERNAME_SQL, (user_id,)).fetchone()
+                if row:
+                    return row[0]
+                # The user was deleted behind our back; rebuild the index once.
+                self._refresh(full=True)
+            return None
+
+    def close(self):
+        """
+        Closes the index's connection.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+            self.stale = True
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_user_index(db_name='users.db'):
+    """
+    Returns the process-wide index for a database, creating it on first use.
+
+    Parameters:
+        db_name (str): The database holding the 'users' table. Defaults to 'users.db'.
+
+    Returns:
+        UserIndex: The shared index.
+    """
+    key = os.path.abspath(db_name)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = UserIndex(db_name)
+        return index
+
+
+def mark_stale(db_name='users.db'):
+    """
+    Marks the shared index of a database as outdated, if one exists.
+
+    Parameters:
+        db_name (str): The database whose users changed. Defaults to 'users.db'.
+
+    Returns:
+        None
+    """
+    index = _indexes.get(os.path.abspath(db_name))
+    if index is not None:
+        index.mark_stale()